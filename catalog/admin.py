@@ -1,12 +1,19 @@
+from datetime import datetime, timedelta
+
+from django.conf import settings
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.utils import timezone
 from django.utils.html import format_html
 from .models import (
     User, Categoria, ProdutoNormal, ProdutoCapaPelicula, ImagemProduto,
     MarcaCelular, ModeloCelular, PrecoModelo, Pedido, ItemPedido,
-    CarrinhoAbandonado, JornadaCliente, ConfiguracaoWebhook, ConfiguracaoGeral
+    CarrinhoAbandonado, JornadaCliente, JornadaDiaria, FunilDiario, ConfiguracaoWebhook, EventoWebhook, ConfiguracaoGeral
 )
-from .cache_utils import CacheInvalidationMixin
+from . import analytics_utils
+from .profiling_utils import slow_requests
 
 
 @admin.register(User)
@@ -22,7 +29,7 @@ class CustomUserAdmin(UserAdmin):
 
 
 @admin.register(Categoria)
-class CategoriaAdmin(CacheInvalidationMixin, admin.ModelAdmin):
+class CategoriaAdmin(admin.ModelAdmin):
     list_display = ('nome', 'slug', 'ativo', 'ordem', 'created_at')
     list_filter = ('ativo', 'created_at')
     search_fields = ('nome', 'descricao')
@@ -37,7 +44,7 @@ class ImagemProdutoInline(admin.TabularInline):
 
 
 @admin.register(ProdutoNormal)
-class ProdutoNormalAdmin(CacheInvalidationMixin, admin.ModelAdmin):
+class ProdutoNormalAdmin(admin.ModelAdmin):
     list_display = ('nome', 'categoria', 'preco_atacado', 'preco_super_atacado', 'em_estoque', 'destaque')
     list_filter = ('categoria', 'em_estoque', 'destaque', 'created_at')
     search_fields = ('nome', 'descricao', 'fabricante')
@@ -63,8 +70,8 @@ class PrecoModeloInline(admin.TabularInline):
 
 
 @admin.register(ProdutoCapaPelicula)
-class ProdutoCapaPeliculaAdmin(CacheInvalidationMixin, admin.ModelAdmin):
-    list_display = ('nome', 'categoria', 'get_range_precos_display', 'em_estoque', 'destaque')
+class ProdutoCapaPeliculaAdmin(admin.ModelAdmin):
+    list_display = ('nome', 'categoria', 'get_range_precos_display', 'modelos_ativos', 'em_estoque', 'destaque')
     list_filter = ('categoria', 'em_estoque', 'destaque', 'created_at')
     search_fields = ('nome', 'descricao', 'fabricante')
     prepopulated_fields = {'slug': ('nome',)}
@@ -84,6 +91,7 @@ class ProdutoCapaPeliculaAdmin(CacheInvalidationMixin, admin.ModelAdmin):
             return f"R$ {range_precos['atacado']['min']} - R$ {range_precos['atacado']['max']}"
         return "Sem preços"
     get_range_precos_display.short_description = "Range de preços"
+    get_range_precos_display.admin_order_field = 'preco_atacado_min'
 
 
 @admin.register(MarcaCelular)
@@ -153,16 +161,107 @@ class JornadaClienteAdmin(admin.ModelAdmin):
     search_fields = ('whatsapp', 'sessao_id')
     readonly_fields = ('timestamp',)
     ordering = ('-timestamp',)
+    # Skip the unfiltered COUNT(*) on the largest table
+    show_full_result_count = False
+    
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(JornadaDiaria)
+class JornadaDiariaAdmin(admin.ModelAdmin):
+    list_display = ('data', 'evento', 'sessao_id', 'whatsapp', 'total')
+    list_filter = ('evento', 'data')
+    search_fields = ('whatsapp', 'sessao_id')
+    date_hierarchy = 'data'
+    ordering = ('-data', 'evento')
+    show_full_result_count = False
     
     def has_add_permission(self, request):
         return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(FunilDiario)
+class FunilDiarioAdmin(admin.ModelAdmin):
+    """
+    Funnel dashboard instead of a changelist; reads only the materialized
+    FunilDiario rows (refresh_journey_summaries keeps them current)
+    """
+    PERIODOS = (7, 30, 90)
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+    
+    def changelist_view(self, request, extra_context=None):
+        try:
+            dias = int(request.GET.get('dias', 30))
+        except ValueError:
+            dias = 30
+        dias = max(1, min(dias, 366))
+        fim = timezone.localdate()
+        inicio = fim - timedelta(days=dias - 1)
+        
+        sessao_id = request.GET.get('sessao', '').strip()
+        ultima_atualizacao = FunilDiario.objects.order_by('-updated_at').values_list('updated_at', flat=True).first()
+        
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Funil de conversão',
+            'opts': self.model._meta,
+            'dias': dias,
+            'periodos': self.PERIODOS,
+            'inicio': inicio,
+            'fim': fim,
+            'funil': analytics_utils.funnel(inicio, fim),
+            'etapas': [label for _, label in analytics_utils.funnel_labels()],
+            'coortes': analytics_utils.daily_cohorts(inicio, fim),
+            'sessao_id': sessao_id,
+            'caminho': analytics_utils.session_path(sessao_id) if sessao_id else None,
+            'ultima_atualizacao': ultima_atualizacao,
+            **(extra_context or {}),
+        }
+        return TemplateResponse(request, 'admin/catalog/funildiario/dashboard.html', context)
 
 
 @admin.register(ConfiguracaoWebhook)
 class ConfiguracaoWebhookAdmin(admin.ModelAdmin):
-    list_display = ('evento', 'url', 'ativo', 'timeout', 'retry_ativo', 'updated_at')
-    list_filter = ('ativo', 'retry_ativo', 'evento')
-    fields = ('evento', 'url', 'ativo', 'timeout', 'retry_ativo')
+    list_display = ('evento', 'url', 'ativo', 'timeout', 'retry_ativo', 'envio_em_lote', 'updated_at')
+    list_filter = ('ativo', 'retry_ativo', 'envio_em_lote', 'evento')
+    fields = ('evento', 'url', 'ativo', 'timeout', 'retry_ativo', 'envio_em_lote', 'tamanho_lote')
+
+
+@admin.register(EventoWebhook)
+class EventoWebhookAdmin(admin.ModelAdmin):
+    list_display = ('id', 'evento', 'status', 'tentativas', 'proxima_tentativa', 'created_at', 'enviado_em')
+    list_filter = ('status', 'evento', 'created_at')
+    readonly_fields = (
+        'evento', 'payload', 'status', 'tentativas', 'proxima_tentativa',
+        'bloqueado_ate', 'ultimo_erro', 'chave_agrupamento', 'created_at', 'enviado_em'
+    )
+    actions = ['reenfileirar']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def reenfileirar(self, request, queryset):
+        count = queryset.exclude(status='enviado').update(
+            status='pendente',
+            tentativas=0,
+            proxima_tentativa=timezone.now(),
+            bloqueado_ate=None,
+            chave_agrupamento=None
+        )
+        self.message_user(request, f'{count} eventos reenfileirados.')
+    reenfileirar.short_description = "Reenfileirar eventos selecionados"
 
 
 @admin.register(ConfiguracaoGeral)
@@ -182,3 +281,26 @@ class ConfiguracaoGeralAdmin(admin.ModelAdmin):
 admin.site.site_header = "PMCELL - Administração"
 admin.site.site_title = "PMCELL Admin"
 admin.site.index_title = "Painel de Controle"
+
+
+def slow_requests_view(request):
+    """
+    Slowest requests profiled by the worker serving this page
+    (RequestProfilingMiddleware); POST clears the list
+    """
+    if request.method == 'POST':
+        slow_requests.clear()
+        return redirect('slow_requests')
+    
+    requisicoes = slow_requests.slowest()
+    for requisicao in requisicoes:
+        requisicao['inicio'] = datetime.fromtimestamp(requisicao['started_at'], tz=timezone.get_current_timezone())
+    
+    context = {
+        **admin.site.each_context(request),
+        'title': 'Requisições lentas',
+        'profiling_enabled': settings.PROFILING_ENABLED,
+        'capacidade': slow_requests.size,
+        'requisicoes': requisicoes,
+    }
+    return TemplateResponse(request, 'admin/catalog/slow_requests.html', context)
@@ -0,0 +1,275 @@
+"""
+Journey analytics: funnels, daily cohorts and session paths
+
+Raw JornadaCliente rows are folded incrementally into two materialized
+layers: JornadaDiaria (one row per day, event type and session) and
+FunilDiario (one row per cohort: the sessions first seen on a day and how
+many of them went through each funnel step in order, counting each
+session once however many days it spans). A high-water mark on
+JornadaCliente.id, kept in ConfiguracaoGeral, records how far the raw
+table has been folded, so each refresh only aggregates new events, in
+SQL, and only recomputes the cohorts of the sessions they belong to. The
+admin dashboard reads FunilDiario alone and stays fast however many raw
+events exist.
+"""
+
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Case, Count, Max, Min, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import ConfiguracaoGeral, FunilDiario, JornadaCliente, JornadaDiaria
+
+# Funnel steps in order: (event type, FunilDiario field)
+FUNNEL_STEPS = [
+    ('entrada', 'entradas'),
+    ('liberacao_preco', 'liberacoes'),
+    ('item_adicionado', 'itens_adicionados'),
+    ('checkout_iniciado', 'checkouts'),
+    ('pedido_finalizado', 'pedidos'),
+]
+
+WATERMARK_KEY = 'jornada_resumo_ultimo_id'
+
+# Only fold events older than this, so rows from transactions still in
+# flight (ids handed out but not yet committed) are never skipped
+REFRESH_LAG = timedelta(seconds=60)
+
+REFRESH_CHUNK = 5000
+
+# Sessions per sessao_id__in lookup when finding their cohorts
+COHORT_LOOKUP_BATCH = 500
+
+ROLLUP_FIELDS = ['total', 'whatsapp', 'primeiro_evento', 'ultimo_evento']
+
+
+def get_watermark():
+    configuracao = ConfiguracaoGeral.objects.filter(chave=WATERMARK_KEY).first()
+    return int(configuracao.valor) if configuracao else 0
+
+
+def _set_watermark(last_id):
+    ConfiguracaoGeral.objects.update_or_create(
+        chave=WATERMARK_KEY,
+        defaults={
+            'valor': str(last_id),
+            'descricao': 'Último evento de jornada consolidado em JornadaDiaria (refresh_journey_summaries)',
+        },
+    )
+
+
+def merge_daily_rollups(grupos):
+    """
+    Add aggregated (data, evento, sessao_id) groups into JornadaDiaria;
+    returns the set of days touched
+    """
+    grupos = list(grupos)
+    days = {grupo['data'] for grupo in grupos}
+    if not grupos:
+        return days
+
+    existentes = {
+        (rollup.data, rollup.evento, rollup.sessao_id): rollup
+        for rollup in JornadaDiaria.objects.filter(
+            data__in=days,
+            sessao_id__in={grupo['sessao_id'] for grupo in grupos},
+        )
+    }
+    novos = []
+    atualizados = []
+    for grupo in grupos:
+        rollup = existentes.get((grupo['data'], grupo['evento'], grupo['sessao_id']))
+        if rollup is None:
+            novos.append(JornadaDiaria(**grupo))
+            continue
+        rollup.total += grupo['total']
+        rollup.whatsapp = rollup.whatsapp or grupo['whatsapp']
+        rollup.primeiro_evento = min(rollup.primeiro_evento, grupo['primeiro_evento'])
+        rollup.ultimo_evento = max(rollup.ultimo_evento, grupo['ultimo_evento'])
+        atualizados.append(rollup)
+
+    JornadaDiaria.objects.bulk_create(novos, batch_size=1000)
+    JornadaDiaria.objects.bulk_update(atualizados, ROLLUP_FIELDS, batch_size=1000)
+    return days
+
+
+def session_cohorts(sessao_ids):
+    """
+    Days the given sessions were first seen on (their cohorts)
+    """
+    sessao_ids = list(sessao_ids)
+    days = set()
+    for i in range(0, len(sessao_ids), COHORT_LOOKUP_BATCH):
+        days.update(
+            JornadaDiaria.objects.filter(sessao_id__in=sessao_ids[i:i + COHORT_LOOKUP_BATCH])
+            .values('sessao_id')
+            .annotate(inicio=Min('data'))
+            .values_list('inicio', flat=True)
+        )
+    return days
+
+
+def cohort_funnel(dia):
+    """
+    Sessions first seen on dia and, per funnel step, how many of them
+    reached it after reaching every earlier step (on any day)
+    """
+    sessoes = JornadaDiaria.objects.filter(
+        sessao_id__in=JornadaDiaria.objects.filter(data=dia).values('sessao_id')
+    ).values('sessao_id').annotate(
+        inicio=Min('data'),
+        **{
+            field: Max(Case(When(evento=evento, then=Value(1)), default=Value(0)))
+            for evento, field in FUNNEL_STEPS
+        }
+    ).filter(inicio=dia)
+
+    counts = {'sessoes': 0, **{field: 0 for _, field in FUNNEL_STEPS}}
+    for sessao in sessoes.iterator():
+        counts['sessoes'] += 1
+        for _, field in FUNNEL_STEPS:
+            if not sessao[field]:
+                break
+            counts[field] += 1
+    return counts
+
+
+def refresh_daily_funnel(days):
+    """
+    Recompute the FunilDiario cohorts of the given days; a day left without
+    sessions (they all turned out to start earlier) loses its row
+    """
+    for dia in sorted(days):
+        counts = cohort_funnel(dia)
+        if counts['sessoes']:
+            FunilDiario.objects.update_or_create(data=dia, defaults=counts)
+        else:
+            FunilDiario.objects.filter(data=dia).delete()
+
+
+def refresh_journey_summaries(chunk_size=REFRESH_CHUNK):
+    """
+    Fold raw events past the high-water mark into JornadaDiaria and refresh
+    the funnel of the cohorts their sessions belong to, before and after
+    the fold (an older event moves a session to an earlier cohort). Safe to
+    run repeatedly (cron).
+
+    Returns:
+        (int, set): events folded and days refreshed
+    """
+    watermark = get_watermark()
+    upper = JornadaCliente.objects.filter(
+        id__gt=watermark,
+        timestamp__lt=timezone.now() - REFRESH_LAG,
+    ).aggregate(upper=Max('id'))['upper']
+    if upper is None:
+        return 0, set()
+
+    folded = 0
+    days = set()
+    cohorts = set()
+    while watermark < upper:
+        chunk_end = min(watermark + chunk_size, upper)
+        jornadas = JornadaCliente.objects.filter(id__gt=watermark, id__lte=chunk_end)
+
+        with transaction.atomic():
+            grupos = jornadas.order_by().annotate(data=TruncDate('timestamp')).values(
+                'data', 'evento', 'sessao_id'
+            ).annotate(
+                total=Count('id'),
+                # '' sorts first, so Max picks a real number when the session has one
+                whatsapp=Max('whatsapp'),
+                primeiro_evento=Min('timestamp'),
+                ultimo_evento=Max('timestamp'),
+            )
+            grupos = list(grupos)
+            cohorts |= session_cohorts({grupo['sessao_id'] for grupo in grupos})
+            days |= merge_daily_rollups(grupos)
+            _set_watermark(chunk_end)
+
+        folded += sum(grupo['total'] for grupo in grupos)
+        watermark = chunk_end
+
+    with transaction.atomic():
+        # A session's cohort is its earliest day: one it was already in,
+        # or one of the days just folded
+        refresh_daily_funnel(cohorts | days)
+
+    return folded, days
+
+
+def funnel_labels():
+    labels = dict(JornadaCliente.EVENTO_CHOICES)
+    return [(evento, labels[evento]) for evento, _ in FUNNEL_STEPS]
+
+
+def funnel(start, end):
+    """
+    Funnel of the sessions first seen between two dates (inclusive), each
+    counted once: sessions per step with the conversion from the previous
+    step and from the first one
+    """
+    totals = FunilDiario.objects.filter(data__gte=start, data__lte=end).aggregate(
+        **{field: Sum(field) for _, field in FUNNEL_STEPS}
+    )
+
+    steps = []
+    first = previous = None
+    for (evento, field), (_, label) in zip(FUNNEL_STEPS, funnel_labels()):
+        sessoes = totals[field] or 0
+        if first is None:
+            first = sessoes
+        steps.append({
+            'evento': evento,
+            'label': label,
+            'sessoes': sessoes,
+            'taxa_etapa': _rate(sessoes, previous if previous is not None else sessoes),
+            'taxa_total': _rate(sessoes, first),
+        })
+        previous = sessoes
+    return steps
+
+
+def daily_cohorts(start, end):
+    """
+    One row per cohort (newest first): the sessions first seen that day
+    and the share of them that has reached each funnel step so far
+    """
+    cohorts = []
+    for dia in FunilDiario.objects.filter(data__gte=start, data__lte=end).order_by('-data'):
+        cohorts.append({
+            'data': dia.data,
+            'sessoes': dia.sessoes,
+            'etapas': [
+                {'sessoes': getattr(dia, field), 'taxa': _rate(getattr(dia, field), dia.sessoes)}
+                for _, field in FUNNEL_STEPS
+            ],
+        })
+    return cohorts
+
+
+def session_path(sessao_id):
+    """
+    Ordered events of a session: raw events while they are retained, the
+    daily rollups (first occurrence per event type) once they were pruned
+    """
+    raw = list(
+        JornadaCliente.objects.filter(sessao_id=sessao_id)
+        .order_by('timestamp')
+        .values('evento', 'timestamp', 'dados_evento')
+    )
+    if raw:
+        return raw
+
+    return [
+        {'evento': rollup['evento'], 'timestamp': rollup['primeiro_evento'], 'total': rollup['total']}
+        for rollup in JornadaDiaria.objects.filter(sessao_id=sessao_id)
+        .order_by('primeiro_evento')
+        .values('evento', 'primeiro_evento', 'total')
+    ]
+
+
+def _rate(value, base):
+    return round(100 * value / base, 1) if base else 0.0
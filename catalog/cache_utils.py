@@ -2,94 +2,252 @@
 Cache utilities for catalog app
 """
 
+import hashlib
+import time
+from functools import wraps
+from datetime import datetime, timezone
+
 from django.core.cache import cache
 from django.conf import settings
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
 from .models import Categoria, ProdutoNormal, ProdutoCapaPelicula
+from .metrics_utils import record_cache_lookup
+from .profiling_utils import record_cache
 
 
-def get_cached_categories():
+# Cache tags: every cached value is stored under a key that embeds the
+# current version of its tags, so invalidating a tag is a single INCR and
+# stale entries simply stop being read (and expire on their own)
+CATALOG_TAG = 'catalogo'
+CATEGORY_TAG = 'categorias'
+WEBHOOK_TAG = 'webhooks'
+TAG_VERSION_PREFIX = 'tag_version'
+TAG_MODIFIED_PREFIX = 'tag_modified'
+
+# Tags every rendered catalog page depends on
+PAGE_CACHE_TAGS = (CATALOG_TAG, CATEGORY_TAG)
+
+
+def _tag_version_key(tag):
+    return f'{TAG_VERSION_PREFIX}:{tag}'
+
+
+def _initial_tag_version():
+    # Timestamp-based so a version key that was evicted never restarts at
+    # a value some old entry was stored under
+    return int(time.time() * 1000)
+
+
+def get_tag_versions(*tags):
     """
-    Get categories from cache or database
+    Current version of each tag, fetched in one round trip
     """
-    cache_key = 'categories_active'
-    categories = cache.get(cache_key)
+    keys = {_tag_version_key(tag): tag for tag in tags}
+    found = cache.get_many(list(keys))
     
-    if categories is None:
-        categories = list(Categoria.objects.filter(ativo=True).order_by('nome'))
-        cache.set(cache_key, categories, settings.CACHE_TIMEOUT_CATEGORIES)
+    versions = {}
+    for key, tag in keys.items():
+        version = found.get(key)
+        if version is None:
+            cache.add(key, _initial_tag_version(), None)
+            version = cache.get(key)
+        versions[tag] = version
+    return versions
+
+
+def tagged_key(key, *tags):
+    """
+    Cache key bound to the current version of the given tags
+    """
+    versions = get_tag_versions(*tags)
+    return key + ''.join(f':{tag}.{versions[tag]}' for tag in tags)
+
+
+def invalidate_tags(*tags):
+    """
+    Invalidate every entry stored under any of the given tags
+    """
+    for tag in tags:
+        key = _tag_version_key(tag)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, _initial_tag_version(), None)
     
-    return categories
+    cache.set_many({f'{TAG_MODIFIED_PREFIX}:{tag}': time.time() for tag in tags}, None)
 
 
-def get_cached_product_count():
+def get_tags_last_modified(*tags):
     """
-    Get total product count from cache
+    Time of the latest invalidation of any of the given tags
     """
-    cache_key = 'product_count_total'
-    count = cache.get(cache_key)
+    keys = [f'{TAG_MODIFIED_PREFIX}:{tag}' for tag in tags]
+    found = cache.get_many(keys)
     
-    if count is None:
-        normal_count = ProdutoNormal.objects.filter(em_estoque=True).count()
-        capa_count = ProdutoCapaPelicula.objects.filter(em_estoque=True).count()
-        count = normal_count + capa_count
-        cache.set(cache_key, count, settings.CACHE_TIMEOUT_PRODUCTS)
+    for key in keys:
+        if key not in found:
+            # Unknown since the cache was emptied; start counting from now
+            cache.add(key, time.time(), None)
+            found[key] = cache.get(key)
     
-    return count
+    return datetime.fromtimestamp(int(max(found.values())), tz=timezone.utc)
 
 
-def get_cached_search_suggestions(query):
+def get_or_set_tagged(key, tags, default, timeout):
     """
-    Get search suggestions from cache
+    Tagged version of cache.get_or_set; default is a callable
     """
-    cache_key = f'search_suggestions_{query.lower()}'
-    suggestions = cache.get(cache_key)
+    full_key = tagged_key(key, *tags)
+    value = cache.get(full_key)
+    record_cache(value is not None)
+    record_cache_lookup(value is not None)
     
-    if suggestions is None:
-        from .views import _get_search_suggestions
-        suggestions = _get_search_suggestions(query)
-        cache.set(cache_key, suggestions, settings.CACHE_TIMEOUT_SEARCH)
+    if value is None:
+        value = default()
+        cache.set(full_key, value, timeout)
     
-    return suggestions
+    return value
 
 
-def invalidate_product_cache():
+def _page_state(request):
+    """
+    Tag versions and last modification of the catalog, read once per request
     """
-    Invalidate product-related cache when products are modified
+    state = getattr(request, '_catalog_page_state', None)
+    if state is None:
+        state = (get_tag_versions(*PAGE_CACHE_TAGS), get_tags_last_modified(*PAGE_CACHE_TAGS))
+        request._catalog_page_state = state
+    return state
+
+
+def _page_variant(request, view_kwargs):
     """
-    cache.delete('categories_active')
-    cache.delete('product_count_total')
+    Normalized description of what a catalog request renders: equivalent
+    URLs (?q=Capa%20 vs ?q=capa, explicit defaults) share one entry
+    """
+    params = request.GET
+    search_query = ' '.join(params.get('q', '').split()).lower()
+    category = params.get('category', 'all') or 'all'
+    sort_by = params.get('sort', 'name') or 'name'
+    page = params.get('page', '1') or '1'
     
-    # Clear search suggestion cache
-    from django.core.cache.utils import make_template_fragment_key
-    cache.delete_many([k for k in cache._cache.keys() if k.startswith('search_suggestions_')])
+    parts = [
+        request.resolver_match.url_name if request.resolver_match else request.path,
+        settings.CATALOG_PAGINATION_MODE,
+        f'q={search_query}' if search_query else '',
+        f'category={category}' if category != 'all' else '',
+        f'sort={sort_by}' if sort_by != 'name' else '',
+        f'page={page}' if page != '1' else '',
+        f"cursor={params.get('cursor', '')}",
+    ]
+    parts += [f'{name}={value}' for name, value in sorted(view_kwargs.items())]
+    return '|'.join(parts)
 
 
-def invalidate_category_cache():
+def page_cache_key(request, name, **view_kwargs):
+    """
+    Cache key for a rendered fragment of the current catalog request; store
+    it with get_or_set_tagged(key, PAGE_CACHE_TAGS, ...)
+    """
+    digest = hashlib.md5(_page_variant(request, view_kwargs).encode()).hexdigest()
+    return f'page:{name}:{digest}'
+
+
+def catalog_etag(request, *args, **kwargs):
     """
-    Invalidate category cache when categories are modified
+    ETag of a catalog page: changes with the catalog tag versions and with
+    anything the page renders per visitor (CSRF token, staff links)
     """
-    cache.delete('categories_active')
+    versions, _ = _page_state(request)
+    parts = [_page_variant(request, kwargs)]
+    parts += [f'{tag}.{versions[tag]}' for tag in PAGE_CACHE_TAGS]
+    if request.headers.get('HX-Request'):
+        parts.append('hx')
+    else:
+        user = getattr(request, 'user', None)
+        parts.append(request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''))
+        parts.append('staff' if user is not None and user.is_staff else '')
+    return hashlib.md5('|'.join(parts).encode()).hexdigest()
+
+
+def catalog_last_modified(request, *args, **kwargs):
+    return _page_state(request)[1]
 
 
-class CacheInvalidationMixin:
+def catalog_page(view_func):
     """
-    Mixin to add cache invalidation to model admin
+    Conditional GET for catalog pages: answers 304 while the catalog is
+    unchanged and makes browsers revalidate instead of reusing stale HTML
     """
+    conditional_view = condition(etag_func=catalog_etag, last_modified_func=catalog_last_modified)(view_func)
     
-    def save_model(self, request, obj, form, change):
-        super().save_model(request, obj, form, change)
-        if hasattr(obj, '_meta'):
-            model_name = obj._meta.model_name
-            if model_name in ['categoria']:
-                invalidate_category_cache()
-            elif model_name in ['produtonormal', 'produtocapapelicula']:
-                invalidate_product_cache()
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        response = conditional_view(request, *args, **kwargs)
+        patch_vary_headers(response, ['HX-Request', 'Cookie'])
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
     
-    def delete_model(self, request, obj):
-        super().delete_model(request, obj)
-        if hasattr(obj, '_meta'):
-            model_name = obj._meta.model_name
-            if model_name in ['categoria']:
-                invalidate_category_cache()
-            elif model_name in ['produtonormal', 'produtocapapelicula']:
-                invalidate_product_cache()
\ No newline at end of file
+    return wrapper
+
+
+def catalog_version(request):
+    """
+    Short string identifying the current catalog state, for {% cache %} tags
+    """
+    versions, _ = _page_state(request)
+    return '.'.join(str(versions[tag]) for tag in PAGE_CACHE_TAGS)
+
+
+def get_cached_categories():
+    """
+    Get categories from cache or database
+    """
+    return get_or_set_tagged(
+        'categories_active',
+        [CATEGORY_TAG],
+        lambda: list(Categoria.objects.filter(ativo=True).order_by('nome')),
+        settings.CACHE_TIMEOUT_CATEGORIES,
+    )
+
+
+def get_cached_product_count():
+    """
+    Get total product count from cache
+    """
+    def count():
+        normal_count = ProdutoNormal.objects.filter(em_estoque=True).count()
+        capa_count = ProdutoCapaPelicula.objects.filter(em_estoque=True).count()
+        return normal_count + capa_count
+    
+    return get_or_set_tagged(
+        'product_count_total',
+        [CATALOG_TAG],
+        count,
+        settings.CACHE_TIMEOUT_PRODUCTS,
+    )
+
+
+def get_cached_search_suggestions(query):
+    """
+    Get search suggestions from the in-memory suggestion index
+    """
+    from .suggestion_utils import get_search_suggestions
+    return get_search_suggestions(query)
+
+
+def invalidate_product_cache():
+    """
+    Invalidate product-related cache (counts, suggestions, listings) in
+    every worker when products are modified
+    """
+    invalidate_tags(CATALOG_TAG)
+
+
+def invalidate_category_cache():
+    """
+    Invalidate category cache when categories are modified; category names
+    also show up in listings and suggestions
+    """
+    invalidate_tags(CATEGORY_TAG, CATALOG_TAG)
@@ -0,0 +1,181 @@
+"""
+Cart pricing utilities
+
+Server-side pricing engine shared by the cart API, checkout and order
+items. A whole cart is resolved with a fixed number of queries, whatever
+its size: normal products with in_bulk, capa prices with one lookup over
+the requested (produto, modelo) pairs (product, category and model joined
+in), and principal images with one prefetch per product type. Prices are
+Decimal throughout; floats only appear when serializing for the frontend.
+"""
+
+from decimal import Decimal
+
+from django.db.models import Prefetch, prefetch_related_objects
+
+from .models import ProdutoNormal, PrecoModelo, ImagemProduto, preco_por_quantidade
+
+
+PRINCIPAL_IMAGES = Prefetch(
+    'imagens',
+    queryset=ImagemProduto.objects.filter(principal=True),
+    to_attr='imagens_principais',
+)
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class PricedLine:
+    """
+    One priced cart line. ``preco_modelo`` is set for capas/películas and
+    shares its ``produto`` instance with ``produto``.
+    """
+
+    def __init__(self, item, produto, quantidade, preco_atacado, preco_super_atacado, preco_modelo=None):
+        self.item = item
+        self.produto = produto
+        self.preco_modelo = preco_modelo
+        self.quantidade = quantidade
+        self.preco_atacado = preco_atacado
+        self.preco_super_atacado = preco_super_atacado
+        self.preco_unitario = preco_por_quantidade(
+            preco_atacado, preco_super_atacado, quantidade, produto.quantidade_super_atacado
+        )
+        self.preco_total = self.preco_unitario * quantidade
+
+    @property
+    def tipo(self):
+        return 'modelo' if self.preco_modelo is not None else 'normal'
+
+    @property
+    def is_super_atacado(self):
+        return self.quantidade >= self.produto.quantidade_super_atacado
+
+    @property
+    def modelo(self):
+        return self.preco_modelo.modelo if self.preco_modelo is not None else None
+
+
+class PricedCart:
+    """
+    Priced lines in cart order plus the Decimal order total
+    """
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.total = sum((line.preco_total for line in lines), Decimal('0.00'))
+
+    def __len__(self):
+        return len(self.lines)
+
+
+def price_cart(cart_items, with_images=True):
+    """
+    Price the posted cart lines ({productId, productType, modelId,
+    quantity}). Lines with an invalid quantity or whose product, model or
+    model price no longer exists are dropped; client-sent prices are never
+    read. with_images=False skips the principal image prefetch.
+    """
+    normal_ids = set()
+    pairs = set()
+
+    for item in cart_items:
+        product_id = _to_int(item.get('productId'))
+        if product_id is None:
+            continue
+        if item.get('productType') == 'normal':
+            normal_ids.add(product_id)
+        elif item.get('productType') == 'capa_pelicula' and item.get('modelId'):
+            model_id = _to_int(item.get('modelId'))
+            if model_id is not None:
+                pairs.add((product_id, model_id))
+
+    normais = {}
+    if normal_ids:
+        normais = ProdutoNormal.objects.filter(em_estoque=True).select_related('categoria')
+        if with_images:
+            normais = normais.prefetch_related(PRINCIPAL_IMAGES)
+        normais = normais.in_bulk(normal_ids)
+
+    precos = {}
+    if pairs:
+        # Superset of the requested pairs; exact pairs are picked below
+        rows = PrecoModelo.objects.filter(
+            produto_id__in={produto_id for produto_id, _ in pairs},
+            modelo_id__in={modelo_id for _, modelo_id in pairs},
+            produto__em_estoque=True,
+        ).select_related('produto__categoria', 'modelo__marca')
+
+        capas = {}
+        for preco in rows:
+            if (preco.produto_id, preco.modelo_id) in pairs:
+                # One instance per product, so images are fetched once
+                preco.produto = capas.setdefault(preco.produto_id, preco.produto)
+                precos[(preco.produto_id, preco.modelo_id)] = preco
+        if with_images:
+            prefetch_related_objects(list(capas.values()), PRINCIPAL_IMAGES)
+
+    lines = []
+
+    for item in cart_items:
+        product_type = item.get('productType')
+        product_id = _to_int(item.get('productId'))
+        quantidade = _to_int(item.get('quantity', 1))
+        if quantidade is None or quantidade < 1:
+            continue
+
+        if product_type == 'normal':
+            produto = normais.get(product_id)
+            if produto is None:
+                continue
+            lines.append(PricedLine(
+                item, produto, quantidade, produto.preco_atacado, produto.preco_super_atacado
+            ))
+
+        elif product_type == 'capa_pelicula' and item.get('modelId'):
+            preco_modelo = precos.get((product_id, _to_int(item.get('modelId'))))
+            if preco_modelo is None:
+                continue
+            lines.append(PricedLine(
+                item, preco_modelo.produto, quantidade,
+                preco_modelo.preco_atacado, preco_modelo.preco_super_atacado,
+                preco_modelo=preco_modelo,
+            ))
+
+    return PricedCart(lines)
+
+
+def _principal_image_url(produto):
+    images = produto.imagens_principais
+    return images[0].imagem.url if images else None
+
+
+def serialize_line(line):
+    """
+    Cart API representation of a priced line
+    """
+    modelo = line.modelo
+
+    return {
+        'key': line.item.get('key'),
+        'productId': line.item.get('productId'),
+        'productType': line.item.get('productType'),
+        'name': line.produto.nome,
+        'category': line.produto.categoria.nome,
+        'image': _principal_image_url(line.produto),
+        'quantity': line.quantidade,
+        'unitPrice': float(line.preco_unitario),
+        'priceAtacado': float(line.preco_atacado),
+        'priceSuperAtacado': float(line.preco_super_atacado),
+        'isSuperAtacado': line.is_super_atacado,
+        'minQuantitySuper': line.produto.quantidade_super_atacado,
+        'lineTotal': float(line.preco_total),
+        'modelId': line.item.get('modelId') if modelo is not None else None,
+        'modelName': f"{modelo.marca.nome} {modelo.nome}" if modelo is not None else None,
+    }
+
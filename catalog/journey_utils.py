@@ -0,0 +1,223 @@
+"""
+Journey event ingestion
+
+/api/track-journey/ is the highest-volume write of the site. Requests
+carry one event or an array of them; events are validated, appended to a
+per-process buffer and written by a background thread with bulk_create
+whenever JOURNEY_BUFFER_SIZE events are waiting or JOURNEY_FLUSH_INTERVAL
+seconds have passed. Events still buffered when a process dies are lost,
+which is acceptable for analytics; set JOURNEY_BUFFER_SIZE = 0 to write
+every request through immediately.
+
+Raw events are kept for JOURNEY_RETENTION_DAYS; once folded into the
+JornadaDiaria rollups (analytics_utils), older days are deleted, and
+optionally archived as gzipped JSON lines, by the prune_journey command,
+which keeps the hot table small.
+"""
+
+import atexit
+import gzip
+import json
+import logging
+import os
+import threading
+import uuid
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections, transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from .analytics_utils import get_watermark
+from .metrics_utils import count_journey_events
+from .models import JornadaCliente
+
+logger = logging.getLogger(__name__)
+
+MAX_EVENTS_PER_REQUEST = 100
+
+EVENTOS_VALIDOS = {evento for evento, _ in JornadaCliente.EVENTO_CHOICES}
+
+# Cumulative session state the client attaches to every event; only the
+# exit event keeps it, as the session summary
+SESSION_CONTEXT_KEYS = ('categories_visited', 'searches_performed', 'products_viewed')
+SESSION_SUMMARY_EVENTO = 'saida'
+
+
+def compact_dados(evento, dados):
+    if not isinstance(dados, dict):
+        return {}
+    if evento == SESSION_SUMMARY_EVENTO:
+        return dados
+    return {key: value for key, value in dados.items() if key not in SESSION_CONTEXT_KEYS}
+
+
+def parse_journey_events(data, whatsapp_cookie=''):
+    """
+    JornadaCliente instances (unsaved) for a track-journey request body:
+    a single event ({evento, dados, sessao_id, whatsapp}), a batch
+    ({sessao_id, whatsapp, eventos: [{evento, dados}, ...]}) or a bare list
+    of single events. Unknown event types are skipped.
+
+    Returns:
+        (list, str): events and the session id they were recorded under
+    """
+    if isinstance(data, list):
+        data = {'eventos': data}
+
+    sessao_id = str(data.get('sessao_id') or '')[:100] or str(uuid.uuid4())
+    whatsapp = str(data.get('whatsapp') or whatsapp_cookie or '')[:20]
+    eventos = data.get('eventos')
+    if eventos is None:
+        eventos = [data]
+
+    jornadas = []
+    for item in eventos[:MAX_EVENTS_PER_REQUEST]:
+        if not isinstance(item, dict) or item.get('evento') not in EVENTOS_VALIDOS:
+            continue
+        jornadas.append(JornadaCliente(
+            whatsapp=str(item.get('whatsapp') or whatsapp)[:20],
+            sessao_id=str(item.get('sessao_id') or sessao_id)[:100],
+            evento=item['evento'],
+            dados_evento=compact_dados(item['evento'], item.get('dados')),
+        ))
+
+    return jornadas, sessao_id
+
+
+class JourneyBuffer:
+    """
+    Thread-safe in-process buffer of JornadaCliente rows with a background
+    flusher; requests only append
+    """
+
+    def __init__(self, size, interval):
+        self.size = size
+        self.interval = interval
+        self.pending = []
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def add(self, jornadas):
+        if self.size <= 0:
+            JornadaCliente.objects.bulk_create(jornadas)
+            return
+
+        with self.lock:
+            self.pending.extend(jornadas)
+            full = len(self.pending) >= self.size
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='journey-flusher', daemon=True)
+                self.thread.start()
+
+        if full:
+            self.wakeup.set()
+
+    def flush(self):
+        """
+        Write everything buffered so far; returns the number of rows
+        """
+        with self.lock:
+            jornadas, self.pending = self.pending, []
+
+        if jornadas:
+            try:
+                JornadaCliente.objects.bulk_create(jornadas, batch_size=500)
+            except Exception:
+                logger.exception(f"Dropping {len(jornadas)} journey events after a failed flush")
+                return 0
+        return len(jornadas)
+
+    def run(self):
+        while True:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            close_old_connections()
+            self.flush()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_journey_buffer():
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = JourneyBuffer(settings.JOURNEY_BUFFER_SIZE, settings.JOURNEY_FLUSH_INTERVAL)
+                atexit.register(_buffer.flush)
+    return _buffer
+
+
+def record_journey_events(jornadas):
+    """
+    Queue events for the next bulk insert
+    """
+    if jornadas:
+        get_journey_buffer().add(jornadas)
+        count_journey_events(jornadas)
+
+
+def _day_bounds(dia):
+    start = timezone.make_aware(datetime.combine(dia, time.min))
+    return start, start + timedelta(days=1)
+
+
+def _archive_day(jornadas, archive_dir, dia):
+    """
+    Append a day of raw events to archive_dir/jornada-YYYY-MM.jsonl.gz
+    (gzip members can be appended; readers see one stream)
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f'jornada-{dia:%Y-%m}.jsonl.gz')
+    fields = ('id', 'whatsapp', 'sessao_id', 'evento', 'dados_evento', 'timestamp')
+
+    with gzip.open(path, 'at', encoding='utf-8') as archive:
+        for row in jornadas.values(*fields).iterator(chunk_size=2000):
+            archive.write(json.dumps(row, cls=DjangoJSONEncoder) + '\n')
+    return path
+
+
+def prune_journey_day(dia, archive_dir=None):
+    """
+    Delete (optionally archiving first) one day of raw events already
+    folded into JornadaDiaria. Returns the number of raw events removed.
+    """
+    start, end = _day_bounds(dia)
+    jornadas = JornadaCliente.objects.filter(
+        timestamp__gte=start,
+        timestamp__lt=end,
+        id__lte=get_watermark(),
+    )
+
+    with transaction.atomic():
+        if archive_dir:
+            _archive_day(jornadas, archive_dir, dia)
+        removed, _ = jornadas.delete()
+
+    return removed
+
+
+def days_to_prune(retention_days):
+    """
+    Days (oldest first) that have raw events older than the retention
+    period; the cutoff is a local midnight so no day is split
+    """
+    today = timezone.localdate()
+    cutoff, _ = _day_bounds(today - timedelta(days=retention_days))
+
+    oldest = JornadaCliente.objects.filter(timestamp__lt=cutoff).aggregate(oldest=Min('timestamp'))['oldest']
+    if oldest is None:
+        return []
+
+    dia = timezone.localtime(oldest).date()
+    last = today - timedelta(days=retention_days + 1)
+    days = []
+    while dia <= last:
+        days.append(dia)
+        dia += timedelta(days=1)
+    return days
@@ -0,0 +1,218 @@
+"""
+Database-side product listing for the catalog
+"""
+
+import hashlib
+from decimal import Decimal
+
+from django.conf import settings
+from django.core import signing
+from django.core.paginator import Paginator
+from django.db.models import (
+    CharField, DecimalField, F, Q, Value
+)
+
+from .cache_utils import PAGE_CACHE_TAGS, get_or_set_tagged
+from .models import ProdutoNormal, ProdutoCapaPelicula
+from .presentation_utils import load_product_cards
+from .search_utils import TIPO_NORMAL, TIPO_CAPA, get_search_backend
+
+
+PAGE_SIZE = 20
+
+# Sort option -> (sort key, descending)
+SORT_OPTIONS = {
+    'name': ('nome', False),
+    'name_desc': ('nome', True),
+    'price_asc': ('preco', False),
+    'price_desc': ('preco', True),
+    'category': ('categoria', False),
+    'relevance': ('relevancia', True),
+}
+DEFAULT_SORT = 'name'
+
+# Capas without any active PrecoModelo go last when sorting by price
+PRICE_FALLBACK = {False: Decimal('9999'), True: Decimal('0')}
+
+CURSOR_SALT = 'catalog.listing.cursor'
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def encode_cursor(sort_by, row):
+    """
+    Opaque, signed cursor for the (sort key, tipo, id) position of a row
+    """
+    return signing.dumps([sort_by, str(row['sort_key']), row['tipo'], row['id']], salt=CURSOR_SALT)
+
+
+def decode_cursor(cursor, sort_by):
+    """
+    Return the (sort key, tipo, id) position stored in a cursor
+    """
+    try:
+        cursor_sort, sort_value, tipo, produto_id = signing.loads(cursor, salt=CURSOR_SALT)
+    except (signing.BadSignature, TypeError, ValueError):
+        raise InvalidCursor(cursor)
+
+    if cursor_sort != sort_by:
+        raise InvalidCursor(cursor)
+
+    sort_key = SORT_OPTIONS[sort_by][0]
+    if sort_key == 'preco':
+        sort_value = Decimal(sort_value)
+    elif sort_key == 'relevancia':
+        sort_value = float(sort_value)
+    return sort_value, tipo, produto_id
+
+
+class ProductListing:
+    """
+    Unified listing over ProdutoNormal and ProdutoCapaPelicula.
+
+    Filtering, sorting and pagination run in the database through a
+    UNION ALL of (id, tipo, sort_key) rows; only the products of the
+    requested page are loaded as model instances.
+    """
+
+    def __init__(self, search_query='', category_filter='all', sort_by=DEFAULT_SORT):
+        self.search_query = search_query
+        self.category_filter = category_filter
+        self.sort_by = sort_by if sort_by in SORT_OPTIONS else DEFAULT_SORT
+        if self.sort_by == 'relevance' and not search_query:
+            # Relevance only exists for search results
+            self.sort_by = DEFAULT_SORT
+        self.sort_key, self.descending = SORT_OPTIONS[self.sort_by]
+
+    @property
+    def ordering(self):
+        prefix = '-' if self.descending else ''
+        return [f'{prefix}sort_key', f'{prefix}tipo', f'{prefix}id']
+
+    def normal_queryset(self):
+        queryset = ProdutoNormal.objects.filter(em_estoque=True)
+
+        if self.search_query:
+            queryset = get_search_backend().filter(queryset, self.search_query, TIPO_NORMAL)
+
+        if self.category_filter != 'all':
+            queryset = queryset.filter(categoria__slug=self.category_filter)
+
+        return queryset
+
+    def capa_queryset(self):
+        queryset = ProdutoCapaPelicula.objects.filter(em_estoque=True)
+
+        if self.search_query:
+            # Brands and models are part of the precomputed search document
+            queryset = get_search_backend().filter(queryset, self.search_query, TIPO_CAPA)
+
+        if self.category_filter != 'all':
+            queryset = queryset.filter(categoria__slug=self.category_filter)
+
+        return queryset
+
+    def _sort_expression(self, tipo):
+        if self.sort_key == 'nome':
+            return F('nome')
+        if self.sort_key == 'categoria':
+            return F('categoria__nome')
+        if self.sort_key == 'relevancia':
+            return F('search_rank')
+        if tipo == 'normal':
+            return F('preco_atacado')
+        return F('preco_atacado_min')
+
+    def _rows(self, queryset, tipo, position=None, sort_expression=None):
+        rows = queryset.order_by().annotate(
+            tipo=Value(tipo, output_field=CharField()),
+            sort_key=sort_expression if sort_expression is not None else self._sort_expression(tipo),
+        )
+
+        if position is not None:
+            # Keyset condition on (sort_key, tipo, id); tipo is constant
+            # within a branch, so it is resolved here instead of in SQL
+            sort_value, cursor_tipo, cursor_id = position
+            lookup = 'lt' if self.descending else 'gt'
+            if tipo == cursor_tipo:
+                rows = rows.filter(
+                    Q(**{f'sort_key__{lookup}': sort_value}) |
+                    Q(sort_key=sort_value, **{f'id__{lookup}': cursor_id})
+                )
+            elif (tipo < cursor_tipo) == self.descending:
+                rows = rows.filter(**{f'sort_key__{lookup}e': sort_value})
+            else:
+                rows = rows.filter(**{f'sort_key__{lookup}': sort_value})
+
+        return rows.values('id', 'tipo', 'sort_key')
+
+    def _capa_rows(self, position):
+        capas = self.capa_queryset()
+        if self.sort_key != 'preco':
+            return [self._rows(capas, 'capa_pelicula', position)]
+
+        # Capas without prices sort as PRICE_FALLBACK; kept in a branch of
+        # their own so the priced ones are read in index order
+        fallback = Value(PRICE_FALLBACK[self.descending], output_field=DecimalField(max_digits=10, decimal_places=2))
+        return [
+            self._rows(capas.filter(preco_atacado_min__isnull=False), 'capa_pelicula', position),
+            self._rows(capas.filter(preco_atacado_min__isnull=True), 'capa_pelicula', position, fallback),
+        ]
+
+    def queryset(self, position=None):
+        """
+        Ordered UNION ALL of listing rows for both product tables
+        """
+        normais = self._rows(self.normal_queryset(), 'normal', position)
+        return normais.union(*self._capa_rows(position), all=True).order_by(*self.ordering)
+
+    def count(self):
+        """
+        Number of matching products, cached per catalog version: the COUNT
+        over the UNION ALL reads every matching row, and it does not depend
+        on the sort order or the page
+        """
+        filters = f'{self.search_query}\0{self.category_filter}'.encode()
+        return get_or_set_tagged(
+            f'listing_count:{hashlib.md5(filters).hexdigest()}',
+            PAGE_CACHE_TAGS,
+            lambda: self.queryset().count(),
+            settings.CACHE_TIMEOUT_PRODUCTS,
+        )
+
+    def paginator(self, per_page=PAGE_SIZE):
+        return ProductListingPaginator(self.queryset(), per_page, count=self.count())
+
+    def after(self, cursor=None, limit=PAGE_SIZE):
+        """
+        Keyset page following the given cursor (or the first page).
+
+        Returns the hydrated products and the cursor of the next page,
+        which is None once the listing is exhausted.
+        """
+        position = decode_cursor(cursor, self.sort_by) if cursor else None
+        rows = list(self.queryset(position)[:limit + 1])
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(self.sort_by, rows[-1])
+
+        return load_product_cards(rows), next_cursor
+
+
+class ProductListingPaginator(Paginator):
+    """
+    Paginator whose pages hold product cards instead of raw rows
+    """
+
+    def __init__(self, object_list, per_page, count=None):
+        super().__init__(object_list, per_page)
+        if count is not None:
+            # Replaces the cached_property, so no COUNT query is run
+            self.count = count
+
+    def _get_page(self, object_list, number, paginator):
+        return super()._get_page(load_product_cards(object_list), number, paginator)
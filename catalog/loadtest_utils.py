@@ -0,0 +1,294 @@
+"""
+Synthetic storefront traffic for load tests
+
+Each virtual buyer replays what static/js/main.js and the templates do in
+a browser session: open the home page, browse a category through HTMX
+and its next page (infinite scroll or page 2), type a search (one
+suggestions request per keystroke, then the debounced search), open
+product pages and the model list of a capa, send journey events in
+batches of up to 10, hydrate the cart and sometimes check out. Product, category, brand and model ids are
+discovered from the rendered pages, so any catalog works.
+
+Every buyer gets its own X-Forwarded-For address, so rate limits apply
+per buyer as in production (with TRUSTED_PROXY_DEPTH=1). 429 responses
+are counted apart from errors.
+"""
+
+import html
+import random
+import re
+import threading
+import time
+import uuid
+
+import requests
+
+from .perf_utils import percentile
+
+JOURNEY_BATCH_SIZE = 10
+
+PRODUCT_RE = re.compile(r"trackProductView\((\d+), '(normal|capa_pelicula)', '([^']*)'\)")
+CATEGORY_RE = re.compile(r"filterByCategory\('([\w-]+)'")
+LOAD_MORE_RE = re.compile(r'hx-get="([^"]*/products/more/\?[^"]*)"')
+NEXT_PAGE_RE = re.compile(r'href="\?([^"]*page=2)"')
+MARCA_RE = re.compile(r'/product/\d+/marca/(\d+)/modelos/')
+MODELO_RE = re.compile(r'selectedModelo = (\d+);')
+WORD_RE = re.compile(r'[^\W\d_]{4,}')
+
+
+class EndpointStats:
+    __slots__ = ('latencies', 'errors', 'limited')
+
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.limited = 0
+
+
+class Buyer:
+    """
+    One virtual buyer with its own HTTP session (cookies, CSRF token,
+    keep-alive connection), recording into its own stats
+    """
+
+    def __init__(self, base_url, client_ip, rng, think_time=0.0, checkout_ratio=0.1):
+        self.base_url = base_url.rstrip('/')
+        self.rng = rng
+        self.think_time = think_time
+        self.checkout_ratio = checkout_ratio
+        self.stats = {}
+        self.http = requests.Session()
+        self.http.headers['X-Forwarded-For'] = client_ip
+        self.sessao_id = None
+        self.journey_queue = []
+        self.cart = []
+
+    def request(self, label, method, path, **kwargs):
+        stats = self.stats.setdefault(label, EndpointStats())
+        start = time.perf_counter()
+        try:
+            response = self.http.request(method, self.base_url + path, timeout=30, **kwargs)
+        except requests.RequestException:
+            stats.latencies.append((time.perf_counter() - start) * 1000)
+            stats.errors += 1
+            return None
+        stats.latencies.append((time.perf_counter() - start) * 1000)
+
+        if response.status_code == 429:
+            stats.limited += 1
+            return None
+        if response.status_code >= 400:
+            stats.errors += 1
+            return None
+        return response
+
+    def post_json(self, label, path, data):
+        return self.request(label, 'POST', path, json=data, headers={
+            'X-CSRFToken': self.http.cookies.get('csrftoken', ''),
+        })
+
+    def pause(self):
+        if self.think_time:
+            time.sleep(self.rng.uniform(0.5, 1.5) * self.think_time)
+
+    def track(self, evento, **dados):
+        self.journey_queue.append({'evento': evento, 'dados': dados})
+        if len(self.journey_queue) >= JOURNEY_BATCH_SIZE:
+            self.flush_journey()
+
+    def flush_journey(self):
+        if self.journey_queue:
+            eventos, self.journey_queue = self.journey_queue, []
+            self.post_json('track_journey', '/api/track-journey/', {
+                'sessao_id': self.sessao_id, 'eventos': eventos,
+            })
+
+    def run_session(self):
+        """
+        One visit, from the home page to leaving the site
+        """
+        self.sessao_id = str(uuid.uuid4())
+        self.track('entrada', page='home')
+
+        response = self.request('home', 'GET', '/')
+        if response is None:
+            return
+        produtos = PRODUCT_RE.findall(response.text)
+        categorias = sorted(set(CATEGORY_RE.findall(response.text)) - {'all'})
+        self.pause()
+
+        if categorias:
+            categoria = self.rng.choice(categorias)
+            self.track('categoria_visitada', category_slug=categoria)
+            # The category buttons submit the search form
+            response = self.request('category', 'GET', '/search/', params={'q': '', 'category': categoria}, headers={
+                'HX-Request': 'true',
+            })
+            if response is not None:
+                produtos += PRODUCT_RE.findall(response.text)
+                response = self.next_page(response.text)
+                if response is not None:
+                    produtos += PRODUCT_RE.findall(response.text)
+            self.pause()
+
+        words = [word for _, _, nome in produtos for word in WORD_RE.findall(nome)]
+        if words:
+            self.search(self.rng.choice(words).lower())
+
+        for product_id, tipo, _ in self.rng.sample(produtos, min(len(produtos), self.rng.randint(1, 3))):
+            self.view_product(int(product_id), tipo)
+
+        if self.cart:
+            self.request('get_cart_items', 'POST', '/api/get-cart-items/', json={'cart': self.cart})
+            if self.rng.random() < self.checkout_ratio:
+                self.checkout()
+
+        self.track('saida')
+        self.flush_journey()
+        self.cart = []
+
+    def next_page(self, grid_html):
+        """
+        Scroll to the next batch (CATALOG_PAGINATION_MODE=cursor) or follow
+        the link to page 2 (page mode)
+        """
+        load_more = LOAD_MORE_RE.search(grid_html)
+        next_page = NEXT_PAGE_RE.search(grid_html)
+        if not load_more and not next_page:
+            return None
+        self.pause()
+        if load_more:
+            return self.request('load_more', 'GET', html.unescape(load_more.group(1)))
+        return self.request('next_page', 'GET', '/?' + html.unescape(next_page.group(1)))
+
+    def search(self, term):
+        for size in range(2, len(term) + 1):
+            self.request('search_suggestions', 'GET', '/api/search-suggestions/', params={'q': term[:size]})
+        self.request('search', 'GET', '/search/', params={'q': term}, headers={'HX-Request': 'true'})
+        self.track('pesquisa', query=term)
+        self.pause()
+
+    def view_product(self, product_id, tipo):
+        response = self.request(f'product_detail_{tipo}', 'GET', f'/product/{product_id}/{tipo}/')
+        self.track('produto_visualizado', product_id=product_id, product_type=tipo)
+        self.pause()
+        if response is None:
+            return
+
+        item = {'productId': product_id, 'productType': tipo, 'quantity': self.rng.randint(1, 30)}
+        if tipo == 'capa_pelicula':
+            marcas = MARCA_RE.findall(response.text)
+            if not marcas:
+                return
+            response = self.request(
+                'get_modelos', 'GET', f'/product/{product_id}/marca/{self.rng.choice(marcas)}/modelos/',
+                headers={'HX-Request': 'true'},
+            )
+            modelos = MODELO_RE.findall(response.text) if response is not None else []
+            if not modelos:
+                return
+            item['modelId'] = int(self.rng.choice(modelos))
+            self.pause()
+
+        self.cart.append(item)
+        self.track('item_adicionado', product_id=product_id, product_type=tipo)
+
+    def checkout(self):
+        self.track('checkout_iniciado', cart_items=len(self.cart))
+        self.post_json('checkout', '/checkout/', {
+            'nome_cliente': 'Teste de carga',
+            'whatsapp': f'(11) 9{self.rng.randint(1000, 9999)}-{self.rng.randint(1000, 9999)}',
+            'cart_items': self.cart,
+            'idempotency_key': str(uuid.uuid4()),
+        })
+
+
+def run_load(base_url, users=10, duration=30, think_time=0.0, checkout_ratio=0.1, seed=None):
+    """
+    Run `users` concurrent buyers against base_url for `duration` seconds
+
+    Returns:
+        (dict, float): stats per endpoint label and the elapsed seconds
+    """
+    deadline = time.monotonic() + duration
+    buyers = [
+        # 198.18.0.0/15 is reserved for benchmarking
+        Buyer(base_url, f'198.18.{index // 250}.{index % 250 + 1}', random.Random(
+            None if seed is None else seed + index
+        ), think_time, checkout_ratio)
+        for index in range(users)
+    ]
+
+    def loop(buyer):
+        while time.monotonic() < deadline:
+            buyer.run_session()
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=loop, args=(buyer,), daemon=True) for buyer in buyers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    merged = {}
+    for buyer in buyers:
+        for label, stats in buyer.stats.items():
+            total = merged.setdefault(label, EndpointStats())
+            total.latencies += stats.latencies
+            total.errors += stats.errors
+            total.limited += stats.limited
+    return merged, elapsed
+
+
+def _summary(latencies, errors, limited, elapsed):
+    count = len(latencies)
+    return {
+        'requests': count,
+        'rps': round(count / elapsed, 2) if elapsed else 0,
+        'p50_ms': round(percentile(latencies, 50) or 0, 2),
+        'p95_ms': round(percentile(latencies, 95) or 0, 2),
+        'p99_ms': round(percentile(latencies, 99) or 0, 2),
+        'errors': errors,
+        'error_rate': round(errors / count, 4) if count else 0,
+        'limited': limited,
+    }
+
+
+def summarize(stats, elapsed):
+    """
+    Throughput, latency percentiles and error rates per endpoint and overall
+    """
+    endpoints = {
+        label: _summary(item.latencies, item.errors, item.limited, elapsed)
+        for label, item in sorted(stats.items())
+    }
+    endpoints['total'] = _summary(
+        [latency for item in stats.values() for latency in item.latencies],
+        sum(item.errors for item in stats.values()),
+        sum(item.limited for item in stats.values()),
+        elapsed,
+    )
+    return endpoints
+
+
+def compare(endpoints, baseline, tolerance=0.1):
+    """
+    Endpoints whose p95 grew, throughput dropped or error rate grew by
+    more than `tolerance` against a baseline summary
+
+    Returns:
+        list: (label, metric, baseline, current) tuples
+    """
+    regressions = []
+    for label, current in endpoints.items():
+        previous = baseline.get(label)
+        if previous is None:
+            continue
+        if current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            regressions.append((label, 'p95_ms', previous['p95_ms'], current['p95_ms']))
+        if current['rps'] < previous['rps'] * (1 - tolerance):
+            regressions.append((label, 'rps', previous['rps'], current['rps']))
+        if current['error_rate'] > previous['error_rate'] + tolerance / 10:
+            regressions.append((label, 'error_rate', previous['error_rate'], current['error_rate']))
+    return regressions
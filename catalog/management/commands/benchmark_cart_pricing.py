@@ -0,0 +1,82 @@
+"""
+Micro-benchmark of the cart pricing engine on large B2B carts
+"""
+
+import statistics
+import time
+from itertools import cycle, islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from catalog.cart_utils import price_cart
+from catalog.models import ProdutoNormal, PrecoModelo
+
+
+class Command(BaseCommand):
+    help = 'Mede o tempo e o número de queries para precificar carrinhos grandes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lines',
+            type=int,
+            nargs='+',
+            default=[10, 100, 500],
+            help='Tamanhos de carrinho a medir (default: 10 100 500)'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='Execuções por tamanho de carrinho (default: 20)'
+        )
+
+    def build_cart(self, size):
+        """
+        Cart mixing normal products and capa/model pairs from the catalog,
+        with quantities on both sides of the super atacado threshold
+        """
+        normais = list(ProdutoNormal.objects.filter(em_estoque=True).values_list('id', flat=True)[:size])
+        pares = list(PrecoModelo.objects.filter(produto__em_estoque=True).values_list(
+            'produto_id', 'modelo_id'
+        )[:size])
+
+        items = [
+            {'productId': produto_id, 'productType': 'normal'}
+            for produto_id in normais
+        ] + [
+            {'productId': produto_id, 'productType': 'capa_pelicula', 'modelId': modelo_id}
+            for produto_id, modelo_id in pares
+        ]
+        if not items:
+            raise CommandError('Catálogo vazio: cadastre produtos antes de rodar o benchmark')
+
+        cart = []
+        for index, item in enumerate(islice(cycle(items), size)):
+            cart.append(dict(item, key=f'linha-{index}', quantity=1 + index % 25))
+        return cart
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+
+        self.stdout.write(f"{'linhas':>8} {'queries':>8} {'mediana ms':>11} {'p95 ms':>8} {'total':>14}")
+
+        for size in options['lines']:
+            cart = self.build_cart(size)
+
+            with CaptureQueriesContext(connection) as queries:
+                priced_cart = price_cart(cart)
+
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                price_cart(cart)
+                timings.append((time.perf_counter() - start) * 1000)
+            timings.sort()
+            p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+
+            self.stdout.write(
+                f'{len(priced_cart):>8} {len(queries):>8} '
+                f'{statistics.median(timings):>11.2f} {p95:>8.2f} {priced_cart.total:>14}'
+            )
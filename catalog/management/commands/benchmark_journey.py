@@ -0,0 +1,89 @@
+"""
+Benchmark journey ingestion: one row per request vs batched + buffered
+"""
+
+import json
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+
+from catalog import journey_utils, views
+from catalog.journey_utils import JourneyBuffer
+from catalog.models import JornadaCliente
+
+
+class Command(BaseCommand):
+    help = 'Mede inserções/s em /api/track-journey/: um evento por requisição vs. lotes com buffer'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--events',
+            type=int,
+            default=2000,
+            help='Eventos por modo (default: 2000)'
+        )
+        parser.add_argument(
+            '--batch',
+            type=int,
+            default=20,
+            help='Eventos por requisição no modo em lote (default: 20)'
+        )
+        parser.add_argument(
+            '--buffer-size',
+            type=int,
+            default=200,
+            help='Tamanho do buffer de inserção (default: 200)'
+        )
+
+    def event(self, index):
+        return {'evento': 'produto_visualizado', 'dados': {'product_id': index % 50, 'time_on_site': index}}
+
+    def post(self, body):
+        request = self.factory.post('/api/track-journey/', json.dumps(body), content_type='application/json')
+        response = views.track_journey(request)
+        assert response.status_code == 200, response.content
+
+    def handle(self, *args, **options):
+        self.factory = RequestFactory()
+        events = options['events']
+        batch = options['batch']
+        sessao = f'bench-{uuid.uuid4().hex[:12]}'
+
+        self.stdout.write(f"{'modo':<22} {'requisições':>11} {'inserções/s':>12}")
+
+        original_buffer = journey_utils._buffer
+        try:
+            # Previous path: one request, one INSERT
+            journey_utils._buffer = JourneyBuffer(0, 1)
+            start = time.perf_counter()
+            for index in range(events):
+                self.post({**self.event(index), 'sessao_id': f'{sessao}-a'})
+            self.report('1 evento/requisição', events, events, start)
+
+            # Batched requests; the background flusher bulk inserts
+            buffer = journey_utils._buffer = JourneyBuffer(options['buffer_size'], 1)
+            start = time.perf_counter()
+            requests_sent = 0
+            for offset in range(0, events, batch):
+                self.post({
+                    'sessao_id': f'{sessao}-b',
+                    'eventos': [self.event(index) for index in range(offset, min(offset + batch, events))],
+                })
+                requests_sent += 1
+            buffer.flush()
+            # Wait for a flush the background thread may still be running
+            deadline = time.monotonic() + 30
+            while (JornadaCliente.objects.filter(sessao_id=f'{sessao}-b').count() < events and
+                   time.monotonic() < deadline):
+                time.sleep(0.01)
+            self.report(f'lotes de {batch} + buffer', requests_sent, events, start)
+        finally:
+            journey_utils._buffer = original_buffer
+            deleted, _ = JornadaCliente.objects.filter(sessao_id__startswith=sessao).delete()
+            self.stdout.write(f'{deleted} eventos de benchmark removidos')
+
+    def report(self, mode, requests_sent, events, start):
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f'{mode:<22} {requests_sent:>11} {events / elapsed:>12.0f}')
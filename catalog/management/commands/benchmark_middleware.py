@@ -0,0 +1,100 @@
+"""
+Benchmark the per-request overhead of the API policy middleware
+"""
+
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.http import HttpResponse
+from django.test import RequestFactory
+
+from catalog.middleware import API_POLICIES, APIPolicy, APIPolicyMiddleware
+
+
+def legacy_chain(get_response, policies):
+    """
+    Previous stack: RateLimitMiddleware + APIThrottleMiddleware, each
+    scanning its own path list and reparsing X-Forwarded-For
+    """
+    limits = {prefix: policy.rate_limit for prefix, policy in policies.items()}
+    throttled = [prefix for prefix, policy in policies.items() if policy.throttle]
+
+    def client_ip(request):
+        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+        return x_forwarded_for.split(',')[0] if x_forwarded_for else request.META.get('REMOTE_ADDR')
+
+    def throttle(request):
+        if request.path in throttled:
+            key = f'legacy_throttle_{client_ip(request)}_{request.path}'
+            if cache.get(key):
+                return HttpResponse(status=429)
+            cache.set(key, True, 5)
+        return get_response(request)
+
+    def rate_limit(request):
+        path = request.path
+        if any(path.startswith(api_path) for api_path in limits):
+            limit = next(rate for api_path, rate in limits.items() if path.startswith(api_path))
+            key = f'legacy_rate_limit_{client_ip(request)}_{path}'
+            count = cache.get(key, 0)
+            if count >= limit:
+                return HttpResponse(status=429)
+            cache.set(key, count + 1, 60)
+        return throttle(request)
+
+    return rate_limit
+
+
+class Command(BaseCommand):
+    help = 'Mede o custo por requisição (µs) do middleware de políticas da API vs. a pilha anterior'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=20000,
+            help='Requisições por cenário (default: 20000)'
+        )
+
+    def handle(self, *args, **options):
+        factory = RequestFactory()
+        response = HttpResponse('ok')
+
+        def view(request):
+            return response
+
+        # Same prefixes, limits high enough that no request is rejected
+        policies = {
+            prefix: APIPolicy(rate_limit=10 ** 9, throttle=policy.throttle)
+            for prefix, policy in API_POLICIES.items()
+        }
+        scenarios = [
+            ('página', factory.get('/product/12/normal/')),
+            ('api', factory.post(
+                '/api/track-journey/',
+                REMOTE_ADDR='10.0.0.1',
+                HTTP_X_FORWARDED_FOR='203.0.113.7, 198.51.100.2',
+            )),
+        ]
+        stacks = [
+            ('sem middleware', view),
+            ('anterior', legacy_chain(view, policies)),
+            ('políticas', APIPolicyMiddleware(view, policies)),
+        ]
+
+        self.stdout.write(f"{'cenário':<10} {'pilha':<16} {'µs/req':>8}")
+        for label, request in scenarios:
+            for name, stack in stacks:
+                cache.clear()
+                elapsed = self.measure(stack, request, options['requests'])
+                self.stdout.write(f'{label:<10} {name:<16} {elapsed:>8.2f}')
+        cache.clear()
+
+    def measure(self, stack, request, count):
+        start = time.perf_counter()
+        for _ in range(count):
+            # The policy middleware memoizes the client IP on the request
+            request.__dict__.pop('_client_ip', None)
+            stack(request)
+        return (time.perf_counter() - start) / count * 1_000_000
@@ -0,0 +1,127 @@
+"""
+Benchmark webhook delivery throughput against a local stub receiver
+"""
+
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from catalog.models import ConfiguracaoWebhook
+from catalog.webhook_utils import WebhookTransport
+
+
+class StubReceiver(BaseHTTPRequestHandler):
+    """
+    Keep-alive receiver that accepts every webhook after an optional delay
+    """
+    protocol_version = 'HTTP/1.1'
+    # Like real receivers; otherwise delayed ACKs dominate keep-alive timings
+    disable_nagle_algorithm = True
+    delay = 0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.delay:
+            time.sleep(self.delay)
+        body = b'{"ok": true}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class Command(BaseCommand):
+    help = 'Mede eventos/s de entrega de webhooks (sem pool vs. sessão com pool) contra um receptor local'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--events',
+            type=int,
+            default=300,
+            help='Eventos enviados por rodada (default: 300)'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            nargs='+',
+            default=[1, 8, 32],
+            help='Threads de envio a medir (default: 1 8 32)'
+        )
+        parser.add_argument(
+            '--delay-ms',
+            type=float,
+            default=5,
+            help='Latência simulada do receptor em ms (default: 5)'
+        )
+        parser.add_argument(
+            '--max-in-flight',
+            type=int,
+            default=settings.WEBHOOK_MAX_IN_FLIGHT,
+            help='Limite de envios simultâneos por endpoint (default: WEBHOOK_MAX_IN_FLIGHT)'
+        )
+
+    def handle(self, *args, **options):
+        StubReceiver.delay = options['delay_ms'] / 1000
+        server = StubServer(('127.0.0.1', 0), StubReceiver)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        webhook_config = ConfiguracaoWebhook(
+            evento='pedido_finalizado',
+            url=f'http://127.0.0.1:{server.server_port}/webhook',
+            timeout=10,
+        )
+        data = {'order': {'codigo': 'PMBENCH', 'items': [{'quantity': 1, 'unit_price': 9.9}] * 10}}
+
+        def unpooled(event_id):
+            # Previous behaviour: a new connection for every delivery
+            try:
+                response = requests.post(
+                    webhook_config.url,
+                    data=json.dumps({'evento': webhook_config.evento, 'event_id': event_id, **data}),
+                    headers={'Content-Type': 'application/json'},
+                    timeout=webhook_config.timeout,
+                )
+            except requests.exceptions.RequestException as e:
+                return str(e)
+            return None if response.ok else f'HTTP {response.status_code}'
+
+        self.stdout.write(f"{'modo':<12} {'threads':>8} {'eventos/s':>10} {'falhas':>7}")
+
+        try:
+            for concurrency in options['concurrency']:
+                with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                    start = time.perf_counter()
+                    errors = list(executor.map(unpooled, range(options['events'])))
+                    self.report('sem pool', concurrency, options['events'], start, errors)
+
+                    transport = WebhookTransport(pool_size=concurrency, max_in_flight=options['max_in_flight'])
+                    jobs = [
+                        (webhook_config, webhook_config.evento, data, 0, event_id)
+                        for event_id in range(options['events'])
+                    ]
+                    start = time.perf_counter()
+                    errors = list(executor.map(lambda job: transport.deliver(*job), jobs))
+                    self.report('pool', concurrency, options['events'], start, errors)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def report(self, mode, concurrency, events, start, errors):
+        elapsed = time.perf_counter() - start
+        failures = sum(1 for error in errors if error)
+        self.stdout.write(f'{mode:<12} {concurrency:>8} {events / elapsed:>10.0f} {failures:>7}')
@@ -0,0 +1,33 @@
+"""
+Pre-render the sitemap index and gzipped child sitemaps
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.sitemap_utils import build_sitemaps
+
+
+class Command(BaseCommand):
+    help = 'Gera o índice de sitemaps e os sitemaps paginados (.xml.gz) em SITEMAP_ROOT'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--base-url',
+            default=settings.SITE_URL,
+            help='Origem pública usada nas URLs (default: SITE_URL)'
+        )
+        parser.add_argument(
+            '--output-dir',
+            default=settings.SITEMAP_ROOT,
+            help='Diretório de saída (default: SITEMAP_ROOT)'
+        )
+
+    def handle(self, *args, **options):
+        if not options['base_url']:
+            raise CommandError('Defina SITE_URL ou informe --base-url')
+
+        counts = build_sitemaps(options['base_url'], options['output_dir'])
+        for section, count in counts.items():
+            self.stdout.write(f'{section}: {count} URLs')
+        self.stdout.write(self.style.SUCCESS(f"Sitemaps gerados em {options['output_dir']}"))
@@ -0,0 +1,124 @@
+"""
+Load test of a running storefront with synthetic buyer sessions
+"""
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.loadtest_utils import compare, run_load, summarize
+from catalog.perf_utils import seed_catalog, write_report
+
+
+class Command(BaseCommand):
+    help = (
+        'Simula compradores simultâneos contra um servidor em execução e mede vazão, '
+        'latência (p50/p95/p99) e erros por endpoint'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url',
+            default='http://127.0.0.1:8000',
+            help='Endereço do servidor (default: http://127.0.0.1:8000)'
+        )
+        parser.add_argument(
+            '--users',
+            type=int,
+            default=10,
+            help='Compradores simultâneos (default: 10)'
+        )
+        parser.add_argument(
+            '--duration',
+            type=float,
+            default=30,
+            help='Duração do teste em segundos (default: 30)'
+        )
+        parser.add_argument(
+            '--think-time',
+            type=float,
+            default=0.0,
+            help='Pausa média entre ações de um comprador, em segundos (default: 0)'
+        )
+        parser.add_argument(
+            '--checkout-ratio',
+            type=float,
+            default=0.1,
+            help='Fração das visitas com carrinho que finalizam o pedido (default: 0.1)'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            help='Semente do gerador aleatório, para repetir o mesmo tráfego'
+        )
+        parser.add_argument(
+            '--seed-catalog',
+            type=int,
+            metavar='PRODUTOS',
+            help='Cria antes um catálogo sintético com PRODUTOS produtos de cada tipo no banco configurado'
+        )
+        parser.add_argument(
+            '--output',
+            help='Grava o relatório JSON neste arquivo'
+        )
+        parser.add_argument(
+            '--baseline',
+            help='Relatório JSON de referência para comparar'
+        )
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=0.1,
+            help='Variação aceita em relação à referência (default: 0.1 = 10%%)'
+        )
+
+    def handle(self, *args, **options):
+        if options['seed_catalog']:
+            criados = seed_catalog(produtos=options['seed_catalog'], prefixo=f"carga{options['seed'] or ''}")
+            self.stdout.write(f'Catálogo sintético: {criados}')
+
+        baseline = None
+        if options['baseline']:
+            try:
+                with open(options['baseline'], encoding='utf-8') as report:
+                    baseline = json.load(report)['results']
+            except (OSError, ValueError, KeyError) as e:
+                raise CommandError(f"Referência inválida {options['baseline']}: {e}")
+
+        self.stdout.write(
+            f"{options['users']} compradores por {options['duration']:g}s contra {options['url']}..."
+        )
+        stats, elapsed = run_load(
+            options['url'],
+            users=options['users'],
+            duration=options['duration'],
+            think_time=options['think_time'],
+            checkout_ratio=options['checkout_ratio'],
+            seed=options['seed'],
+        )
+        results = summarize(stats, elapsed)
+        if results['total']['errors'] == results['total']['requests']:
+            raise CommandError(f"Nenhuma requisição concluída: o servidor está em {options['url']}?")
+
+        self.stdout.write(
+            f"{'endpoint':<28} {'req':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} "
+            f"{'p99 ms':>8} {'erros':>6} {'429':>5}"
+        )
+        for label, row in results.items():
+            self.stdout.write(
+                f"{label:<28} {row['requests']:>7} {row['rps']:>8.1f} {row['p50_ms']:>8.1f} "
+                f"{row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f} {row['error_rate']:>6.1%} {row['limited']:>5}"
+            )
+
+        if options['output']:
+            write_report(options['output'], results, url=options['url'], users=options['users'],
+                         duration=round(elapsed, 1), think_time=options['think_time'])
+            self.stdout.write(f"Relatório gravado em {options['output']}")
+
+        if baseline is not None:
+            regressions = compare(results, baseline, options['tolerance'])
+            for label, metric, previous, current in regressions:
+                self.stdout.write(self.style.WARNING(f'{label}: {metric} {previous} -> {current}'))
+            if regressions:
+                raise CommandError(f'{len(regressions)} regressões em relação a {options["baseline"]}')
+            self.stdout.write(self.style.SUCCESS('Sem regressões em relação à referência'))
@@ -0,0 +1,72 @@
+"""
+Drain the webhook outbox (EventoWebhook)
+"""
+
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from catalog.metrics_utils import start_metrics_server
+from catalog.webhook_utils import process_webhook_batch
+
+
+class Command(BaseCommand):
+    help = 'Envia os webhooks pendentes da fila, com retry exponencial e dead letter'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Envios HTTP simultâneos (default: 4)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=20,
+            help='Eventos reservados por ciclo (default: 20)'
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=2.0,
+            help='Segundos de espera quando a fila está vazia (default: 2)'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Processa os eventos vencidos e sai'
+        )
+        parser.add_argument(
+            '--metrics-port',
+            type=int,
+            help='Expõe as métricas Prometheus de entrega nesta porta (/metrics)'
+        )
+
+    def handle(self, *args, **options):
+        self.running = True
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        if options['metrics_port']:
+            start_metrics_server(options['metrics_port'])
+
+        processed = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            while self.running:
+                close_old_connections()
+                count = process_webhook_batch(executor, options['batch_size'])
+                processed += count
+
+                if count == 0:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+
+        self.stdout.write(self.style.SUCCESS(f'{processed} eventos processados'))
+
+    def stop(self, signum, frame):
+        # Finish the current batch, then exit
+        self.running = False
@@ -0,0 +1,57 @@
+"""
+Roll up and remove raw journey events past the retention period
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from catalog.analytics_utils import refresh_journey_summaries
+from catalog.journey_utils import days_to_prune, prune_journey_day
+from catalog.models import JornadaCliente
+
+
+class Command(BaseCommand):
+    help = 'Consolida em JornadaDiaria e remove os eventos de jornada mais antigos que o período de retenção'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=settings.JOURNEY_RETENTION_DAYS,
+            help='Dias de eventos brutos mantidos (default: JOURNEY_RETENTION_DAYS)'
+        )
+        parser.add_argument(
+            '--archive-dir',
+            help='Diretório onde os eventos removidos são arquivados (jornada-AAAA-MM.jsonl.gz)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Apenas mostra quantos eventos seriam consolidados'
+        )
+
+    def handle(self, *args, **options):
+        days = days_to_prune(options['days'])
+        if not days:
+            self.stdout.write('Nenhum evento além do período de retenção')
+            return
+
+        if options['dry_run']:
+            count = JornadaCliente.objects.filter(timestamp__date__lte=days[-1]).count()
+            self.stdout.write(f'{count} eventos de {days[0]} a {days[-1]} seriam consolidados')
+            return
+
+        # Fold everything into the rollups before deleting raw events
+        refresh_journey_summaries()
+
+        removed = 0
+        # One transaction per day keeps locks short on the hot table
+        for dia in days:
+            close_old_connections()
+            count = prune_journey_day(dia, options['archive_dir'])
+            if count:
+                self.stdout.write(f'{dia}: {count} eventos consolidados')
+            removed += count
+
+        self.stdout.write(self.style.SUCCESS(f'{removed} eventos removidos de {len(days)} dias'))
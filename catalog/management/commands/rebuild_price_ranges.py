@@ -0,0 +1,35 @@
+"""
+Rebuild the stored price ranges of ProdutoCapaPelicula
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from catalog.models import ProdutoCapaPelicula
+
+
+class Command(BaseCommand):
+    help = 'Recalcula os ranges de preço (min/max e modelos ativos) das capas/películas'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Quantidade de produtos atualizados por UPDATE (default: 1000)'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        ids = list(ProdutoCapaPelicula.objects.order_by('id').values_list('id', flat=True))
+
+        updated = 0
+        for start in range(0, len(ids), batch_size):
+            batch = ids[start:start + batch_size]
+            with transaction.atomic():
+                updated += ProdutoCapaPelicula.objects.filter(
+                    id__gte=batch[0],
+                    id__lte=batch[-1]
+                ).atualizar_range_precos()
+
+        self.stdout.write(self.style.SUCCESS(f'{updated} produtos atualizados'))
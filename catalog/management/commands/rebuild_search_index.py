@@ -0,0 +1,24 @@
+"""
+Rebuild the catalog search documents and index
+"""
+
+from django.core.management.base import BaseCommand
+
+from catalog.search_utils import get_search_backend, rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'Recalcula os documentos de busca dos produtos e reconstrói o índice de busca'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Quantidade de produtos processados por lote (default: 500)'
+        )
+
+    def handle(self, *args, **options):
+        total = rebuild_search_index(batch_size=options['batch_size'])
+        backend = type(get_search_backend()).__name__
+        self.stdout.write(self.style.SUCCESS(f'{total} produtos indexados ({backend})'))
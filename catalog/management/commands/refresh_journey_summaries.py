@@ -0,0 +1,15 @@
+"""
+Fold new journey events into the daily rollups and funnel
+"""
+
+from django.core.management.base import BaseCommand
+
+from catalog.analytics_utils import refresh_journey_summaries
+
+
+class Command(BaseCommand):
+    help = 'Consolida os novos eventos de jornada em JornadaDiaria e atualiza o funil diário (agendar via cron)'
+
+    def handle(self, *args, **options):
+        folded, days = refresh_journey_summaries()
+        self.stdout.write(self.style.SUCCESS(f'{folded} eventos consolidados em {len(days)} dias'))
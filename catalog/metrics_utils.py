@@ -0,0 +1,137 @@
+"""
+Prometheus metrics for the catalog
+
+Counters and histograms are updated in-process by the hot paths (request
+middleware, rate limiting, webhook delivery, journey ingestion, tagged
+cache, checkout), through the helpers below; with METRICS_ENABLED off
+they record nothing. With PROMETHEUS_MULTIPROC_DIR set (gunicorn.conf.py
+sets it for the web dyno) each gunicorn worker writes its samples to
+mmap files in that directory and the scrape endpoint merges them, so
+/metrics reports every worker whichever one answers. Without it
+(runserver, tests, one-off commands) metrics live in the process
+registry.
+"""
+
+import os
+from contextlib import nullcontext
+
+from django.conf import settings
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram,
+    generate_latest, multiprocess, start_http_server
+)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+REQUEST_LATENCY = Histogram(
+    'pmcell_http_request_duration_seconds',
+    'Request latency by URL name',
+    ['view', 'method'],
+    buckets=LATENCY_BUCKETS,
+)
+REQUESTS = Counter(
+    'pmcell_http_requests_total',
+    'Requests by URL name and status code',
+    ['view', 'method', 'status'],
+)
+RATE_LIMIT_REJECTIONS = Counter(
+    'pmcell_rate_limit_rejections_total',
+    'API requests rejected by APIPolicyMiddleware',
+    ['prefix', 'reason'],
+)
+WEBHOOK_LATENCY = Histogram(
+    'pmcell_webhook_delivery_duration_seconds',
+    'Webhook POST latency by event type',
+    ['evento'],
+    buckets=LATENCY_BUCKETS,
+)
+WEBHOOK_DELIVERIES = Counter(
+    'pmcell_webhook_deliveries_total',
+    'Webhook delivery attempts by event type and resulting status',
+    ['evento', 'status'],
+)
+JOURNEY_EVENTS = Counter(
+    'pmcell_journey_events_total',
+    'Journey events accepted for ingestion by type',
+    ['evento'],
+)
+CACHE_LOOKUPS = Counter(
+    'pmcell_cache_lookups_total',
+    'Tagged cache lookups (get_or_set_tagged) by result',
+    ['result'],
+)
+CHECKOUT_VALUE = Histogram(
+    'pmcell_checkout_order_value_reais',
+    'Value of placed orders in BRL (_sum is the revenue, _count the orders)',
+    buckets=(50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000),
+)
+CHECKOUT_ITEMS = Histogram(
+    'pmcell_checkout_order_items',
+    'Lines per placed order',
+    buckets=(1, 2, 5, 10, 20, 50, 100, 250),
+)
+
+
+def _registry():
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def render_metrics():
+    """
+    (body, content type) of the Prometheus text exposition
+    """
+    return generate_latest(_registry()), CONTENT_TYPE_LATEST
+
+
+def start_metrics_server(port):
+    """
+    Serve /metrics from a background thread, for processes without an
+    HTTP server of their own (process_webhooks)
+    """
+    start_http_server(port, registry=_registry())
+
+
+def observe_request(view, method, status, seconds):
+    if settings.METRICS_ENABLED:
+        REQUEST_LATENCY.labels(view, method).observe(seconds)
+        REQUESTS.labels(view, method, str(status)).inc()
+
+
+def record_cache_lookup(hit):
+    if settings.METRICS_ENABLED:
+        CACHE_LOOKUPS.labels('hit' if hit else 'miss').inc()
+
+
+def record_rejection(prefix, reason):
+    if settings.METRICS_ENABLED:
+        RATE_LIMIT_REJECTIONS.labels(prefix, reason).inc()
+
+
+def time_webhook_delivery(evento):
+    """
+    Context manager timing one webhook POST
+    """
+    if settings.METRICS_ENABLED:
+        return WEBHOOK_LATENCY.labels(evento).time()
+    return nullcontext()
+
+
+def record_webhook_delivery(evento, status):
+    if settings.METRICS_ENABLED:
+        WEBHOOK_DELIVERIES.labels(evento, status).inc()
+
+
+def count_journey_events(jornadas):
+    if settings.METRICS_ENABLED:
+        for jornada in jornadas:
+            JOURNEY_EVENTS.labels(jornada.evento).inc()
+
+
+def record_order(pedido, lines):
+    if settings.METRICS_ENABLED:
+        CHECKOUT_VALUE.observe(float(pedido.valor_total))
+        CHECKOUT_ITEMS.observe(lines)
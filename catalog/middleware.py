@@ -2,10 +2,22 @@
 Custom middleware for PMCELL catalog
 """
 
+import json
+import logging
 import time
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
 from django.http import HttpResponse
+from django.urls import Resolver404, resolve
 from django.core.cache import cache
-from django.conf import settings
+
+from . import metrics_utils, profiling_utils
+from .ratelimit_utils import get_limiter
+
+profiling_logger = logging.getLogger('catalog.profiling')
 
 
 class HttpResponseTooManyRequests(HttpResponse):
@@ -37,120 +49,204 @@ class SecurityMiddleware:
         return response
 
 
-class RateLimitMiddleware:
+@dataclass(frozen=True)
+class APIPolicy:
     """
-    Simple rate limiting middleware for API endpoints
+    Limits applied to a path prefix: rate_limit requests per
+    RATE_LIMIT_WINDOW, and at most one request every throttle seconds
     """
-    
-    def __init__(self, get_response):
-        self.get_response = get_response
-        
-        # Rate limit settings (requests per minute)
-        self.limits = {
-            '/api/liberate-prices/': 5,     # 5 requests per minute
-            '/api/track-journey/': 60,      # 60 requests per minute
-            '/api/track-abandoned-cart/': 3, # 3 requests per minute
-            '/api/search-suggestions/': 30,  # 30 requests per minute
-        }
+    rate_limit: int = None
+    throttle: int = None
+
+
+API_POLICIES = {
+    '/api/liberate-prices/': APIPolicy(rate_limit=5, throttle=5),
+    '/api/track-journey/': APIPolicy(rate_limit=60),
+    '/api/track-abandoned-cart/': APIPolicy(rate_limit=3, throttle=5),
+    # The search bar asks for suggestions on every keystroke and buyers
+    # behind one NAT or carrier IP share the budget; answered from the
+    # in-memory index, so the limit only stops scripted abuse
+    '/api/search-suggestions/': APIPolicy(rate_limit=600),
+}
 
-    def __call__(self, request):
-        # Check if this is an API endpoint we want to rate limit
-        path = request.path
-        if any(path.startswith(api_path) for api_path in self.limits.keys()):
-            if self.is_rate_limited(request):
-                return HttpResponseTooManyRequests("Rate limit exceeded. Please try again later.")
-        
-        response = self.get_response(request)
-        return response
 
-    def is_rate_limited(self, request):
+class PolicyNode:
+    __slots__ = ('children', 'prefix', 'policy')
+
+    def __init__(self):
+        self.children = {}
+        self.prefix = None
+        self.policy = None
+
+
+class PolicyRouter:
+    """
+    Prefix tree of policies keyed by path segment, built once; resolving a
+    path walks it once and returns the policy of the longest matching prefix
+    """
+
+    def __init__(self, policies):
+        self.root = PolicyNode()
+        for prefix, policy in policies.items():
+            node = self.root
+            for segment in self.segments(prefix):
+                node = node.children.setdefault(segment, PolicyNode())
+            node.prefix = prefix
+            node.policy = policy
+
+    @staticmethod
+    def segments(path):
+        return path.strip('/').split('/')
+
+    def resolve(self, path):
         """
-        Check if the request should be rate limited
+        (prefix, policy) for path, or None when no policy applies
         """
-        # Get client IP
-        ip = self.get_client_ip(request)
-        path = request.path
-        
-        # Find matching rate limit
-        limit = None
-        for api_path, rate_limit in self.limits.items():
-            if path.startswith(api_path):
-                limit = rate_limit
+        node = self.root
+        match = None
+        for segment in self.segments(path):
+            node = node.children.get(segment)
+            if node is None:
                 break
+            if node.policy is not None:
+                match = node
+        return (match.prefix, match.policy) if match else None
+
+
+def get_client_ip(request):
+    """
+    Client address, parsed once per request. With TRUSTED_PROXY_DEPTH
+    proxies in front of the app, the client is the address the outermost
+    trusted proxy saw: that many hops from the right of
+    X-Forwarded-For + REMOTE_ADDR. Entries further left are set by the
+    client and can be forged.
+    """
+    ip = getattr(request, '_client_ip', None)
+    if ip is None:
+        remote_addr = request.META.get('REMOTE_ADDR', '')
+        depth = settings.TRUSTED_PROXY_DEPTH
+        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+        if depth and x_forwarded_for:
+            hops = [hop.strip() for hop in x_forwarded_for.split(',')]
+            hops.append(remote_addr)
+            ip = hops[max(0, len(hops) - 1 - depth)]
+        else:
+            ip = remote_addr
+        request._client_ip = ip
+    return ip
+
+
+class APIPolicyMiddleware:
+    """
+    Rate limiting and throttling for API endpoints in one pass: the path is
+    resolved once against a prefix tree of API_POLICIES, and requests
+    outside it go straight through without touching the cache
+    """
+    
+    def __init__(self, get_response, policies=None):
+        self.get_response = get_response
+        self.router = PolicyRouter(API_POLICIES if policies is None else policies)
+        self.limiter = get_limiter()
+
+    def __call__(self, request):
+        match = self.router.resolve(request.path)
+        if match is None:
+            return self.get_response(request)
         
-        if limit is None:
-            return False
+        prefix, policy = match
+        identity = f'{get_client_ip(request)}:{prefix}'
         
-        # Cache key for this IP and endpoint
-        cache_key = f"rate_limit_{ip}_{path}"
+        # Throttled requests are rejected before they count against the
+        # rate limit, so a client retrying too fast does not use it up
+        if policy.throttle and self.is_throttled(identity, policy.throttle):
+            response = HttpResponseTooManyRequests("Webhook throttle limit exceeded.")
+            response['Retry-After'] = str(policy.throttle)
+            metrics_utils.record_rejection(prefix, 'throttle')
+            return response
         
-        # Get current count
-        current_count = cache.get(cache_key, 0)
+        result = None
+        if policy.rate_limit:
+            result = self.limiter.hit(identity, policy.rate_limit)
         
-        if current_count >= limit:
-            return True
+        if result is not None and not result.allowed:
+            response = HttpResponseTooManyRequests("Rate limit exceeded. Please try again later.")
+            metrics_utils.record_rejection(prefix, 'rate_limit')
+        else:
+            response = self.get_response(request)
         
-        # Increment count with 60-second expiry
-        cache.set(cache_key, current_count + 1, 60)
-        return False
+        if result is not None:
+            for header, value in result.headers().items():
+                response.setdefault(header, value)
+        return response
 
-    def get_client_ip(self, request):
+    def is_throttled(self, identity, seconds):
         """
-        Get the client's IP address
+        At most one request every `seconds`; atomic: only the request that
+        creates the key gets through
         """
-        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-        if x_forwarded_for:
-            ip = x_forwarded_for.split(',')[0]
-        else:
-            ip = request.META.get('REMOTE_ADDR')
-        return ip
+        return not cache.add(f'api_throttle:{identity}', True, seconds)
 
 
-class APIThrottleMiddleware:
+class RequestMetricsMiddleware:
     """
-    Additional throttling for webhook endpoints
+    Prometheus request latency and count per URL name (METRICS_ENABLED);
+    first in MIDDLEWARE so rate-limited and failed requests are counted too
     """
     
     def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
         self.get_response = get_response
-        self.webhook_endpoints = [
-            '/api/liberate-prices/',
-            '/api/track-abandoned-cart/',
-        ]
 
     def __call__(self, request):
-        # Apply additional throttling to webhook endpoints
-        if request.path in self.webhook_endpoints:
-            if self.is_webhook_throttled(request):
-                return HttpResponseTooManyRequests("Webhook throttle limit exceeded.")
-        
+        start = time.perf_counter()
         response = self.get_response(request)
+        metrics_utils.observe_request(self.view_name(request), request.method, response.status_code,
+                                      time.perf_counter() - start)
         return response
 
-    def is_webhook_throttled(self, request):
+    @staticmethod
+    def view_name(request):
         """
-        More restrictive throttling for webhook endpoints
+        URL name of the request; labels by raw path would be unbounded
         """
-        ip = self.get_client_ip(request)
-        path = request.path
-        
-        # Very restrictive: 1 request per 5 seconds for webhooks
-        cache_key = f"webhook_throttle_{ip}_{path}"
-        
-        if cache.get(cache_key):
-            return True
-        
-        # Set throttle for 5 seconds
-        cache.set(cache_key, True, 5)
-        return False
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            # Answered before URL resolution (e.g. a 429 from APIPolicyMiddleware)
+            try:
+                match = resolve(request.path_info)
+            except Resolver404:
+                return '<unmatched>'
+        return match.view_name or match._func_path
 
-    def get_client_ip(self, request):
-        """
-        Get the client's IP address
-        """
-        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-        if x_forwarded_for:
-            ip = x_forwarded_for.split(',')[0]
-        else:
-            ip = request.META.get('REMOTE_ADDR')
-        return ip
\ No newline at end of file
+
+class RequestProfilingMiddleware:
+    """
+    Opt-in (PROFILING_ENABLED) request instrumentation: wall time per view,
+    SQL count and time with duplicate detection, cache hits and misses of
+    the tagged cache, template render time and time spent queueing webhooks.
+    Each request gets a Server-Timing header and one JSON log line on the
+    catalog.profiling logger; the slowest are kept per process for the
+    admin "Requisições lentas" page. Disabled, Django drops it at startup.
+    """
+    
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        profiling_utils.install_template_timer()
+
+    def __call__(self, request):
+        profile = profiling_utils.RequestProfile(request)
+        token = profiling_utils.activate(profile)
+        try:
+            with connection.execute_wrapper(profile.execute_wrapper):
+                response = self.get_response(request)
+        finally:
+            profiling_utils.deactivate(token)
+        
+        profile.finish(request, response)
+        response['Server-Timing'] = profile.server_timing()
+        profiling_logger.info(json.dumps(profile.as_dict()))
+        profiling_utils.slow_requests.add(profile)
+        return response
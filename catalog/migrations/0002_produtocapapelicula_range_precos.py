@@ -0,0 +1,62 @@
+# Generated by Django 4.2.23 on 2026-10-17 17:54
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def preencher_range_precos(apps, schema_editor):
+    ProdutoCapaPelicula = apps.get_model('catalog', 'ProdutoCapaPelicula')
+    PrecoModelo = apps.get_model('catalog', 'PrecoModelo')
+
+    precos = PrecoModelo.objects.filter(
+        produto=OuterRef('pk'),
+        ativo=True
+    ).order_by().values('produto')
+
+    def agregado(expressao):
+        return Subquery(precos.annotate(valor=expressao).values('valor'))
+
+    ProdutoCapaPelicula.objects.update(
+        preco_atacado_min=agregado(Min('preco_atacado')),
+        preco_atacado_max=agregado(Max('preco_atacado')),
+        preco_super_atacado_min=agregado(Min('preco_super_atacado')),
+        preco_super_atacado_max=agregado(Max('preco_super_atacado')),
+        modelos_ativos=Coalesce(agregado(Count('id')), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='produtocapapelicula',
+            name='modelos_ativos',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Modelos ativos'),
+        ),
+        migrations.AddField(
+            model_name='produtocapapelicula',
+            name='preco_atacado_max',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=10, null=True, verbose_name='Preço atacado máximo'),
+        ),
+        migrations.AddField(
+            model_name='produtocapapelicula',
+            name='preco_atacado_min',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=10, null=True, verbose_name='Preço atacado mínimo'),
+        ),
+        migrations.AddField(
+            model_name='produtocapapelicula',
+            name='preco_super_atacado_max',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=10, null=True, verbose_name='Preço super atacado máximo'),
+        ),
+        migrations.AddField(
+            model_name='produtocapapelicula',
+            name='preco_super_atacado_min',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=10, null=True, verbose_name='Preço super atacado mínimo'),
+        ),
+        migrations.RunPython(preencher_range_precos, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,143 @@
+# Generated by Django 4.2.23 on 2026-10-17 17:56
+
+import re
+import unicodedata
+
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+
+# Frozen copies of the catalog.search_utils helpers as of this migration,
+# so later changes to the application code do not change what it does
+FTS_TABLE = 'catalog_produto_busca_fts'
+
+PT_PLURAL_SUFFIXES = (
+    ('oes', 'ao'), ('aes', 'ao'), ('ais', 'al'), ('eis', 'el'), ('ois', 'ol'),
+    ('ns', 'm'), ('res', 'r'), ('zes', 'z'), ('ses', 's'), ('s', ''),
+)
+
+
+def fold_text(text):
+    normalized = unicodedata.normalize('NFKD', text or '')
+    return ''.join(c for c in normalized if not unicodedata.combining(c)).lower()
+
+
+def tokenize(text):
+    return re.findall(r'\w+', fold_text(text))
+
+
+def stem_pt(token):
+    if len(token) <= 3:
+        return token
+    for suffix, replacement in PT_PLURAL_SUFFIXES:
+        if token.endswith(suffix):
+            token = token[:-len(suffix)] + replacement
+            break
+    if len(token) > 3 and token[-1] in 'aoe':
+        token = token[:-1]
+    return token
+
+
+def build_search_document(produto):
+    parts = [produto.nome, produto.descricao, produto.categoria.nome, produto.fabricante]
+
+    if hasattr(produto, 'precomodelo_set'):
+        for preco in produto.precomodelo_set.all():
+            if preco.ativo:
+                parts.extend([preco.modelo.marca.nome, preco.modelo.nome])
+
+    seen = set()
+    unique_parts = []
+    for part in parts:
+        if part and part not in seen:
+            seen.add(part)
+            unique_parts.append(part)
+
+    return fold_text(' '.join(unique_parts))
+
+
+def criar_indices_busca(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+
+    if vendor == 'postgresql':
+        from django.contrib.postgres.indexes import GinIndex, OpClass
+        from django.contrib.postgres.search import SearchVector
+
+        for model_name, prefix in (('ProdutoNormal', 'normal'), ('ProdutoCapaPelicula', 'capa')):
+            model = apps.get_model('catalog', model_name)
+            schema_editor.add_index(model, GinIndex(
+                SearchVector('documento_busca', config='portuguese'),
+                name=f'catalog_{prefix}_busca_fts_idx',
+            ))
+            schema_editor.add_index(model, GinIndex(
+                OpClass('documento_busca', name='gin_trgm_ops'),
+                name=f'catalog_{prefix}_busca_trgm_idx',
+            ))
+
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+            f"USING fts5(documento, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+
+
+def remover_indices_busca(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+
+    if vendor == 'postgresql':
+        for prefix in ('normal', 'capa'):
+            schema_editor.execute(f'DROP INDEX IF EXISTS catalog_{prefix}_busca_fts_idx')
+            schema_editor.execute(f'DROP INDEX IF EXISTS catalog_{prefix}_busca_trgm_idx')
+
+    elif vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+def preencher_documentos(apps, schema_editor):
+    ProdutoNormal = apps.get_model('catalog', 'ProdutoNormal')
+    ProdutoCapaPelicula = apps.get_model('catalog', 'ProdutoCapaPelicula')
+
+    fts_rows = []
+    for model, offset in ((ProdutoNormal, 0), (ProdutoCapaPelicula, 1)):
+        queryset = model.objects.select_related('categoria')
+        if model is ProdutoCapaPelicula:
+            queryset = queryset.prefetch_related('precomodelo_set__modelo__marca')
+
+        produtos = list(queryset)
+        for produto in produtos:
+            produto.documento_busca = build_search_document(produto)
+            fts_rows.append((
+                produto.id * 2 + offset,
+                ' '.join(stem_pt(token) for token in tokenize(produto.documento_busca)),
+            ))
+        model.objects.bulk_update(produtos, ['documento_busca'], batch_size=500)
+
+    if schema_editor.connection.vendor == 'sqlite' and fts_rows:
+        with schema_editor.connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, documento) VALUES (%s, %s)',
+                fts_rows
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0002_produtocapapelicula_range_precos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='produtocapapelicula',
+            name='documento_busca',
+            field=models.TextField(blank=True, editable=False, verbose_name='Documento de busca'),
+        ),
+        migrations.AddField(
+            model_name='produtonormal',
+            name='documento_busca',
+            field=models.TextField(blank=True, editable=False, verbose_name='Documento de busca'),
+        ),
+        TrigramExtension(),
+        migrations.RunPython(criar_indices_busca, remover_indices_busca),
+        migrations.RunPython(preencher_documentos, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.23 on 2026-10-17 18:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0003_documento_busca'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pedido',
+            name='chave_idempotencia',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, unique=True, verbose_name='Chave de idempotência'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.23 on 2026-10-17 18:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0005_evento_webhook'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='configuracaowebhook',
+            name='envio_em_lote',
+            field=models.BooleanField(default=False, verbose_name='Envio em lote'),
+        ),
+        migrations.AddField(
+            model_name='configuracaowebhook',
+            name='tamanho_lote',
+            field=models.PositiveIntegerField(default=50, verbose_name='Eventos por lote'),
+        ),
+        migrations.AddField(
+            model_name='eventowebhook',
+            name='chave_agrupamento',
+            field=models.CharField(blank=True, max_length=100, null=True, verbose_name='Chave de agrupamento'),
+        ),
+        migrations.AddConstraint(
+            model_name='eventowebhook',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'pendente'), ('tentativas', 0)), fields=('chave_agrupamento',), name='evento_webhook_agrupamento_unico'),
+        ),
+    ]
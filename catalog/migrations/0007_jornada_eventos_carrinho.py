@@ -0,0 +1,18 @@
+# Generated by Django 4.2.23 on 2026-10-17 19:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0006_webhook_agrupamento_lote'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='jornadacliente',
+            name='evento',
+            field=models.CharField(choices=[('entrada', 'Entrada no site'), ('liberacao_preco', 'Liberação de preços'), ('categoria_visitada', 'Categoria visitada'), ('pesquisa', 'Pesquisa realizada'), ('produto_visualizado', 'Produto visualizado'), ('item_adicionado', 'Item adicionado ao carrinho'), ('item_removido', 'Item removido do carrinho'), ('item_atualizado', 'Quantidade alterada no carrinho'), ('carrinho_limpo', 'Carrinho esvaziado'), ('checkout_iniciado', 'Checkout iniciado'), ('pedido_finalizado', 'Pedido finalizado'), ('saida', 'Saída do site')], max_length=20, verbose_name='Evento'),
+        ),
+    ]
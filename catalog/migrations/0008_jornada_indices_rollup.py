@@ -0,0 +1,59 @@
+# Generated by Django 4.2.23 on 2026-10-17 18:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0007_jornada_eventos_carrinho'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JornadaDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField(verbose_name='Data')),
+                ('evento', models.CharField(choices=[('entrada', 'Entrada no site'), ('liberacao_preco', 'Liberação de preços'), ('categoria_visitada', 'Categoria visitada'), ('pesquisa', 'Pesquisa realizada'), ('produto_visualizado', 'Produto visualizado'), ('item_adicionado', 'Item adicionado ao carrinho'), ('item_removido', 'Item removido do carrinho'), ('item_atualizado', 'Quantidade alterada no carrinho'), ('carrinho_limpo', 'Carrinho esvaziado'), ('checkout_iniciado', 'Checkout iniciado'), ('pedido_finalizado', 'Pedido finalizado'), ('saida', 'Saída do site')], max_length=20, verbose_name='Evento')),
+                ('sessao_id', models.CharField(max_length=100, verbose_name='ID da sessão')),
+                ('whatsapp', models.CharField(blank=True, max_length=20, verbose_name='WhatsApp')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='Total de eventos')),
+                ('primeiro_evento', models.DateTimeField(verbose_name='Primeiro evento')),
+                ('ultimo_evento', models.DateTimeField(verbose_name='Último evento')),
+            ],
+            options={
+                'verbose_name': 'Jornada Diária',
+                'verbose_name_plural': 'Jornadas Diárias',
+                'ordering': ['-data', 'evento'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='jornadacliente',
+            index=models.Index(fields=['-timestamp'], name='jornada_timestamp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='jornadacliente',
+            index=models.Index(fields=['evento', '-timestamp'], name='jornada_evento_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='jornadacliente',
+            index=models.Index(fields=['whatsapp', '-timestamp'], name='jornada_whatsapp_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='jornadacliente',
+            index=models.Index(fields=['sessao_id', 'timestamp'], name='jornada_sessao_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='jornadadiaria',
+            index=models.Index(fields=['evento', 'data'], name='jornada_diaria_evento_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='jornadadiaria',
+            index=models.Index(fields=['whatsapp', 'data'], name='jornada_diaria_whatsapp_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='jornadadiaria',
+            unique_together={('data', 'evento', 'sessao_id')},
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.23 on 2026-10-17 18:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0008_jornada_indices_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FunilDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField(unique=True, verbose_name='Data')),
+                ('sessoes', models.PositiveIntegerField(default=0, verbose_name='Sessões')),
+                ('entradas', models.PositiveIntegerField(default=0, verbose_name='Entradas')),
+                ('liberacoes', models.PositiveIntegerField(default=0, verbose_name='Liberações de preço')),
+                ('itens_adicionados', models.PositiveIntegerField(default=0, verbose_name='Adicionaram ao carrinho')),
+                ('checkouts', models.PositiveIntegerField(default=0, verbose_name='Iniciaram checkout')),
+                ('pedidos', models.PositiveIntegerField(default=0, verbose_name='Finalizaram pedido')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Atualizado em')),
+            ],
+            options={
+                'verbose_name': 'Funil Diário',
+                'verbose_name_plural': 'Funil Diário',
+                'ordering': ['-data'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='jornadadiaria',
+            index=models.Index(fields=['sessao_id', 'data'], name='jornada_diaria_sessao_idx'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.2.23 on 2026-10-17 18:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0009_funil_diario'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='carrinhoabandonado',
+            index=models.Index(fields=['-created_at'], name='carrinho_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='carrinhoabandonado',
+            index=models.Index(condition=models.Q(('webhook_enviado', False)), fields=['whatsapp'], name='carrinho_pendente_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='imagemproduto',
+            index=models.Index(fields=['produto_normal', 'principal'], name='imagem_normal_principal_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='imagemproduto',
+            index=models.Index(fields=['produto_capa', 'principal'], name='imagem_capa_principal_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='modelocelular',
+            index=models.Index(condition=models.Q(('ativo', True)), fields=['marca', 'ordem', 'nome'], name='modelo_ativo_marca_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['-created_at'], name='pedido_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['status', '-created_at'], name='pedido_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='produtocapapelicula',
+            index=models.Index(condition=models.Q(('em_estoque', True)), fields=['nome', 'id'], name='capa_estoque_nome_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='produtocapapelicula',
+            index=models.Index(condition=models.Q(('em_estoque', True)), fields=['categoria', 'nome', 'id'], name='capa_estoque_cat_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='produtonormal',
+            index=models.Index(condition=models.Q(('em_estoque', True)), fields=['nome', 'id'], name='normal_estoque_nome_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='produtonormal',
+            index=models.Index(condition=models.Q(('em_estoque', True)), fields=['categoria', 'nome', 'id'], name='normal_estoque_cat_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='produtonormal',
+            index=models.Index(condition=models.Q(('em_estoque', True)), fields=['preco_atacado', 'id'], name='normal_estoque_preco_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.23 on 2026-10-17 19:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0010_indices_consultas'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='produtocapapelicula',
+            index=models.Index(condition=models.Q(('em_estoque', True)), fields=['preco_atacado_min', 'id'], name='capa_estoque_preco_idx'),
+        ),
+    ]
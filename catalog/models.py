@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import AbstractUser
 from cloudinary.models import CloudinaryField
 from django.core.validators import RegexValidator
@@ -6,6 +7,16 @@ from django.utils import timezone
 import uuid
 
 
+def preco_por_quantidade(preco_atacado, preco_super_atacado, quantidade, quantidade_super_atacado):
+    """
+    Unit price tier for a quantity: super atacado from the product's
+    minimum quantity on, atacado below it
+    """
+    if quantidade >= quantidade_super_atacado:
+        return preco_super_atacado
+    return preco_atacado
+
+
 class User(AbstractUser):
     is_vendedor = models.BooleanField(default=False, verbose_name="É vendedor")
     
@@ -52,6 +63,9 @@ class Produto(models.Model):
         verbose_name="Quantidade mínima para super atacado"
     )
     
+    # Accent-folded search text, maintained by catalog.search_utils
+    documento_busca = models.TextField(blank=True, editable=False, verbose_name="Documento de busca")
+    
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Criado em")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Atualizado em")
     
@@ -80,32 +94,111 @@ class ProdutoNormal(Produto):
     class Meta:
         verbose_name = "Produto Normal"
         verbose_name_plural = "Produtos Normais"
+        indexes = [
+            # Catalog listing (in-stock only): sort by name or price, with
+            # id as the keyset tie-breaker, optionally within a category
+            models.Index(fields=['nome', 'id'], condition=models.Q(em_estoque=True), name='normal_estoque_nome_idx'),
+            models.Index(
+                fields=['categoria', 'nome', 'id'], condition=models.Q(em_estoque=True), name='normal_estoque_cat_idx'
+            ),
+            models.Index(
+                fields=['preco_atacado', 'id'], condition=models.Q(em_estoque=True), name='normal_estoque_preco_idx'
+            ),
+        ]
     
     def calcular_preco(self, quantidade):
-        if quantidade >= self.quantidade_super_atacado:
-            return self.preco_super_atacado
-        return self.preco_atacado
+        return preco_por_quantidade(
+            self.preco_atacado, self.preco_super_atacado, quantidade, self.quantidade_super_atacado
+        )
+
+
+class ProdutoCapaPeliculaQuerySet(models.QuerySet):
+    
+    def atualizar_range_precos(self):
+        """
+        Recompute the stored price range of every product in the queryset
+        from its active PrecoModelo rows, in a single UPDATE
+        """
+        precos = PrecoModelo.objects.filter(
+            produto=models.OuterRef('pk'),
+            ativo=True
+        ).order_by().values('produto')
+        
+        def agregado(expressao):
+            return models.Subquery(precos.annotate(valor=expressao).values('valor'))
+        
+        return self.update(
+            preco_atacado_min=agregado(models.Min('preco_atacado')),
+            preco_atacado_max=agregado(models.Max('preco_atacado')),
+            preco_super_atacado_min=agregado(models.Min('preco_super_atacado')),
+            preco_super_atacado_max=agregado(models.Max('preco_super_atacado')),
+            modelos_ativos=Coalesce(agregado(models.Count('id')), 0),
+        )
 
 
 class ProdutoCapaPelicula(Produto):
+    # Price range over active PrecoModelo rows, kept in sync by catalog.signals
+    preco_atacado_min = models.DecimalField(
+        max_digits=10, 
+        decimal_places=2, 
+        null=True, 
+        blank=True,
+        editable=False,
+        verbose_name="Preço atacado mínimo"
+    )
+    preco_atacado_max = models.DecimalField(
+        max_digits=10, 
+        decimal_places=2, 
+        null=True, 
+        blank=True,
+        editable=False,
+        verbose_name="Preço atacado máximo"
+    )
+    preco_super_atacado_min = models.DecimalField(
+        max_digits=10, 
+        decimal_places=2, 
+        null=True, 
+        blank=True,
+        editable=False,
+        verbose_name="Preço super atacado mínimo"
+    )
+    preco_super_atacado_max = models.DecimalField(
+        max_digits=10, 
+        decimal_places=2, 
+        null=True, 
+        blank=True,
+        editable=False,
+        verbose_name="Preço super atacado máximo"
+    )
+    modelos_ativos = models.PositiveIntegerField(
+        default=0, 
+        editable=False,
+        verbose_name="Modelos ativos"
+    )
+    
+    objects = ProdutoCapaPeliculaQuerySet.as_manager()
     
     class Meta:
         verbose_name = "Produto Capa/Película"
         verbose_name_plural = "Produtos Capa/Película"
+        indexes = [
+            models.Index(fields=['nome', 'id'], condition=models.Q(em_estoque=True), name='capa_estoque_nome_idx'),
+            models.Index(
+                fields=['categoria', 'nome', 'id'], condition=models.Q(em_estoque=True), name='capa_estoque_cat_idx'
+            ),
+            # Price sort, on the stored range (see atualizar_range_precos)
+            models.Index(
+                fields=['preco_atacado_min', 'id'], condition=models.Q(em_estoque=True), name='capa_estoque_preco_idx'
+            ),
+        ]
     
     def get_range_precos(self):
-        precos = self.precomodelo_set.all().values_list('preco_atacado', 'preco_super_atacado')
-        if not precos:
-            return None, None
-        
-        atacado_min = min(p[0] for p in precos)
-        atacado_max = max(p[0] for p in precos)
-        super_min = min(p[1] for p in precos)
-        super_max = max(p[1] for p in precos)
+        if not self.modelos_ativos:
+            return None
         
         return {
-            'atacado': {'min': atacado_min, 'max': atacado_max},
-            'super_atacado': {'min': super_min, 'max': super_max}
+            'atacado': {'min': self.preco_atacado_min, 'max': self.preco_atacado_max},
+            'super_atacado': {'min': self.preco_super_atacado_min, 'max': self.preco_super_atacado_max}
         }
 
 
@@ -134,6 +227,11 @@ class ImagemProduto(models.Model):
         verbose_name = "Imagem do Produto"
         verbose_name_plural = "Imagens dos Produtos"
         ordering = ['ordem']
+        indexes = [
+            # Principal image prefetch of listings and cart
+            models.Index(fields=['produto_normal', 'principal'], name='imagem_normal_principal_idx'),
+            models.Index(fields=['produto_capa', 'principal'], name='imagem_capa_principal_idx'),
+        ]
     
     def __str__(self):
         produto = self.produto_normal or self.produto_capa
@@ -167,11 +265,56 @@ class ModeloCelular(models.Model):
         verbose_name_plural = "Modelos de Celular"
         ordering = ['ordem', 'nome']
         unique_together = ['marca', 'slug']
+        indexes = [
+            models.Index(
+                fields=['marca', 'ordem', 'nome'], condition=models.Q(ativo=True), name='modelo_ativo_marca_idx'
+            ),
+        ]
     
     def __str__(self):
         return f"{self.marca.nome} {self.nome}"
 
 
+class PrecoModeloQuerySet(models.QuerySet):
+    """
+    Keeps ProdutoCapaPelicula price ranges, search documents and catalog
+    caches in sync on bulk operations, which bypass the save/delete signals
+    """
+    
+    def _atualizar_produtos(self, produto_ids):
+        if produto_ids:
+            from .cache_utils import invalidate_product_cache
+            from .search_utils import TIPO_CAPA, index_products
+            ProdutoCapaPelicula.objects.filter(id__in=produto_ids).atualizar_range_precos()
+            index_products(TIPO_CAPA, produto_ids)
+            invalidate_product_cache()
+    
+    def update(self, **kwargs):
+        produto_ids = set(self.values_list('produto_id', flat=True))
+        rows = super().update(**kwargs)
+        novo_produto = kwargs.get('produto', kwargs.get('produto_id'))
+        if novo_produto is not None:
+            produto_ids.add(getattr(novo_produto, 'pk', novo_produto))
+        self._atualizar_produtos(produto_ids)
+        return rows
+    
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        self._atualizar_produtos({obj.produto_id for obj in objs})
+        return objs
+    
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        produto_ids = {obj.produto_id for obj in objs}
+        if 'produto' in fields or 'produto_id' in fields:
+            # Products the rows are moved away from
+            produto_ids.update(self.filter(
+                pk__in=[obj.pk for obj in objs]
+            ).values_list('produto_id', flat=True))
+        rows = super().bulk_update(objs, fields, *args, **kwargs)
+        self._atualizar_produtos(produto_ids)
+        return rows
+
+
 class PrecoModelo(models.Model):
     produto = models.ForeignKey(ProdutoCapaPelicula, on_delete=models.CASCADE, verbose_name="Produto")
     modelo = models.ForeignKey(ModeloCelular, on_delete=models.CASCADE, verbose_name="Modelo")
@@ -187,18 +330,22 @@ class PrecoModelo(models.Model):
     )
     ativo = models.BooleanField(default=True, verbose_name="Ativo")
     
+    objects = PrecoModeloQuerySet.as_manager()
+    
     class Meta:
         verbose_name = "Preço por Modelo"
         verbose_name_plural = "Preços por Modelo"
+        # The unique index (produto, modelo) also serves the active-price
+        # lookups by product; ativo is filtered on the few rows it returns
         unique_together = ['produto', 'modelo']
     
     def __str__(self):
         return f"{self.produto.nome} - {self.modelo}"
     
     def calcular_preco(self, quantidade):
-        if quantidade >= self.produto.quantidade_super_atacado:
-            return self.preco_super_atacado
-        return self.preco_atacado
+        return preco_por_quantidade(
+            self.preco_atacado, self.preco_super_atacado, quantidade, self.produto.quantidade_super_atacado
+        )
 
 
 phone_regex = RegexValidator(
@@ -238,6 +385,16 @@ class Pedido(models.Model):
     
     observacoes = models.TextField(blank=True, verbose_name="Observações")
     
+    # Client-generated key of the checkout attempt; retries return this order
+    chave_idempotencia = models.CharField(
+        max_length=64,
+        unique=True,
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name="Chave de idempotência"
+    )
+    
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Criado em")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Atualizado em")
     
@@ -245,6 +402,10 @@ class Pedido(models.Model):
         verbose_name = "Pedido"
         verbose_name_plural = "Pedidos"
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at'], name='pedido_created_idx'),
+            models.Index(fields=['status', '-created_at'], name='pedido_status_created_idx'),
+        ]
     
     def __str__(self):
         return f"Pedido {self.codigo} - {self.whatsapp}"
@@ -337,6 +498,11 @@ class CarrinhoAbandonado(models.Model):
         verbose_name = "Carrinho Abandonado"
         verbose_name_plural = "Carrinhos Abandonados"
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at'], name='carrinho_created_idx'),
+            # Open cart lookup of track_abandoned_cart
+            models.Index(fields=['whatsapp'], condition=models.Q(webhook_enviado=False), name='carrinho_pendente_idx'),
+        ]
     
     def __str__(self):
         return f"Carrinho abandonado - {self.whatsapp} - R$ {self.valor_estimado}"
@@ -351,6 +517,8 @@ class JornadaCliente(models.Model):
         ('produto_visualizado', 'Produto visualizado'),
         ('item_adicionado', 'Item adicionado ao carrinho'),
         ('item_removido', 'Item removido do carrinho'),
+        ('item_atualizado', 'Quantidade alterada no carrinho'),
+        ('carrinho_limpo', 'Carrinho esvaziado'),
         ('checkout_iniciado', 'Checkout iniciado'),
         ('pedido_finalizado', 'Pedido finalizado'),
         ('saida', 'Saída do site'),
@@ -373,11 +541,74 @@ class JornadaCliente(models.Model):
         verbose_name = "Jornada do Cliente"
         verbose_name_plural = "Jornadas dos Clientes"
         ordering = ['-timestamp']
+        indexes = [
+            # Admin list (newest first, filtered by event) and retention range scans
+            models.Index(fields=['-timestamp'], name='jornada_timestamp_idx'),
+            models.Index(fields=['evento', '-timestamp'], name='jornada_evento_ts_idx'),
+            # Per-customer and per-session timelines
+            models.Index(fields=['whatsapp', '-timestamp'], name='jornada_whatsapp_ts_idx'),
+            models.Index(fields=['sessao_id', 'timestamp'], name='jornada_sessao_ts_idx'),
+        ]
     
     def __str__(self):
         return f"{self.evento} - {self.whatsapp or self.sessao_id} - {self.timestamp}"
 
 
+class JornadaDiaria(models.Model):
+    """
+    Daily rollup of JornadaCliente per event type and session; raw events
+    older than the retention period are folded into it (prune_journey)
+    """
+    data = models.DateField(verbose_name="Data")
+    evento = models.CharField(max_length=20, choices=JornadaCliente.EVENTO_CHOICES, verbose_name="Evento")
+    sessao_id = models.CharField(max_length=100, verbose_name="ID da sessão")
+    whatsapp = models.CharField(max_length=20, blank=True, verbose_name="WhatsApp")
+    
+    total = models.PositiveIntegerField(default=0, verbose_name="Total de eventos")
+    primeiro_evento = models.DateTimeField(verbose_name="Primeiro evento")
+    ultimo_evento = models.DateTimeField(verbose_name="Último evento")
+    
+    class Meta:
+        verbose_name = "Jornada Diária"
+        verbose_name_plural = "Jornadas Diárias"
+        ordering = ['-data', 'evento']
+        unique_together = ['data', 'evento', 'sessao_id']
+        indexes = [
+            models.Index(fields=['evento', 'data'], name='jornada_diaria_evento_idx'),
+            models.Index(fields=['whatsapp', 'data'], name='jornada_diaria_whatsapp_idx'),
+            models.Index(fields=['sessao_id', 'data'], name='jornada_diaria_sessao_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.data} - {self.evento} - {self.sessao_id} ({self.total})"
+
+
+class FunilDiario(models.Model):
+    """
+    Materialized funnel per cohort: the sessions first seen on the day and
+    how many of them reached each step after every earlier one, refreshed
+    incrementally from JornadaDiaria (refresh_journey_summaries)
+    """
+    data = models.DateField(unique=True, verbose_name="Data")
+    
+    sessoes = models.PositiveIntegerField(default=0, verbose_name="Sessões")
+    entradas = models.PositiveIntegerField(default=0, verbose_name="Entradas")
+    liberacoes = models.PositiveIntegerField(default=0, verbose_name="Liberações de preço")
+    itens_adicionados = models.PositiveIntegerField(default=0, verbose_name="Adicionaram ao carrinho")
+    checkouts = models.PositiveIntegerField(default=0, verbose_name="Iniciaram checkout")
+    pedidos = models.PositiveIntegerField(default=0, verbose_name="Finalizaram pedido")
+    
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Atualizado em")
+    
+    class Meta:
+        verbose_name = "Funil Diário"
+        verbose_name_plural = "Funil Diário"
+        ordering = ['-data']
+    
+    def __str__(self):
+        return f"Funil {self.data} - {self.sessoes} sessões"
+
+
 class ConfiguracaoWebhook(models.Model):
     EVENTO_CHOICES = [
         ('liberacao_preco', 'Liberação de preços'),
@@ -395,6 +626,9 @@ class ConfiguracaoWebhook(models.Model):
     ativo = models.BooleanField(default=True, verbose_name="Ativo")
     timeout = models.PositiveIntegerField(default=30, verbose_name="Timeout (segundos)")
     retry_ativo = models.BooleanField(default=True, verbose_name="Retry ativo")
+    # Batched delivery: one POST with a JSON array of up to tamanho_lote events
+    envio_em_lote = models.BooleanField(default=False, verbose_name="Envio em lote")
+    tamanho_lote = models.PositiveIntegerField(default=50, verbose_name="Eventos por lote")
     
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Criado em")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Atualizado em")
@@ -407,6 +641,60 @@ class ConfiguracaoWebhook(models.Model):
         return f"Webhook {self.evento}"
 
 
+class EventoWebhook(models.Model):
+    """
+    Outbox of webhook deliveries; request handlers only insert rows and
+    the process_webhooks worker sends them
+    """
+    STATUS_CHOICES = [
+        ('pendente', 'Pendente'),
+        ('processando', 'Processando'),
+        ('enviado', 'Enviado'),
+        ('descartado', 'Descartado'),
+    ]
+    
+    evento = models.CharField(
+        max_length=20, 
+        choices=ConfiguracaoWebhook.EVENTO_CHOICES, 
+        verbose_name="Evento"
+    )
+    payload = models.JSONField(verbose_name="Payload")
+    status = models.CharField(
+        max_length=20, 
+        choices=STATUS_CHOICES, 
+        default='pendente',
+        verbose_name="Status"
+    )
+    tentativas = models.PositiveIntegerField(default=0, verbose_name="Tentativas")
+    proxima_tentativa = models.DateTimeField(default=timezone.now, verbose_name="Próxima tentativa")
+    # Lease of a claimed event; expired leases are picked up again
+    bloqueado_ate = models.DateTimeField(null=True, blank=True, verbose_name="Bloqueado até")
+    ultimo_erro = models.TextField(blank=True, verbose_name="Último erro")
+    # Events sharing a key while still waiting are merged (latest payload wins)
+    chave_agrupamento = models.CharField(max_length=100, null=True, blank=True, verbose_name="Chave de agrupamento")
+    
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Criado em")
+    enviado_em = models.DateTimeField(null=True, blank=True, verbose_name="Enviado em")
+    
+    class Meta:
+        verbose_name = "Evento de Webhook"
+        verbose_name_plural = "Eventos de Webhook"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'proxima_tentativa'], name='evento_webhook_fila_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['chave_agrupamento'],
+                condition=models.Q(status='pendente', tentativas=0),
+                name='evento_webhook_agrupamento_unico',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_evento_display()} #{self.pk} ({self.get_status_display()})"
+
+
 class ConfiguracaoGeral(models.Model):
     chave = models.CharField(max_length=100, unique=True, verbose_name="Chave")
     valor = models.TextField(verbose_name="Valor")
@@ -0,0 +1,83 @@
+"""
+Order placement utilities
+
+Checkout goes through place_order: the cart is priced server-side in bulk
+(cart_utils.price_cart), then the Pedido and all its ItemPedido rows are
+written in one transaction with a single bulk_create. A client-supplied
+idempotency key makes retries (double clicks, flaky connections) return
+the order that was already placed instead of creating a new one. The
+order webhook is queued in the same transaction.
+"""
+
+from django.db import IntegrityError, transaction
+
+from .cart_utils import price_cart
+from .metrics_utils import record_order
+from .models import Pedido, ItemPedido
+from .webhook_utils import enqueue_order_completed_webhook
+
+
+class CheckoutError(Exception):
+    """
+    Raised when an order can't be placed; the message is shown to the customer
+    """
+
+
+def _existing_order(idempotency_key):
+    if not idempotency_key:
+        return None
+    return Pedido.objects.filter(chave_idempotencia=idempotency_key).first()
+
+
+def place_order(nome_cliente, whatsapp, cart_items, idempotency_key=None):
+    """
+    Price the cart and write the order with its items atomically.
+
+    Returns (pedido, created); created is False when the idempotency key
+    matches an order placed earlier.
+    """
+    idempotency_key = (idempotency_key or '').strip()[:64] or None
+
+    pedido = _existing_order(idempotency_key)
+    if pedido is not None:
+        return pedido, False
+
+    priced_cart = price_cart(cart_items, with_images=False)
+    if not priced_cart.lines:
+        raise CheckoutError('Carrinho vazio')
+
+    pedido = Pedido(
+        nome_cliente=nome_cliente or 'Cliente não informado',
+        whatsapp=whatsapp,
+        valor_total=priced_cart.total,
+        chave_idempotencia=idempotency_key,
+    )
+
+    try:
+        with transaction.atomic():
+            pedido.save()
+            # bulk_create skips ItemPedido.save; prices were already computed
+            # by the engine with the same tier rule
+            ItemPedido.objects.bulk_create([
+                ItemPedido(
+                    pedido=pedido,
+                    tipo=line.tipo,
+                    produto_normal=line.produto if line.preco_modelo is None else None,
+                    preco_modelo=line.preco_modelo,
+                    quantidade=line.quantidade,
+                    preco_unitario=line.preco_unitario,
+                    preco_total=line.preco_total,
+                )
+                for line in priced_cart.lines
+            ])
+            # Outbox row commits (or rolls back) together with the order
+            enqueue_order_completed_webhook(pedido)
+    except IntegrityError:
+        # A concurrent request with the same key won the race
+        pedido = _existing_order(idempotency_key)
+        if pedido is None:
+            raise
+        return pedido, False
+
+    record_order(pedido, len(priced_cart.lines))
+    return pedido, True
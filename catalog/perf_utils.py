@@ -0,0 +1,168 @@
+"""
+Synthetic catalogs and timing reports for performance checks
+
+seed_catalog fills the database with a catalog of a given shape (products
+of both types, brands, models, the PrecoModelo matrix and images) using
+bulk inserts, then brings the denormalized price ranges and the search
+index up to date as the signals would. Timings are summarized as
+p50/p95 and written to a JSON report keyed by commit, so runs can be
+compared across commits.
+"""
+
+import json
+import math
+import os
+import platform
+import subprocess
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from .models import (
+    Categoria, ProdutoNormal, ProdutoCapaPelicula, ImagemProduto,
+    MarcaCelular, ModeloCelular, PrecoModelo
+)
+from .search_utils import rebuild_search_index
+
+CATEGORIAS = ('Cabos', 'Carregadores', 'Fones', 'Capas', 'Películas', 'Suportes')
+
+
+def seed_catalog(produtos=200, marcas=5, modelos_por_marca=20, precos_por_capa=10,
+                 imagens_por_produto=3, prefixo='perf'):
+    """
+    Create a synthetic catalog: `produtos` products of each type, each capa
+    priced for `precos_por_capa` models spread over every brand
+
+    Returns:
+        dict: number of rows created per model
+    """
+    categorias = Categoria.objects.bulk_create([
+        Categoria(nome=f'{nome} {prefixo}', slug=f'{prefixo}-categoria-{i}', ordem=i)
+        for i, nome in enumerate(CATEGORIAS)
+    ])
+
+    normais = ProdutoNormal.objects.bulk_create([
+        ProdutoNormal(
+            nome=f'{CATEGORIAS[i % 3]} {prefixo} {i:05d}',
+            slug=f'{prefixo}-normal-{i}',
+            descricao=f'Acessório {i} para celular, linha {prefixo}',
+            categoria=categorias[i % 3],
+            fabricante=f'Fabricante {i % 7}',
+            preco_atacado=Decimal(10 + i % 90),
+            preco_super_atacado=Decimal(8 + i % 90),
+            quantidade_super_atacado=10 + i % 3 * 10,
+        )
+        for i in range(produtos)
+    ], batch_size=500)
+    capas = ProdutoCapaPelicula.objects.bulk_create([
+        ProdutoCapaPelicula(
+            nome=f'{CATEGORIAS[3 + i % 2]} {prefixo} {i:05d}',
+            slug=f'{prefixo}-capa-{i}',
+            descricao=f'Capa ou película {i}, linha {prefixo}',
+            categoria=categorias[3 + i % 2],
+        )
+        for i in range(produtos)
+    ], batch_size=500)
+
+    marcas_criadas = MarcaCelular.objects.bulk_create([
+        MarcaCelular(nome=f'Marca {prefixo} {i}', slug=f'{prefixo}-marca-{i}', ordem=i)
+        for i in range(marcas)
+    ])
+    modelos = ModeloCelular.objects.bulk_create([
+        ModeloCelular(
+            marca=marca, nome=f'Modelo {marca.ordem}-{j:03d}', slug=f'{prefixo}-modelo-{marca.ordem}-{j}', ordem=j
+        )
+        for marca in marcas_criadas
+        for j in range(modelos_por_marca)
+    ], batch_size=500)
+
+    # Consecutive models of the round-robin cover every brand
+    modelos = sorted(modelos, key=lambda modelo: (modelo.ordem, modelo.marca_id))
+    precos = PrecoModelo.objects.bulk_create([
+        PrecoModelo(
+            produto=capa,
+            modelo=modelos[(i + offset) % len(modelos)],
+            preco_atacado=Decimal(20 + offset),
+            preco_super_atacado=Decimal(15 + offset),
+        )
+        for i, capa in enumerate(capas)
+        for offset in range(min(precos_por_capa, len(modelos)))
+    ], batch_size=1000)
+
+    imagens = ImagemProduto.objects.bulk_create([
+        ImagemProduto(
+            **{campo: produto}, imagem=f'{prefixo}/{campo}-{produto.id}-{ordem}',
+            ordem=ordem, principal=ordem == 0,
+        )
+        for campo, lista in (('produto_normal', normais), ('produto_capa', capas))
+        for produto in lista
+        for ordem in range(imagens_por_produto)
+    ], batch_size=1000)
+
+    # bulk_create skips the signals that keep these up to date
+    ProdutoCapaPelicula.objects.filter(id__in=[capa.id for capa in capas]).atualizar_range_precos()
+    rebuild_search_index()
+
+    return {
+        'categorias': len(categorias),
+        'produtos_normais': len(normais),
+        'produtos_capa': len(capas),
+        'marcas': len(marcas_criadas),
+        'modelos': len(modelos),
+        'precos_modelo': len(precos),
+        'imagens': len(imagens),
+    }
+
+
+def percentile(values, pct):
+    """
+    Nearest-rank percentile of a list of numbers
+    """
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def timing_summary(timings_ms):
+    return {
+        'runs': len(timings_ms),
+        'p50_ms': round(percentile(timings_ms, 50), 3),
+        'p95_ms': round(percentile(timings_ms, 95), 3),
+    }
+
+
+def current_commit():
+    """
+    Short hash of the checked-out commit, or None outside a git checkout
+    """
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=5, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def write_report(path, results, **meta):
+    """
+    Write a JSON report of per-endpoint results with the commit and
+    environment it was measured on
+    """
+    report = {
+        'commit': current_commit(),
+        'created_at': timezone.now().isoformat(),
+        'database': connection.vendor,
+        'python': platform.python_version(),
+        **meta,
+        'results': results,
+    }
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as output:
+        json.dump(report, output, indent=2, ensure_ascii=False, sort_keys=True)
+    return report
@@ -0,0 +1,208 @@
+"""
+Presentation models for catalog templates
+
+Templates receive small precomputed view objects instead of model
+instances, so rendering never reaches the ORM: everything a product card
+or detail page shows (principal image URL, image list, prices, category)
+is resolved up front from rows loaded in a fixed number of queries, and
+image URLs are built once per image.
+"""
+
+from dataclasses import dataclass
+from decimal import Decimal
+
+from django.db.models import Prefetch
+
+from .models import ImagemProduto, PrecoModelo, ProdutoNormal, ProdutoCapaPelicula
+from .search_utils import TIPO_NORMAL, TIPO_CAPA
+
+# All images of a product, the principal one first
+ORDERED_IMAGES = Prefetch(
+    'imagens',
+    queryset=ImagemProduto.objects.order_by('-principal', 'ordem', 'id'),
+    to_attr='imagens_ordenadas',
+)
+
+
+@dataclass(frozen=True, slots=True)
+class ImageView:
+    url: str
+    alt: str
+
+
+@dataclass(frozen=True, slots=True)
+class PriceRange:
+    min_atacado: Decimal
+    max_atacado: Decimal
+    min_super: Decimal
+    max_super: Decimal
+
+    @property
+    def atacado_unico(self):
+        return self.min_atacado == self.max_atacado
+
+    @property
+    def super_unico(self):
+        return self.min_super == self.max_super
+
+
+@dataclass(frozen=True, slots=True)
+class ProductCard:
+    id: int
+    tipo: str
+    nome: str
+    descricao: str
+    categoria_nome: str
+    imagem_url: str
+    quantidade_super_atacado: int
+    preco_atacado: Decimal = None
+    preco_super_atacado: Decimal = None
+    price_range: PriceRange = None
+
+
+@dataclass(frozen=True, slots=True)
+class ProductDetail:
+    id: int
+    tipo: str
+    nome: str
+    descricao: str
+    fabricante: str
+    caracteristicas: str
+    categoria_nome: str
+    categoria_slug: str
+    imagens: tuple
+    quantidade_super_atacado: int
+    preco_atacado: Decimal = None
+    preco_super_atacado: Decimal = None
+    price_range: PriceRange = None
+
+
+@dataclass(frozen=True, slots=True)
+class ModeloOption:
+    id: int
+    nome: str
+    preco_atacado: Decimal
+    preco_super_atacado: Decimal
+
+
+def _image_views(produto):
+    imagens = getattr(produto, 'imagens_ordenadas', None)
+    if imagens is None:
+        imagens = produto.imagens.order_by('-principal', 'ordem', 'id')
+    return tuple(
+        ImageView(url=imagem.imagem.url, alt=imagem.alt_text or produto.nome)
+        for imagem in imagens
+        if imagem.imagem
+    )
+
+
+def _price_fields(produto, tipo):
+    if tipo == TIPO_NORMAL:
+        return {'preco_atacado': produto.preco_atacado, 'preco_super_atacado': produto.preco_super_atacado}
+
+    if not produto.modelos_ativos:
+        return {}
+    return {'price_range': PriceRange(
+        min_atacado=produto.preco_atacado_min,
+        max_atacado=produto.preco_atacado_max,
+        min_super=produto.preco_super_atacado_min,
+        max_super=produto.preco_super_atacado_max,
+    )}
+
+
+def product_card(produto, tipo):
+    """
+    Card for a product loaded with select_related('categoria') and
+    ORDERED_IMAGES
+    """
+    imagens = _image_views(produto)
+    return ProductCard(
+        id=produto.id,
+        tipo=tipo,
+        nome=produto.nome,
+        descricao=produto.descricao,
+        categoria_nome=produto.categoria.nome,
+        imagem_url=imagens[0].url if imagens else '',
+        quantidade_super_atacado=produto.quantidade_super_atacado,
+        **_price_fields(produto, tipo),
+    )
+
+
+def product_detail(produto, tipo):
+    """
+    Detail page view of a product loaded with select_related('categoria')
+    and ORDERED_IMAGES
+    """
+    return ProductDetail(
+        id=produto.id,
+        tipo=tipo,
+        nome=produto.nome,
+        descricao=produto.descricao,
+        fabricante=produto.fabricante,
+        caracteristicas=produto.caracteristicas,
+        categoria_nome=produto.categoria.nome,
+        categoria_slug=produto.categoria.slug,
+        imagens=_image_views(produto),
+        quantidade_super_atacado=produto.quantidade_super_atacado,
+        **_price_fields(produto, tipo),
+    )
+
+
+def load_product_cards(rows):
+    """
+    Cards for (id, tipo) listing rows, in row order: one query per product
+    type plus one image prefetch per type
+    """
+    rows = list(rows)
+    ids = {
+        TIPO_NORMAL: [row['id'] for row in rows if row['tipo'] == TIPO_NORMAL],
+        TIPO_CAPA: [row['id'] for row in rows if row['tipo'] == TIPO_CAPA],
+    }
+    models = {TIPO_NORMAL: ProdutoNormal, TIPO_CAPA: ProdutoCapaPelicula}
+
+    produtos = {}
+    for tipo, tipo_ids in ids.items():
+        if tipo_ids:
+            produtos[tipo] = models[tipo].objects.select_related('categoria').prefetch_related(
+                ORDERED_IMAGES
+            ).in_bulk(tipo_ids)
+
+    cards = []
+    for row in rows:
+        produto = produtos.get(row['tipo'], {}).get(row['id'])
+        if produto is not None:
+            cards.append(product_card(produto, row['tipo']))
+    return cards
+
+
+def load_product_detail(model, product_id, tipo):
+    """
+    Detail view of an in-stock product, or None when it does not exist
+    """
+    produto = model.objects.select_related('categoria').prefetch_related(
+        ORDERED_IMAGES
+    ).filter(id=product_id, em_estoque=True).first()
+    return product_detail(produto, tipo) if produto else None
+
+
+def load_modelo_options(product_id, marca_id):
+    """
+    Active models of a brand priced for a product, with that product's
+    prices, in one query
+    """
+    precos = PrecoModelo.objects.filter(
+        produto_id=product_id,
+        ativo=True,
+        modelo__marca_id=marca_id,
+        modelo__ativo=True,
+    ).select_related('modelo').order_by('modelo__nome')
+
+    return [
+        ModeloOption(
+            id=preco.modelo.id,
+            nome=preco.modelo.nome,
+            preco_atacado=preco.preco_atacado,
+            preco_super_atacado=preco.preco_super_atacado,
+        )
+        for preco in precos
+    ]
@@ -0,0 +1,231 @@
+"""
+Per-request profiling (catalog.middleware.RequestProfilingMiddleware)
+
+While a request is profiled, a RequestProfile is active in a context
+variable; the SQL execute wrapper, get_or_set_tagged, template rendering
+and webhook enqueueing report into it. Outside a profiled request (worker
+commands, PROFILING_ENABLED=False) every hook is a single ContextVar
+lookup.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+_current_profile = ContextVar('catalog_request_profile', default=None)
+
+
+class RequestProfile:
+    """
+    Timings and counters of one request
+    """
+    __slots__ = (
+        'method', 'path', 'view', 'status', 'started_at', 'duration', '_start',
+        'queries', 'db_time', 'cache_hits', 'cache_misses',
+        'template_time', 'template_renders', '_template_depth', 'webhook_time', 'webhook_calls',
+    )
+
+    def __init__(self, request):
+        self.method = request.method
+        self.path = request.path
+        self.view = None
+        self.status = None
+        self.started_at = time.time()
+        self.duration = 0.0
+        self._start = time.perf_counter()
+        self.queries = []
+        self.db_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.template_time = 0.0
+        self.template_renders = 0
+        self._template_depth = 0
+        self.webhook_time = 0.0
+        self.webhook_calls = 0
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        """
+        connection.execute_wrapper hook: time every query
+        """
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries.append((sql, repr(params)))
+
+    def finish(self, request, response):
+        self.duration = time.perf_counter() - self._start
+        self.status = response.status_code
+        match = getattr(request, 'resolver_match', None)
+        if match is not None:
+            self.view = match.view_name or match._func_path
+
+    def duplicate_queries(self):
+        """
+        Queries run again with the same SQL and parameters
+        """
+        return len(self.queries) - len(set(self.queries))
+
+    def repeated_statements(self, limit=3):
+        """
+        Most repeated SQL statements (any parameters), the N+1 suspects
+        """
+        counts = Counter(sql for sql, _ in self.queries)
+        return [(sql, count) for sql, count in counts.most_common(limit) if count > 1]
+
+    def server_timing(self):
+        """
+        Server-Timing header value (durations in milliseconds)
+        """
+        metrics = [
+            f'db;dur={self.db_time * 1000:.1f};desc="{len(self.queries)} queries, '
+            f'{self.duplicate_queries()} duplicated"',
+            f'cache;desc="{self.cache_hits} hits, {self.cache_misses} misses"',
+        ]
+        if self.template_renders:
+            metrics.append(f'tpl;dur={self.template_time * 1000:.1f}')
+        if self.webhook_calls:
+            metrics.append(f'webhook;dur={self.webhook_time * 1000:.1f};desc="{self.webhook_calls} queued"')
+        metrics.append(f'total;dur={self.duration * 1000:.1f}')
+        return ', '.join(metrics)
+
+    def as_dict(self):
+        return {
+            'method': self.method,
+            'path': self.path,
+            'view': self.view,
+            'status': self.status,
+            'started_at': self.started_at,
+            'duration_ms': round(self.duration * 1000, 2),
+            'db_queries': len(self.queries),
+            'db_duplicates': self.duplicate_queries(),
+            'db_ms': round(self.db_time * 1000, 2),
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+            'template_renders': self.template_renders,
+            'template_ms': round(self.template_time * 1000, 2),
+            'webhook_calls': self.webhook_calls,
+            'webhook_ms': round(self.webhook_time * 1000, 2),
+        }
+
+
+def activate(profile):
+    return _current_profile.set(profile)
+
+
+def deactivate(token):
+    _current_profile.reset(token)
+
+
+def record_cache(hit):
+    profile = _current_profile.get()
+    if profile is not None:
+        if hit:
+            profile.cache_hits += 1
+        else:
+            profile.cache_misses += 1
+
+
+@contextmanager
+def timed_webhook():
+    """
+    Time spent queueing webhooks in the outbox; deliveries happen in the
+    worker, outside any request
+    """
+    profile = _current_profile.get()
+    if profile is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.webhook_time += time.perf_counter() - start
+        profile.webhook_calls += 1
+
+
+@contextmanager
+def timed_template():
+    profile = _current_profile.get()
+    if profile is None or profile._template_depth:
+        # Nested renders are already inside the outer render's time
+        yield
+        return
+    profile._template_depth += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile._template_depth -= 1
+        profile.template_time += time.perf_counter() - start
+        profile.template_renders += 1
+
+
+_template_timer_lock = threading.Lock()
+
+
+def install_template_timer():
+    """
+    Time Template.render of the Django template backend (render(),
+    render_to_string() and TemplateResponse all go through it); installed
+    once, by the profiling middleware
+    """
+    from django.template.backends.django import Template
+
+    with _template_timer_lock:
+        if getattr(Template.render, 'profiled', False):
+            return
+        original = Template.render
+
+        def render(self, context=None, request=None):
+            with timed_template():
+                return original(self, context, request)
+
+        render.profiled = True
+        Template.render = render
+
+
+class SlowRequestLog:
+    """
+    The `size` slowest requests seen by this process (a min-heap, so a
+    new request only replaces the fastest one kept)
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._heap = []
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def add(self, profile):
+        if len(self._heap) >= self.size and profile.duration <= self._heap[0][0]:
+            # Faster than everything kept (unlocked peek; rechecked below)
+            return
+        entry = (profile.duration, next(self._counter), {
+            **profile.as_dict(),
+            'repeated_statements': profile.repeated_statements(),
+        })
+        with self._lock:
+            if len(self._heap) < self.size:
+                heapq.heappush(self._heap, entry)
+            elif profile.duration > self._heap[0][0]:
+                heapq.heapreplace(self._heap, entry)
+
+    def slowest(self):
+        with self._lock:
+            entries = sorted(self._heap, reverse=True)
+        return [dict(item) for _, _, item in entries]
+
+    def clear(self):
+        with self._lock:
+            self._heap = []
+
+
+slow_requests = SlowRequestLog(settings.PROFILING_SLOW_REQUESTS)
@@ -0,0 +1,189 @@
+"""
+Rate limiting utilities
+
+Two algorithms, both atomic across threads and processes that share the
+cache (Redis in production; LocMem is per process, so there the limit is
+per worker):
+
+- sliding_window (default): approximated sliding window built on two
+  fixed-window counters, updated with cache.incr / cache.add only, so it
+  works with any cache backend.
+- token_bucket: refill-on-read bucket evaluated by a Lua script on the
+  Redis at REDIS_URL, one round trip per request. Falls back to
+  sliding_window when REDIS_URL is not set.
+
+Limits are expressed as requests per window (RATE_LIMIT_WINDOW seconds).
+"""
+
+import logging
+import math
+import time
+from dataclasses import dataclass
+
+import redis
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_PREFIX = 'ratelimit'
+
+
+@dataclass(frozen=True)
+class RateLimitResult:
+    allowed: bool
+    limit: int
+    remaining: int
+    reset: int        # seconds until the current window (or bucket) resets
+    retry_after: int  # seconds to wait before retrying (0 when allowed)
+
+    def headers(self):
+        headers = {
+            'X-RateLimit-Limit': str(self.limit),
+            'X-RateLimit-Remaining': str(self.remaining),
+            'X-RateLimit-Reset': str(self.reset),
+        }
+        if not self.allowed:
+            headers['Retry-After'] = str(self.retry_after)
+        return headers
+
+
+class SlidingWindowLimiter:
+    """
+    Counts hits in the current fixed window and weighs the previous
+    window's count by how much of it still overlaps the sliding window
+    """
+
+    def __init__(self, window):
+        self.window = window
+        # Counts of the previous window are final, so each process reads
+        # them once per identity instead of on every hit
+        self.previous_window = None
+        self.previous_counts = {}
+
+    def _previous_count(self, identity, current):
+        if self.previous_window != current - 1:
+            self.previous_counts = {}
+            self.previous_window = current - 1
+        count = self.previous_counts.get(identity)
+        if count is None:
+            count = self.previous_counts[identity] = cache.get(
+                f'{RATE_LIMIT_PREFIX}:{identity}:{current - 1}', 0
+            )
+        return count
+
+    def _increment(self, key):
+        try:
+            return cache.incr(key)
+        except ValueError:
+            # First hit of the window; the counter lives for two windows so
+            # the next window can still read it as its previous one
+            if cache.add(key, 1, self.window * 2):
+                return 1
+            return cache.incr(key)
+
+    def hit(self, identity, limit):
+        now = time.time()
+        current = int(now // self.window)
+        elapsed = now - current * self.window
+        key = f'{RATE_LIMIT_PREFIX}:{identity}:{current}'
+
+        count = self._increment(key)
+        previous = self._previous_count(identity, current)
+        weight = (self.window - elapsed) / self.window
+        estimated = previous * weight + count
+
+        if estimated <= limit:
+            return RateLimitResult(
+                allowed=True,
+                limit=limit,
+                remaining=max(0, math.floor(limit - estimated)),
+                reset=math.ceil(self.window - elapsed),
+                retry_after=0,
+            )
+
+        # Rejected hits are not counted, so a client that keeps retrying
+        # is let back in as soon as the window slides far enough
+        count = cache.decr(key)
+        if count >= limit or not previous:
+            retry_after = self.window - elapsed
+        else:
+            # Wait until the previous window's weight has decayed enough to
+            # fit one more hit: previous * weight + count + 1 <= limit
+            retry_after = self.window * (1 - (limit - count - 1) / previous) - elapsed
+
+        return RateLimitResult(
+            allowed=False,
+            limit=limit,
+            remaining=0,
+            reset=math.ceil(self.window - elapsed),
+            retry_after=max(1, math.ceil(retry_after)),
+        )
+
+
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+return {allowed, tostring(tokens)}
+"""
+
+
+class TokenBucketLimiter:
+    """
+    Bucket of `limit` tokens refilled at limit / window per second; the
+    read-refill-take runs atomically inside Redis
+    """
+
+    def __init__(self, window, redis_url=None):
+        self.window = window
+        # Own connection pool on the cache's Redis; connects on first use
+        self.client = redis.Redis.from_url(redis_url or settings.REDIS_URL)
+        self.script = self.client.register_script(TOKEN_BUCKET_SCRIPT)
+
+    def hit(self, identity, limit):
+        key = cache.make_and_validate_key(f'{RATE_LIMIT_PREFIX}:tb:{identity}')
+        rate = limit / self.window
+        allowed, tokens = self.script(keys=[key], args=[limit, rate, time.time()])
+        tokens = float(tokens)
+
+        return RateLimitResult(
+            allowed=bool(allowed),
+            limit=limit,
+            remaining=math.floor(tokens),
+            reset=math.ceil((limit - tokens) / rate),
+            retry_after=0 if allowed else max(1, math.ceil((1 - tokens) / rate)),
+        )
+
+
+LIMITERS = {
+    'sliding_window': SlidingWindowLimiter,
+    'token_bucket': TokenBucketLimiter,
+}
+
+
+def get_limiter(algorithm=None, window=None):
+    algorithm = algorithm or settings.RATE_LIMIT_ALGORITHM
+    window = window or settings.RATE_LIMIT_WINDOW
+
+    if algorithm not in LIMITERS:
+        raise ValueError(f"Unknown rate limit algorithm: {algorithm}")
+    if algorithm == 'token_bucket' and not settings.REDIS_URL:
+        logger.warning("token_bucket rate limiting needs REDIS_URL; using sliding_window")
+        algorithm = 'sliding_window'
+
+    return LIMITERS[algorithm](window)
@@ -0,0 +1,303 @@
+"""
+Full-text search backends for the catalog
+
+Every product keeps a precomputed, accent-folded ``documento_busca`` with
+its name, description, category, manufacturer and (for capas/películas)
+the compatible phone brands and models. The backend decides how that
+document is indexed and queried:
+
+- PostgresSearchBackend: ``portuguese`` tsvector GIN index plus a trigram
+  index for typo tolerance, ranked with ts_rank + word similarity
+- SqliteSearchBackend: FTS5 table with a light Portuguese stemmer, ranked
+  with bm25
+- BasicSearchBackend: icontains over the document, for other databases
+"""
+
+import re
+import unicodedata
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+
+TIPO_NORMAL = 'normal'
+TIPO_CAPA = 'capa_pelicula'
+
+FTS_TABLE = 'catalog_produto_busca_fts'
+
+# (suffix, replacement) pairs for plural reduction, checked in order
+PT_PLURAL_SUFFIXES = (
+    ('oes', 'ao'), ('aes', 'ao'), ('ais', 'al'), ('eis', 'el'), ('ois', 'ol'),
+    ('ns', 'm'), ('res', 'r'), ('zes', 'z'), ('ses', 's'), ('s', ''),
+)
+
+
+def fold_text(text):
+    """
+    Lowercase and strip accents ("Película" -> "pelicula")
+    """
+    normalized = unicodedata.normalize('NFKD', text or '')
+    return ''.join(c for c in normalized if not unicodedata.combining(c)).lower()
+
+
+def tokenize(text):
+    return re.findall(r'\w+', fold_text(text))
+
+
+def stem_pt(token):
+    """
+    Light Portuguese stemmer: plural and gender reduction only
+    """
+    if len(token) <= 3:
+        return token
+    for suffix, replacement in PT_PLURAL_SUFFIXES:
+        if token.endswith(suffix):
+            token = token[:-len(suffix)] + replacement
+            break
+    if len(token) > 3 and token[-1] in 'aoe':
+        token = token[:-1]
+    return token
+
+
+def build_search_document(produto):
+    """
+    Folded search text for a product; capas include the brand and model
+    names of their active PrecoModelo rows
+    """
+    parts = [produto.nome, produto.descricao, produto.categoria.nome, produto.fabricante]
+
+    if hasattr(produto, 'precomodelo_set'):
+        for preco in produto.precomodelo_set.all():
+            if preco.ativo:
+                parts.extend([preco.modelo.marca.nome, preco.modelo.nome])
+
+    seen = set()
+    unique_parts = []
+    for part in parts:
+        if part and part not in seen:
+            seen.add(part)
+            unique_parts.append(part)
+
+    return fold_text(' '.join(unique_parts))
+
+
+class BaseSearchBackend:
+    """
+    Search backend interface
+    """
+
+    def filter(self, queryset, query, tipo):
+        """
+        Restrict queryset to products matching query, annotated with a
+        ``search_rank`` float where higher means more relevant
+        """
+        raise NotImplementedError
+
+    def index(self, tipo, documents):
+        """
+        Store (produto_id, documento) pairs in the backend's own index
+        """
+
+    def remove(self, tipo, produto_ids):
+        """
+        Drop products from the backend's own index
+        """
+
+    def rebuild(self, documents_by_tipo):
+        """
+        Replace the backend's own index with the given documents
+        """
+
+
+class BasicSearchBackend(BaseSearchBackend):
+    """
+    Substring search over the precomputed document (one column, no joins)
+    """
+
+    def filter(self, queryset, query, tipo):
+        for token in tokenize(query):
+            queryset = queryset.filter(documento_busca__contains=token)
+        return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """
+    PostgreSQL full-text search with trigram fallback for typos
+    """
+
+    config = 'portuguese'
+
+    def vector(self):
+        from django.contrib.postgres.search import SearchVector
+        return SearchVector('documento_busca', config=self.config)
+
+    def filter(self, queryset, query, tipo):
+        from django.contrib.postgres.search import (
+            SearchQuery, SearchRank, TrigramWordSimilarity
+        )
+
+        tokens = tokenize(query)
+        if not tokens:
+            return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+        # Prefix match on every token so partial words typed in the search
+        # bar already find products
+        search_query = SearchQuery(
+            ' & '.join(f'{token}:*' for token in tokens),
+            config=self.config,
+            search_type='raw',
+        )
+        folded = ' '.join(tokens)
+
+        # The vector expression matches the GIN index built in migrations
+        return queryset.alias(
+            search_vector=self.vector(),
+        ).annotate(
+            search_rank=(
+                SearchRank(F('search_vector'), search_query) +
+                TrigramWordSimilarity(folded, 'documento_busca')
+            ),
+        ).filter(
+            Q(search_vector=search_query) |
+            Q(documento_busca__trigram_word_similar=folded)
+        )
+
+
+class SqliteSearchBackend(BaseSearchBackend):
+    """
+    SQLite FTS5 search with a light Portuguese stemmer.
+
+    Rows are keyed by rowid = produto_id * 2 + tipo offset so both product
+    tables share one FTS table and updates are rowid lookups.
+    """
+
+    offsets = {TIPO_NORMAL: 0, TIPO_CAPA: 1}
+
+    def match_expression(self, query):
+        tokens = [stem_pt(token) for token in tokenize(query)]
+        return ' '.join(f'"{token}"*' for token in tokens)
+
+    def filter(self, queryset, query, tipo):
+        match = self.match_expression(query)
+        if not match:
+            return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+        offset = self.offsets[tipo]
+        table = queryset.model._meta.db_table
+
+        matching_ids = RawSQL(
+            f'SELECT rowid / 2 FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid %% 2 = %s',
+            (match, offset),
+        )
+        # bm25() is lower-is-better; negate so higher means more relevant
+        rank = RawSQL(
+            f'SELECT -bm25({FTS_TABLE}) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid = "{table}"."id" * 2 + %s',
+            (match, offset),
+            output_field=FloatField(),
+        )
+        return queryset.filter(id__in=matching_ids).annotate(search_rank=rank)
+
+    def _rows(self, tipo, documents):
+        offset = self.offsets[tipo]
+        return [
+            (produto_id * 2 + offset, ' '.join(stem_pt(token) for token in tokenize(documento)))
+            for produto_id, documento in documents
+        ]
+
+    def index(self, tipo, documents):
+        rows = self._rows(tipo, documents)
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(rowid,) for rowid, _ in rows])
+            cursor.executemany(f'INSERT INTO {FTS_TABLE} (rowid, documento) VALUES (%s, %s)', rows)
+
+    def remove(self, tipo, produto_ids):
+        offset = self.offsets[tipo]
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                [(produto_id * 2 + offset,) for produto_id in produto_ids]
+            )
+
+    def rebuild(self, documents_by_tipo):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        for tipo, documents in documents_by_tipo.items():
+            self.index(tipo, documents)
+
+
+VENDOR_BACKENDS = {
+    'postgresql': PostgresSearchBackend,
+    'sqlite': SqliteSearchBackend,
+}
+
+_backend = None
+
+
+def get_search_backend():
+    """
+    Backend from settings.CATALOG_SEARCH_BACKEND (dotted path), or the
+    best one for the current database vendor
+    """
+    global _backend
+    if _backend is None:
+        backend_path = getattr(settings, 'CATALOG_SEARCH_BACKEND', '')
+        if backend_path:
+            backend_class = import_string(backend_path)
+        else:
+            backend_class = VENDOR_BACKENDS.get(connection.vendor, BasicSearchBackend)
+        _backend = backend_class()
+    return _backend
+
+
+def _product_models():
+    from .models import ProdutoNormal, ProdutoCapaPelicula
+    return {TIPO_NORMAL: ProdutoNormal, TIPO_CAPA: ProdutoCapaPelicula}
+
+
+def _documents(model, queryset):
+    queryset = queryset.select_related('categoria')
+    if hasattr(model, 'precomodelo_set'):
+        queryset = queryset.prefetch_related('precomodelo_set__modelo__marca')
+
+    produtos = list(queryset)
+    for produto in produtos:
+        produto.documento_busca = build_search_document(produto)
+    model.objects.bulk_update(produtos, ['documento_busca'], batch_size=500)
+    return [(produto.id, produto.documento_busca) for produto in produtos]
+
+
+def index_products(tipo, produto_ids):
+    """
+    Recompute and index the search documents of the given products
+    """
+    produto_ids = list(produto_ids)
+    if not produto_ids:
+        return
+    model = _product_models()[tipo]
+    documents = _documents(model, model.objects.filter(id__in=produto_ids))
+    get_search_backend().index(tipo, documents)
+
+
+def remove_products(tipo, produto_ids):
+    get_search_backend().remove(tipo, list(produto_ids))
+
+
+def rebuild_search_index(batch_size=500):
+    """
+    Recompute every product document and rebuild the backend index
+    """
+    documents_by_tipo = {}
+    for tipo, model in _product_models().items():
+        ids = list(model.objects.order_by('id').values_list('id', flat=True))
+        documents = []
+        for start in range(0, len(ids), batch_size):
+            documents += _documents(model, model.objects.filter(id__in=ids[start:start + batch_size]))
+        documents_by_tipo[tipo] = documents
+
+    get_search_backend().rebuild(documents_by_tipo)
+    return sum(len(documents) for documents in documents_by_tipo.values())
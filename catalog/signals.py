@@ -0,0 +1,137 @@
+"""
+Signal handlers for the catalog app
+"""
+
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import (
+    Categoria, ProdutoNormal, ProdutoCapaPelicula, ImagemProduto,
+    MarcaCelular, ModeloCelular, PrecoModelo, ConfiguracaoWebhook
+)
+from .search_utils import TIPO_NORMAL, TIPO_CAPA, index_products, remove_products
+from .cache_utils import (
+    WEBHOOK_TAG, invalidate_product_cache, invalidate_category_cache, invalidate_tags
+)
+
+
+def _produtos_afetados(instance):
+    """
+    Product of a PrecoModelo, plus the one it was moved from
+    """
+    produto_ids = {instance.produto_id}
+    anterior = getattr(instance, '_produto_id_anterior', None)
+    if anterior is not None:
+        produto_ids.add(anterior)
+    return produto_ids
+
+
+@receiver(pre_save, sender=PrecoModelo)
+def guardar_produto_anterior(sender, instance, raw=False, **kwargs):
+    """
+    Remember the current product of an existing PrecoModelo, so a move to
+    another product also refreshes the one it leaves
+    """
+    instance._produto_id_anterior = None
+    if instance.pk and not raw:
+        instance._produto_id_anterior = PrecoModelo.objects.filter(
+            pk=instance.pk
+        ).values_list('produto_id', flat=True).first()
+
+
+@receiver(post_save, sender=PrecoModelo)
+@receiver(post_delete, sender=PrecoModelo)
+def atualizar_range_precos(sender, instance, **kwargs):
+    """
+    Refresh the stored price range of the product a PrecoModelo belongs to
+    """
+    ProdutoCapaPelicula.objects.filter(pk__in=_produtos_afetados(instance)).atualizar_range_precos()
+
+
+@receiver(post_save, sender=PrecoModelo)
+@receiver(post_delete, sender=PrecoModelo)
+def indexar_preco_modelo(sender, instance, **kwargs):
+    index_products(TIPO_CAPA, list(_produtos_afetados(instance)))
+
+
+@receiver(post_save, sender=ProdutoNormal)
+def indexar_produto_normal(sender, instance, **kwargs):
+    index_products(TIPO_NORMAL, [instance.pk])
+
+
+@receiver(post_save, sender=ProdutoCapaPelicula)
+def indexar_produto_capa(sender, instance, **kwargs):
+    index_products(TIPO_CAPA, [instance.pk])
+
+
+@receiver(post_delete, sender=ProdutoNormal)
+def remover_produto_normal(sender, instance, **kwargs):
+    remove_products(TIPO_NORMAL, [instance.pk])
+
+
+@receiver(post_delete, sender=ProdutoCapaPelicula)
+def remover_produto_capa(sender, instance, **kwargs):
+    remove_products(TIPO_CAPA, [instance.pk])
+
+
+@receiver(post_save, sender=Categoria)
+def indexar_categoria(sender, instance, created, **kwargs):
+    """
+    Category names are part of the search document of its products
+    """
+    if created:
+        return
+    index_products(TIPO_NORMAL, instance.produtonormal_set.values_list('id', flat=True))
+    index_products(TIPO_CAPA, instance.produtocapapelicula_set.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=MarcaCelular)
+def indexar_marca(sender, instance, created, **kwargs):
+    if created:
+        return
+    index_products(TIPO_CAPA, PrecoModelo.objects.filter(
+        modelo__marca=instance
+    ).values_list('produto_id', flat=True).distinct())
+
+
+@receiver(post_save, sender=ModeloCelular)
+def indexar_modelo(sender, instance, created, **kwargs):
+    if created:
+        return
+    index_products(TIPO_CAPA, PrecoModelo.objects.filter(
+        modelo=instance
+    ).values_list('produto_id', flat=True).distinct())
+
+
+@receiver(post_save, sender=Categoria)
+@receiver(post_delete, sender=Categoria)
+def invalidar_cache_categorias(sender, **kwargs):
+    invalidate_category_cache()
+
+
+@receiver(post_save, sender=MarcaCelular)
+@receiver(post_delete, sender=MarcaCelular)
+@receiver(post_save, sender=ModeloCelular)
+@receiver(post_delete, sender=ModeloCelular)
+@receiver(post_save, sender=ProdutoNormal)
+@receiver(post_delete, sender=ProdutoNormal)
+@receiver(post_save, sender=ProdutoCapaPelicula)
+@receiver(post_delete, sender=ProdutoCapaPelicula)
+@receiver(post_save, sender=PrecoModelo)
+@receiver(post_delete, sender=PrecoModelo)
+@receiver(post_save, sender=ImagemProduto)
+@receiver(post_delete, sender=ImagemProduto)
+def invalidar_cache_produtos(sender, **kwargs):
+    """
+    Counts, suggestions and listings depend on any catalog change
+    """
+    invalidate_product_cache()
+
+
+@receiver(post_save, sender=ConfiguracaoWebhook)
+@receiver(post_delete, sender=ConfiguracaoWebhook)
+def invalidar_configuracao_webhook(sender, **kwargs):
+    """
+    Webhook configurations are cached in every web and worker process
+    """
+    invalidate_tags(WEBHOOK_TAG)
@@ -0,0 +1,230 @@
+"""
+Pre-rendered sitemaps
+
+build_sitemaps streams every section of catalog.sitemaps (querysets are
+read with .iterator(), `limit` URLs per child sitemap), writes each child
+as sitemap-<section>-<page>.xml.gz plus a plain sitemap.xml index into
+SITEMAP_ROOT, and swaps files in atomically. The views then serve those
+files with ETag / Last-Modified, so a crawler costs a stat() per request
+and usually gets a 304.
+
+Each build records a signature of the database rows it was rendered from
+(sitemap.version). Once those rows change, or when no build exists, the
+views render on request and rebuild the files in a background thread of
+the web process, whose disk they are served from.
+"""
+
+import gzip
+import hashlib
+import itertools
+import logging
+import os
+import threading
+from datetime import datetime, timezone as dt_timezone
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count, Max, QuerySet
+from django.http import FileResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from .models import Categoria, ProdutoNormal, ProdutoCapaPelicula
+from .sitemaps import sitemaps
+
+logger = logging.getLogger(__name__)
+
+SITEMAP_INDEX = 'sitemap.xml'
+SITEMAP_VERSION = 'sitemap.version'
+
+# At most one background rebuild per interval (seconds) across the
+# processes sharing the cache
+REBUILD_KEY = 'sitemap_rebuild'
+REBUILD_INTERVAL = 60
+
+URLSET_OPEN = '<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+URLSET_CLOSE = '</urlset>\n'
+INDEX_OPEN = '<?xml version="1.0" encoding="UTF-8"?>\n<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+INDEX_CLOSE = '</sitemapindex>\n'
+
+
+def section_filename(section, page):
+    return f'sitemap-{section}-{page}.xml.gz'
+
+
+def _w3c_date(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.astimezone(dt_timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+    return value.isoformat()
+
+
+def _get(sitemap, name, item):
+    attr = getattr(sitemap, name, None)
+    return attr(item) if callable(attr) else attr
+
+
+def _url_entry(sitemap, item, base_url):
+    parts = [f'<url><loc>{escape(base_url + sitemap.location(item))}</loc>']
+    lastmod = _w3c_date(_get(sitemap, 'lastmod', item))
+    if lastmod:
+        parts.append(f'<lastmod>{lastmod}</lastmod>')
+    changefreq = _get(sitemap, 'changefreq', item)
+    if changefreq:
+        parts.append(f'<changefreq>{changefreq}</changefreq>')
+    priority = _get(sitemap, 'priority', item)
+    if priority is not None:
+        parts.append(f'<priority>{priority}</priority>')
+    parts.append('</url>\n')
+    return ''.join(parts), lastmod
+
+
+def _iter_pages(sitemap):
+    items = sitemap.items()
+    if isinstance(items, QuerySet):
+        items = items.iterator(chunk_size=sitemap.limit)
+    items = iter(items)
+    while True:
+        page = list(itertools.islice(items, sitemap.limit))
+        if not page:
+            return
+        yield page
+
+
+def _write_atomic(path, data, compress):
+    tmp_path = f'{path}.tmp'
+    if compress:
+        # mtime=0 keeps the bytes identical when the content is
+        with gzip.GzipFile(tmp_path, 'wb', mtime=0) as output:
+            output.write(data.encode('utf-8'))
+    else:
+        with open(tmp_path, 'w', encoding='utf-8') as output:
+            output.write(data)
+    os.replace(tmp_path, path)
+
+
+def catalog_sitemap_version():
+    """
+    Signature of the rows the sitemaps are rendered from: the active
+    categories, and the count and latest update of in-stock products of
+    each type. Read from the database rather than the cache tags so that
+    every process, and the build made at release, agree on it; edits that
+    do not touch those rows, such as model prices, leave it unchanged.
+    """
+    categorias = Categoria.objects.filter(ativo=True).order_by('ordem', 'nome').values_list('slug', flat=True)
+    parts = [','.join(categorias)]
+    for model in (ProdutoNormal, ProdutoCapaPelicula):
+        stats = model.objects.filter(em_estoque=True).aggregate(total=Count('id'), latest=Max('updated_at'))
+        parts.append(f"{stats['total']}@{stats['latest'] and stats['latest'].isoformat()}")
+    return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+
+
+def build_sitemaps(base_url, output_dir=None):
+    """
+    Render the sitemap index and every child sitemap to output_dir
+
+    Returns:
+        dict: number of URLs per section
+    """
+    output_dir = output_dir or settings.SITEMAP_ROOT
+    base_url = base_url.rstrip('/')
+    os.makedirs(output_dir, exist_ok=True)
+    # Read first: changes made during the build leave the files stale
+    version = catalog_sitemap_version()
+
+    written = {SITEMAP_INDEX, SITEMAP_VERSION}
+    index_entries = []
+    counts = {}
+    for section, sitemap_class in sitemaps.items():
+        sitemap = sitemap_class()
+        counts[section] = 0
+        for page_number, page in enumerate(_iter_pages(sitemap), start=1):
+            entries = [_url_entry(sitemap, item, base_url) for item in page]
+            filename = section_filename(section, page_number)
+            _write_atomic(
+                os.path.join(output_dir, filename),
+                URLSET_OPEN + ''.join(entry for entry, _ in entries) + URLSET_CLOSE,
+                compress=True,
+            )
+            written.add(filename)
+            counts[section] += len(entries)
+
+            lastmod = max((lastmod for _, lastmod in entries if lastmod), default=None)
+            loc = f'<sitemap><loc>{escape(f"{base_url}/{filename}")}</loc>'
+            index_entries.append(loc + (f'<lastmod>{lastmod}</lastmod>' if lastmod else '') + '</sitemap>\n')
+
+    _write_atomic(
+        os.path.join(output_dir, SITEMAP_INDEX),
+        INDEX_OPEN + ''.join(index_entries) + INDEX_CLOSE,
+        compress=False,
+    )
+    _write_atomic(os.path.join(output_dir, SITEMAP_VERSION), version, compress=False)
+
+    # Pages that no longer exist (fewer products than last time)
+    for filename in os.listdir(output_dir):
+        if filename.startswith('sitemap') and filename not in written:
+            os.remove(os.path.join(output_dir, filename))
+
+    return counts
+
+
+def sitemap_path(filename):
+    """
+    Path of a pre-rendered sitemap file, or None when it was not built or
+    the rows it lists changed since
+    """
+    path = os.path.join(settings.SITEMAP_ROOT, filename)
+    if not os.path.isfile(path):
+        return None
+    try:
+        with open(os.path.join(settings.SITEMAP_ROOT, SITEMAP_VERSION), encoding='utf-8') as marker:
+            version = marker.read()
+    except FileNotFoundError:
+        return None
+    return path if version == catalog_sitemap_version() else None
+
+
+def _rebuild(base_url):
+    try:
+        build_sitemaps(base_url)
+    except Exception:
+        logger.exception("Sitemap rebuild failed")
+    finally:
+        connection.close()
+
+
+def rebuild_sitemaps_async(base_url):
+    """
+    Rebuild the files in a background thread, unless a rebuild started
+    less than REBUILD_INTERVAL ago. SITE_URL, when set, wins over base_url
+    (the origin of the request that found the files stale).
+
+    Returns:
+        bool: whether a rebuild was started
+    """
+    if not cache.add(REBUILD_KEY, True, REBUILD_INTERVAL):
+        return False
+    threading.Thread(
+        target=_rebuild, args=(settings.SITE_URL or base_url,), name='sitemap-rebuild', daemon=True
+    ).start()
+    return True
+
+
+def sitemap_file_response(request, path, content_type):
+    """
+    Serve a pre-rendered file with validators derived from its stat()
+    """
+    stat = os.stat(path)
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    last_modified = int(stat.st_mtime)
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, public=True, max_age=settings.SITEMAP_CACHE_MAX_AGE)
+    return response
@@ -1,8 +1,14 @@
 """
 Sitemaps for PMCELL catalog
+
+/sitemap.xml is a sitemap index; each section is paged at `limit` URLs
+per child sitemap. manage.py build_sitemaps pre-renders the index and
+gzipped children to SITEMAP_ROOT (see sitemap_utils); until it has run,
+the same URLs are rendered on request.
 """
 
 from django.contrib.sitemaps import Sitemap
+from django.db.models import Max, OuterRef, Subquery
 from django.urls import reverse
 from .models import Categoria, ProdutoNormal, ProdutoCapaPelicula
 
@@ -19,48 +25,71 @@ class StaticViewSitemap(Sitemap):
         return reverse(item)
 
 
+def _latest_product_update(model):
+    return Subquery(
+        model.objects.filter(categoria=OuterRef('pk'), em_estoque=True)
+        .order_by()
+        .values('categoria')
+        .annotate(latest=Max('updated_at'))
+        .values('latest')[:1]
+    )
+
+
 class CategorySitemap(Sitemap):
     """Sitemap for categories"""
     priority = 0.7
     changefreq = 'weekly'
 
     def items(self):
-        return Categoria.objects.filter(ativo=True)
+        # Categoria has no updated_at; a category listing changes when one
+        # of its products does
+        return Categoria.objects.filter(ativo=True).annotate(
+            ultima_normal=_latest_product_update(ProdutoNormal),
+            ultima_capa=_latest_product_update(ProdutoCapaPelicula),
+        ).order_by('ordem', 'nome')
 
     def location(self, obj):
         return f"/?category={obj.slug}"
 
     def lastmod(self, obj):
-        return obj.updated_at
+        return max(filter(None, (obj.ultima_normal, obj.ultima_capa, obj.created_at)))
 
 
 class ProductSitemap(Sitemap):
-    """Sitemap for products"""
+    """Sitemap for one product type; only id and updated_at are loaded"""
     priority = 0.6
     changefreq = 'daily'
     limit = 1000
+    model = None
+    product_type = None
 
     def items(self):
-        # Get both normal products and capa/pelicula products
-        normal_products = [(p, 'normal') for p in ProdutoNormal.objects.filter(em_estoque=True)]
-        capa_products = [(p, 'capa_pelicula') for p in ProdutoCapaPelicula.objects.filter(em_estoque=True)]
-        return normal_products + capa_products
+        return self.model.objects.filter(em_estoque=True).only('id', 'updated_at').order_by('id')
 
     def location(self, item):
-        product, product_type = item
         return reverse('catalog:product_detail', kwargs={
-            'product_id': product.id,
-            'product_type': product_type
+            'product_id': item.id,
+            'product_type': self.product_type
         })
 
     def lastmod(self, item):
-        product, product_type = item
-        return product.updated_at
+        return item.updated_at
+
+
+class ProdutoNormalSitemap(ProductSitemap):
+    model = ProdutoNormal
+    product_type = 'normal'
+
+
+class ProdutoCapaSitemap(ProductSitemap):
+    model = ProdutoCapaPelicula
+    product_type = 'capa_pelicula'
 
 
 # Sitemap dictionary
 sitemaps = {
     'static': StaticViewSitemap,
     'categories': CategorySitemap,
-    'products': ProductSitemap,
-}
\ No newline at end of file
+    'products-normal': ProdutoNormalSitemap,
+    'products-capa': ProdutoCapaSitemap,
+}
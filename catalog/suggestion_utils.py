@@ -0,0 +1,153 @@
+"""
+In-memory search suggestion index
+
+Each process keeps an index of category, brand, model and product names
+so /api/search-suggestions/ answers without touching the database. The
+index is built lazily and rebuilt when the catalog cache tags are
+invalidated (see cache_utils.invalidate_product_cache) or once it is
+INDEX_MAX_AGE seconds old.
+"""
+
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+from .cache_utils import CATALOG_TAG, get_tag_versions
+from .search_utils import fold_text
+
+MAX_SUGGESTIONS = 8
+
+# (index group, suggestion type, max results), in display order
+TYPE_LIMITS = (
+    ('categoria', 'categoria', 3),
+    ('marca', 'marca', 3),
+    ('modelo', 'modelo', 2),
+    ('produto_normal', 'produto', 2),
+    ('produto_capa', 'produto', 2),
+)
+
+
+def _grams(text, size):
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+class SuggestionIndex:
+    """
+    Substring index over suggestion texts.
+
+    Entries keep the database ordering of their type. Lookups intersect
+    the trigram (or bigram, for 2-character queries) posting lists of the
+    query and verify the candidates with a plain substring check.
+    """
+
+    def __init__(self, entries):
+        # entries: iterable of (type, text); ids follow iteration order
+        self.entries = []
+        self.postings = {2: defaultdict(set), 3: defaultdict(set)}
+
+        seen = set()
+        for tipo, text in entries:
+            if not text or (tipo, text) in seen:
+                continue
+            seen.add((tipo, text))
+            entry_id = len(self.entries)
+            folded = fold_text(text)
+            self.entries.append((tipo, text, folded))
+            for size, postings in self.postings.items():
+                for gram in _grams(folded, size):
+                    postings[gram].add(entry_id)
+
+    def _candidates(self, folded):
+        size = 3 if len(folded) >= 3 else 2
+        grams = _grams(folded, size)
+        if not grams:
+            return []
+
+        postings = sorted((self.postings[size].get(gram, set()) for gram in grams), key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates &= posting
+            if not candidates:
+                break
+        return sorted(candidates)
+
+    def suggest(self, query):
+        folded = fold_text(query.strip())
+        if len(folded) < 2:
+            return []
+
+        by_type = defaultdict(list)
+        for entry_id in self._candidates(folded):
+            tipo, text, entry_folded = self.entries[entry_id]
+            if folded in entry_folded:
+                by_type[tipo].append(text)
+
+        suggestions = []
+        for group, tipo, limit in TYPE_LIMITS:
+            for text in by_type[group][:limit]:
+                suggestions.append({'text': text, 'type': tipo})
+
+        return suggestions[:MAX_SUGGESTIONS]
+
+
+def build_suggestion_index():
+    from .models import (
+        Categoria, MarcaCelular, ModeloCelular, ProdutoNormal, ProdutoCapaPelicula
+    )
+
+    def names(queryset):
+        return queryset.values_list('nome', flat=True).iterator()
+
+    entries = []
+    entries += [('categoria', nome) for nome in names(Categoria.objects.filter(ativo=True))]
+    entries += [('marca', nome) for nome in names(MarcaCelular.objects.all())]
+    entries += [
+        ('modelo', f'{marca} {nome}')
+        for marca, nome in ModeloCelular.objects.filter(ativo=True).order_by(
+            'marca__ordem', 'marca__nome', 'ordem', 'nome'
+        ).values_list('marca__nome', 'nome').iterator()
+    ]
+    entries += [('produto_normal', nome) for nome in names(ProdutoNormal.objects.filter(em_estoque=True))]
+    entries += [('produto_capa', nome) for nome in names(ProdutoCapaPelicula.objects.filter(em_estoque=True))]
+
+    return SuggestionIndex(entries)
+
+
+# Without a shared cache another process's catalog edit never bumps this
+# process's tag, so the index is also rebuilt once it is this old
+INDEX_MAX_AGE = settings.CACHE_TIMEOUT_SEARCH
+
+_index = None
+_index_version = None
+_index_built_at = 0
+_lock = threading.Lock()
+
+
+def _index_is_current(version):
+    return (_index is not None and _index_version == version
+            and time.monotonic() - _index_built_at < INDEX_MAX_AGE)
+
+
+def get_suggestion_index():
+    """
+    Process-local index, rebuilt when the shared catalog tag version changes
+    or after INDEX_MAX_AGE seconds
+    """
+    global _index, _index_version, _index_built_at
+
+    version = get_tag_versions(CATALOG_TAG)[CATALOG_TAG]
+
+    if not _index_is_current(version):
+        with _lock:
+            if not _index_is_current(version):
+                _index = build_suggestion_index()
+                _index_version = version
+                _index_built_at = time.monotonic()
+
+    return _index
+
+
+def get_search_suggestions(query):
+    return get_suggestion_index().suggest(query)
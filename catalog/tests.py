@@ -1,3 +1,1905 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, time as datetime_time
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import cloudinary
+from prometheus_client import REGISTRY
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.db.models.query import QuerySet
+from django.http import FileResponse, HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import metrics_utils
+from .analytics_utils import daily_cohorts, funnel, get_watermark, refresh_journey_summaries, session_path
+from .cache_utils import (
+    CATALOG_TAG, CATEGORY_TAG, WEBHOOK_TAG, get_or_set_tagged, get_tag_versions, get_tags_last_modified,
+    invalidate_tags, page_cache_key, tagged_key
+)
+from .cart_utils import price_cart
+from .journey_utils import MAX_EVENTS_PER_REQUEST, JourneyBuffer, days_to_prune, parse_journey_events, prune_journey_day
+from .listing_utils import SORT_OPTIONS, InvalidCursor, ProductListing, decode_cursor, encode_cursor
+from .middleware import APIPolicy, APIPolicyMiddleware
+from .models import (
+    Categoria, ProdutoNormal, ProdutoCapaPelicula, ImagemProduto, MarcaCelular, ModeloCelular, PrecoModelo, Pedido,
+    ItemPedido, CarrinhoAbandonado, JornadaCliente, EventoWebhook, User, ConfiguracaoWebhook, JornadaDiaria,
+    FunilDiario
+)
+from .order_utils import CheckoutError, place_order
+from .perf_utils import seed_catalog, timing_summary, write_report
+from .ratelimit_utils import RATE_LIMIT_PREFIX, SlidingWindowLimiter, TokenBucketLimiter, get_limiter
+from .search_utils import TIPO_NORMAL, TIPO_CAPA, BasicSearchBackend, get_search_backend, stem_pt, tokenize
+from .sitemap_utils import build_sitemaps, rebuild_sitemaps_async
+from .suggestion_utils import INDEX_MAX_AGE, MAX_SUGGESTIONS, TYPE_LIMITS, SuggestionIndex, get_search_suggestions
+from .webhook_utils import (
+    CONFIG_MAX_AGE, WebhookTransport, backoff_delay, claim_webhook_events, enqueue_webhook, get_webhook_configs,
+    process_webhook_batch, record_delivery
+)
+
+
+class ListingOrderTests(TestCase):
+    """
+    The database listing keeps the sort orders of the former in-memory
+    one, including the price fallback of capas without prices, and its
+    filters exclude rows
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        acessorios = Categoria.objects.create(nome='Acessorios', slug='acessorios')
+        protecao = Categoria.objects.create(nome='Protecao', slug='protecao')
+
+        def normal(nome, preco, categoria, em_estoque=True):
+            return ProdutoNormal.objects.create(
+                nome=nome, slug=nome.lower().replace(' ', '-'), descricao='Acessório', categoria=categoria,
+                preco_atacado=Decimal(preco), preco_super_atacado=Decimal(preco) - 1, em_estoque=em_estoque,
+            )
+
+        def capa(nome):
+            return ProdutoCapaPelicula.objects.create(
+                nome=nome, slug=nome.lower().replace(' ', '-'), descricao='Proteção', categoria=protecao,
+            )
+
+        produtos = [
+            normal('Cabo USB', 10, acessorios),
+            normal('Adaptador', 25, acessorios),
+            normal('Suporte', 7, protecao),
+            normal('Fone', 5, acessorios, em_estoque=False),
+            capa('Capa Silicone'),
+            capa('Pelicula Vidro'),
+            capa('Capa Couro'),
+        ]
+        apple = MarcaCelular.objects.create(nome='Apple', slug='apple')
+        samsung = MarcaCelular.objects.create(nome='Samsung', slug='samsung')
+        iphone = ModeloCelular.objects.create(marca=apple, nome='iPhone 15', slug='iphone-15')
+        galaxy = ModeloCelular.objects.create(marca=samsung, nome='Galaxy S24', slug='galaxy-s24')
+        for produto, modelo, preco in ((produtos[4], iphone, 15), (produtos[4], galaxy, 20), (produtos[5], galaxy, 3)):
+            PrecoModelo.objects.create(
+                produto=produto, modelo=modelo, preco_atacado=Decimal(preco), preco_super_atacado=Decimal(preco) - 1,
+            )
+        cls.names = {
+            ('normal' if isinstance(produto, ProdutoNormal) else 'capa_pelicula', produto.id): produto.nome
+            for produto in produtos
+        }
+
+    def listed(self, **kwargs):
+        return [self.names[(row['tipo'], row['id'])] for row in ProductListing(**kwargs).queryset()]
+
+    def test_sort_orders(self):
+        by_name = ['Adaptador', 'Cabo USB', 'Capa Couro', 'Capa Silicone', 'Pelicula Vidro', 'Suporte']
+        expected = {
+            'name': by_name,
+            'name_desc': by_name[::-1],
+            # Capas without prices sort as 9999 ascending and 0 descending
+            'price_asc': ['Pelicula Vidro', 'Suporte', 'Cabo USB', 'Capa Silicone', 'Adaptador', 'Capa Couro'],
+            'price_desc': ['Adaptador', 'Capa Silicone', 'Cabo USB', 'Suporte', 'Pelicula Vidro', 'Capa Couro'],
+            # Ties by type (capas first), then by id
+            'category': ['Cabo USB', 'Adaptador', 'Capa Silicone', 'Pelicula Vidro', 'Capa Couro', 'Suporte'],
+        }
+        for sort_by, names in expected.items():
+            with self.subTest(sort_by=sort_by):
+                self.assertEqual(self.listed(sort_by=sort_by), names)
+
+    def test_filters(self):
+        self.assertEqual(
+            self.listed(category_filter='protecao'), ['Capa Couro', 'Capa Silicone', 'Pelicula Vidro', 'Suporte']
+        )
+        self.assertEqual(self.listed(search_query='usb'), ['Cabo USB'])
+        # Capas match the brands and models they are priced for
+        self.assertEqual(self.listed(search_query='iphone'), ['Capa Silicone'])
+        self.assertEqual(self.listed(search_query='galaxy', sort_by='price_asc'), ['Pelicula Vidro', 'Capa Silicone'])
+        self.assertEqual(self.listed(search_query='galaxy', category_filter='acessorios'), [])
+
+
+class CursorPaginationTests(TestCase):
+    """
+    Keyset pages walk the listing in the same order as the offset
+    paginator, without gaps or repeats, and cursors cannot be forged
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        categorias = Categoria.objects.bulk_create([
+            Categoria(nome=f'Categoria {i}', slug=f'categoria-{i}') for i in range(3)
+        ])
+        # Few distinct names and prices, so ties on the sort key span
+        # pages and both product types
+        ProdutoNormal.objects.bulk_create([
+            ProdutoNormal(
+                nome=f'Produto {i % 7}', slug=f'cabo-{i}', descricao='Cabo', categoria=categorias[i % 3],
+                preco_atacado=Decimal(i % 5 + 1), preco_super_atacado=Decimal(i % 5),
+            )
+            for i in range(30)
+        ])
+        capas = ProdutoCapaPelicula.objects.bulk_create([
+            ProdutoCapaPelicula(nome=f'Produto {i % 7}', slug=f'capa-{i}', descricao='Capa', categoria=categorias[i % 3])
+            for i in range(25)
+        ])
+        marca = MarcaCelular.objects.create(nome='Samsung', slug='samsung')
+        modelo = ModeloCelular.objects.create(marca=marca, nome='Galaxy', slug='galaxy')
+        PrecoModelo.objects.bulk_create([
+            PrecoModelo(produto=capa, modelo=modelo, preco_atacado=Decimal(i % 5 + 1), preco_super_atacado=Decimal(1))
+            for i, capa in enumerate(capas[:15])
+        ])
+        ProdutoCapaPelicula.objects.all().atualizar_range_precos()
+
+    def setUp(self):
+        cache.clear()
+
+    def walk(self, listing, limit):
+        cards, cursor = listing.after(limit=limit)
+        seen = [(card.tipo, card.id) for card in cards]
+        while cursor:
+            cards, cursor = listing.after(cursor, limit=limit)
+            seen += [(card.tipo, card.id) for card in cards]
+        return seen
+
+    def test_keyset_pages_match_offset_order(self):
+        for sort_by in ('name', 'name_desc', 'price_asc', 'price_desc', 'category'):
+            with self.subTest(sort_by=sort_by):
+                listing = ProductListing(sort_by=sort_by)
+                expected = [(row['tipo'], row['id']) for row in listing.queryset()]
+                self.assertEqual(len(expected), 55)
+                for limit in (1, 7, 20, 55):
+                    self.assertEqual(self.walk(listing, limit), expected)
+
+    def test_last_page_has_no_cursor(self):
+        cards, cursor = ProductListing().after(limit=55)
+        self.assertEqual(len(cards), 55)
+        self.assertIsNone(cursor)
+
+    def test_cursor_round_trip(self):
+        row = {'sort_key': Decimal('12.50'), 'tipo': 'capa_pelicula', 'id': 7}
+        cursor = encode_cursor('price_asc', row)
+        self.assertEqual(decode_cursor(cursor, 'price_asc'), (Decimal('12.50'), 'capa_pelicula', 7))
+
+    def test_tampered_cursor_is_rejected(self):
+        cursor = encode_cursor('name', {'sort_key': 'Produto 3', 'tipo': 'normal', 'id': 4})
+        for bad in (cursor[:-2] + 'xx', 'not-a-cursor', ''.join(reversed(cursor))):
+            with self.assertRaises(InvalidCursor):
+                decode_cursor(bad, 'name')
+        # A cursor only continues the sort order it was issued for
+        with self.assertRaises(InvalidCursor):
+            decode_cursor(cursor, 'price_asc')
+
+    def test_load_more_rejects_invalid_cursor(self):
+        response = self.client.get(reverse('catalog:load_more_products'), {'cursor': 'forged', 'sort': 'name'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_count_is_cached_per_catalog_version(self):
+        listing = ProductListing(category_filter='categoria-0')
+        self.assertEqual(listing.count(), 19)
+        with self.assertNumQueries(0):
+            self.assertEqual(ProductListing(category_filter='categoria-0', sort_by='price_desc').count(), 19)
+
+        ProdutoNormal.objects.create(
+            nome='Novo', slug='novo', descricao='Cabo', categoria=Categoria.objects.get(slug='categoria-0'),
+            preco_atacado=Decimal('1'), preco_super_atacado=Decimal('1'),
+        )
+        self.assertEqual(listing.count(), 20)
+
+
+class PriceRangeSyncTests(TestCase):
+    """
+    The stored price range of a capa follows its active PrecoModelo rows
+    through saves, deletes and the bulk queryset paths
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        categoria = Categoria.objects.create(nome='Capas', slug='capas')
+        marca = MarcaCelular.objects.create(nome='Samsung', slug='samsung')
+        cls.modelos = ModeloCelular.objects.bulk_create([
+            ModeloCelular(marca=marca, nome=f'Galaxy {i}', slug=f'galaxy-{i}') for i in range(4)
+        ])
+        cls.capa = ProdutoCapaPelicula.objects.create(nome='Capa A', slug='capa-a', descricao='Capa', categoria=categoria)
+        cls.outra = ProdutoCapaPelicula.objects.create(nome='Capa B', slug='capa-b', descricao='Capa', categoria=categoria)
+
+    def preco(self, produto, modelo, atacado, super_atacado, **kwargs):
+        return PrecoModelo.objects.create(
+            produto=produto, modelo=self.modelos[modelo],
+            preco_atacado=Decimal(atacado), preco_super_atacado=Decimal(super_atacado), **kwargs
+        )
+
+    def assertRange(self, produto, atacado, super_atacado, modelos):
+        produto.refresh_from_db()
+        self.assertEqual(
+            (produto.preco_atacado_min, produto.preco_atacado_max,
+             produto.preco_super_atacado_min, produto.preco_super_atacado_max, produto.modelos_ativos),
+            (*[Decimal(v) if v is not None else None for v in (*atacado, *super_atacado)], modelos),
+        )
+
+    def test_save_and_delete(self):
+        self.preco(self.capa, 0, '20', '15')
+        barato = self.preco(self.capa, 1, '12', '9')
+        self.assertRange(self.capa, ('12', '20'), ('9', '15'), 2)
+
+        barato.delete()
+        self.assertRange(self.capa, ('20', '20'), ('15', '15'), 1)
+
+    def test_inactive_prices_are_ignored(self):
+        self.preco(self.capa, 0, '20', '15')
+        self.preco(self.capa, 1, '5', '4', ativo=False)
+        self.assertRange(self.capa, ('20', '20'), ('15', '15'), 1)
+
+    def test_move_to_another_product_refreshes_both(self):
+        self.preco(self.capa, 0, '20', '15')
+        movido = self.preco(self.capa, 1, '12', '9')
+
+        movido.produto = self.outra
+        movido.save()
+        self.assertRange(self.capa, ('20', '20'), ('15', '15'), 1)
+        self.assertRange(self.outra, ('12', '12'), ('9', '9'), 1)
+
+    def test_queryset_update(self):
+        self.preco(self.capa, 0, '20', '15')
+        self.preco(self.capa, 1, '12', '9')
+
+        PrecoModelo.objects.filter(produto=self.capa).update(preco_atacado=Decimal('30'))
+        self.assertRange(self.capa, ('30', '30'), ('9', '15'), 2)
+
+        PrecoModelo.objects.filter(produto=self.capa).update(produto=self.outra)
+        self.assertRange(self.capa, (None, None), (None, None), 0)
+        self.assertRange(self.outra, ('30', '30'), ('9', '15'), 2)
+
+    def test_bulk_create_and_bulk_update(self):
+        precos = PrecoModelo.objects.bulk_create([
+            PrecoModelo(produto=self.capa, modelo=self.modelos[i], preco_atacado=Decimal(10 + i),
+                        preco_super_atacado=Decimal(5 + i))
+            for i in range(3)
+        ])
+        self.assertRange(self.capa, ('10', '12'), ('5', '7'), 3)
+
+        precos[0].ativo = False
+        precos[1].produto = self.outra
+        PrecoModelo.objects.bulk_update(precos, ['ativo', 'produto'])
+        self.assertRange(self.capa, ('12', '12'), ('7', '7'), 1)
+        self.assertRange(self.outra, ('11', '11'), ('6', '6'), 1)
+
+
+class SearchBackendTests(TestCase):
+    """
+    Accent and plural folding, prefix matching, brand/model search on
+    capas, ranking and index maintenance of the search backends
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.categoria = Categoria.objects.create(nome='Acessórios', slug='acessorios')
+        cls.cabo = ProdutoNormal.objects.create(
+            nome='Cabo USB-C Reforçado', slug='cabo', descricao='Cabo de carregamento rápido',
+            categoria=cls.categoria, fabricante='Baseus',
+            preco_atacado=Decimal('10'), preco_super_atacado=Decimal('8'),
+        )
+        cls.fone = ProdutoNormal.objects.create(
+            nome='Fone Bluetooth', slug='fone', descricao='Acompanha cabo USB-C',
+            categoria=cls.categoria, preco_atacado=Decimal('30'), preco_super_atacado=Decimal('25'),
+        )
+        cls.pelicula = ProdutoCapaPelicula.objects.create(
+            nome='Película 3D', slug='pelicula', descricao='Vidro temperado', categoria=cls.categoria,
+        )
+        marca = MarcaCelular.objects.create(nome='Motorola', slug='motorola')
+        modelo = ModeloCelular.objects.create(marca=marca, nome='Moto G84', slug='moto-g84')
+        PrecoModelo.objects.create(
+            produto=cls.pelicula, modelo=modelo, preco_atacado=Decimal('5'), preco_super_atacado=Decimal('4'),
+        )
+
+    def search(self, query, model=ProdutoNormal, tipo=TIPO_NORMAL):
+        return list(get_search_backend().filter(model.objects.all(), query, tipo).values_list('id', flat=True))
+
+    def test_stemmer_and_folding(self):
+        self.assertEqual(tokenize('Películas Reforçadas!'), ['peliculas', 'reforcadas'])
+        self.assertEqual(stem_pt('peliculas'), stem_pt('pelicula'))
+        self.assertEqual(stem_pt('carregadores'), stem_pt('carregador'))
+        self.assertEqual(stem_pt('usb'), 'usb')
+
+    def test_accents_plurals_and_prefixes(self):
+        self.assertEqual(self.search('reforcado'), [self.cabo.id])
+        self.assertEqual(self.search('películas', ProdutoCapaPelicula, TIPO_CAPA), [self.pelicula.id])
+        self.assertEqual(self.search('bluet'), [self.fone.id])
+        self.assertEqual(self.search('baseus cabo'), [self.cabo.id])
+        self.assertEqual(self.search('inexistente'), [])
+
+    def test_capas_match_brand_and_model(self):
+        self.assertEqual(self.search('moto g84', ProdutoCapaPelicula, TIPO_CAPA), [self.pelicula.id])
+
+    def test_relevance_ranks_name_matches_first(self):
+        listing = ProductListing(search_query='cabo usb', sort_by='relevance')
+        ids = [row['id'] for row in listing.queryset()]
+        self.assertEqual(ids, [self.cabo.id, self.fone.id])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.cabo.nome = 'Carregador Turbo'
+        self.cabo.save()
+        self.assertEqual(self.search('turbo'), [self.cabo.id])
+        self.assertNotIn(self.cabo.id, self.search('reforcado'))
+
+        self.fone.delete()
+        self.assertEqual(self.search('bluetooth'), [])
+
+    def test_basic_backend(self):
+        queryset = BasicSearchBackend().filter(ProdutoNormal.objects.all(), 'Reforçado cabo', TIPO_NORMAL)
+        self.assertEqual(list(queryset.values_list('id', flat=True)), [self.cabo.id])
+
+
+class SuggestionIndexTests(TestCase):
+    """
+    Substring lookups of the in-memory suggestion index, grouped and
+    capped by type, and its rebuild on catalog changes
+    """
+
+    def test_substring_match_is_accent_insensitive(self):
+        index = SuggestionIndex([('produto_normal', 'Película 3D'), ('produto_normal', 'Cabo USB')])
+        self.assertEqual(index.suggest('pelic'), [{'text': 'Película 3D', 'type': 'produto'}])
+        self.assertEqual(index.suggest('LÍCU'), [{'text': 'Película 3D', 'type': 'produto'}])
+        self.assertEqual(index.suggest('usb'), [{'text': 'Cabo USB', 'type': 'produto'}])
+        # Two characters use the bigram postings
+        self.assertEqual(index.suggest('3d'), [{'text': 'Película 3D', 'type': 'produto'}])
+        self.assertEqual(index.suggest('x'), [])
+        self.assertEqual(index.suggest('cabox'), [])
+
+    def test_grouping_order_and_limits(self):
+        index = SuggestionIndex(
+            [('produto_normal', f'Samsung carregador {i}') for i in range(5)] +
+            [('modelo', f'Samsung Galaxy {i}') for i in range(5)] +
+            [('marca', 'Samsung')] +
+            [('categoria', 'Capas Samsung')]
+        )
+        suggestions = index.suggest('samsung')
+        self.assertEqual([s['type'] for s in suggestions], ['categoria', 'marca', 'modelo', 'modelo', 'produto', 'produto'])
+        # Each type keeps its input (database) order
+        self.assertEqual([s['text'] for s in suggestions[2:4]], ['Samsung Galaxy 0', 'Samsung Galaxy 1'])
+
+    def test_total_is_capped(self):
+        index = SuggestionIndex(
+            [(group, f'Item {group} {i}') for group, _, _ in TYPE_LIMITS for i in range(5)]
+        )
+        self.assertEqual(len(index.suggest('item')), MAX_SUGGESTIONS)
+
+    def test_duplicates_are_dropped(self):
+        index = SuggestionIndex([('marca', 'Apple'), ('marca', 'Apple')])
+        self.assertEqual(len(index.suggest('apple')), 1)
+
+    def test_endpoint_follows_catalog_changes(self):
+        cache.clear()
+        categoria = Categoria.objects.create(nome='Cabos', slug='cabos')
+        url = reverse('catalog:search_suggestions')
+        self.assertEqual(self.client.get(url, {'q': 'turbo'}).json(), {'suggestions': []})
+
+        produto = ProdutoNormal.objects.create(
+            nome='Carregador Turbo', slug='turbo', descricao='Carregador', categoria=categoria,
+            preco_atacado=Decimal('10'), preco_super_atacado=Decimal('8'),
+        )
+        self.assertEqual(
+            self.client.get(url, {'q': 'turbo'}).json()['suggestions'],
+            [{'text': 'Carregador Turbo', 'type': 'produto'}],
+        )
+
+        produto.em_estoque = False
+        produto.save()
+        self.assertEqual(self.client.get(url, {'q': 'turbo'}).json(), {'suggestions': []})
+
+    def test_index_expires_without_tag_change(self):
+        cache.clear()
+        categoria = Categoria.objects.create(nome='Cabos', slug='cabos')
+        now = time.monotonic()
+        with mock.patch('catalog.suggestion_utils.time.monotonic', return_value=now):
+            self.assertEqual(get_search_suggestions('turbo'), [])
+            # Edited by another process: this process's tag does not move
+            ProdutoNormal.objects.bulk_create([ProdutoNormal(
+                nome='Carregador Turbo', slug='turbo', descricao='Carregador', categoria=categoria,
+                preco_atacado=Decimal('10'), preco_super_atacado=Decimal('8'),
+            )])
+            self.assertEqual(get_search_suggestions('turbo'), [])
+        with mock.patch('catalog.suggestion_utils.time.monotonic', return_value=now + INDEX_MAX_AGE):
+            self.assertEqual(get_search_suggestions('turbo'), [{'text': 'Carregador Turbo', 'type': 'produto'}])
+
+
+class CacheTagTests(TestCase):
+    """
+    Tag-versioned cache entries stop being read once a tag is invalidated,
+    and catalog edits bump each affected tag exactly once
+    """
+
+    def setUp(self):
+        cache.clear()
+
+    def test_invalidated_entries_are_recomputed(self):
+        values = iter(['primeiro', 'segundo'])
+        get = lambda: get_or_set_tagged('chave', [CATALOG_TAG], lambda: next(values), 60)
+        self.assertEqual(get(), 'primeiro')
+        self.assertEqual(get(), 'primeiro')
+
+        invalidate_tags(CATALOG_TAG)
+        self.assertEqual(get(), 'segundo')
+
+    def test_other_tags_are_untouched(self):
+        get_or_set_tagged('categorias', [CATEGORY_TAG], lambda: 'cacheado', 60)
+        invalidate_tags(CATALOG_TAG)
+        self.assertEqual(get_or_set_tagged('categorias', [CATEGORY_TAG], lambda: 'novo', 60), 'cacheado')
+
+    def test_evicted_version_does_not_revive_old_entries(self):
+        antigo = tagged_key('chave', CATALOG_TAG)
+        cache.set(antigo, 'antigo')
+        cache.delete(f'tag_version:{CATALOG_TAG}')
+        time.sleep(0.002)
+        self.assertNotEqual(tagged_key('chave', CATALOG_TAG), antigo)
+
+    def test_last_modified_moves_on_invalidation(self):
+        antes = get_tags_last_modified(CATALOG_TAG)
+        time.sleep(1)
+        invalidate_tags(CATALOG_TAG)
+        self.assertGreater(get_tags_last_modified(CATALOG_TAG), antes)
+
+    def test_admin_edit_bumps_each_tag_once(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'senha')
+        self.client.force_login(admin)
+        categoria = Categoria.objects.create(nome='Cabos', slug='cabos')
+        antes = get_tag_versions(CATALOG_TAG, CATEGORY_TAG)
+
+        response = self.client.post(reverse('admin:catalog_categoria_change', args=[categoria.id]), {
+            'nome': 'Cabos USB', 'slug': 'cabos', 'descricao': '', 'ativo': 'on', 'ordem': 0,
+        })
+        self.assertEqual(response.status_code, 302)
+        depois = get_tag_versions(CATALOG_TAG, CATEGORY_TAG)
+        self.assertEqual(depois[CATALOG_TAG], antes[CATALOG_TAG] + 1)
+        self.assertEqual(depois[CATEGORY_TAG], antes[CATEGORY_TAG] + 1)
+
+
+class PageCacheTests(TestCase):
+    """
+    Rendered grids are reused until the catalog changes, and catalog pages
+    answer conditional GETs with 304 while their ETag holds
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.categoria = Categoria.objects.create(nome='Cabos', slug='cabos')
+        cls.produto = ProdutoNormal.objects.create(
+            nome='Cabo USB', slug='cabo-usb', descricao='Cabo', categoria=cls.categoria,
+            preco_atacado=Decimal('10'), preco_super_atacado=Decimal('8'),
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_conditional_get(self):
+        url = reverse('catalog:home')
+        # The first visit sets the CSRF cookie, which is part of the ETag
+        self.client.get(url)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertIn('HX-Request', response['Vary'])
+        etag = response['ETag']
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.produto.nome = 'Cabo USB-C'
+        self.produto.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertContains(response, 'Cabo USB-C')
+
+    def test_etag_depends_on_variant(self):
+        url = reverse('catalog:home')
+        etags = {
+            self.client.get(url, params)['ETag']
+            for params in ({}, {'sort': 'price_asc'}, {'category': 'cabos'})
+        }
+        etags.add(self.client.get(url, HTTP_HX_REQUEST='true')['ETag'])
+        self.assertEqual(len(etags), 4)
+
+    def test_grid_is_rendered_once_per_catalog_version(self):
+        url = reverse('catalog:home')
+        with CaptureQueriesContext(connection) as primeira:
+            self.client.get(url)
+        primeira = len(primeira)
+        with CaptureQueriesContext(connection) as segunda:
+            self.client.get(url)
+        self.assertLess(len(segunda), primeira)
+
+        ProdutoNormal.objects.create(
+            nome='Cabo Lightning', slug='cabo-lightning', descricao='Cabo', categoria=self.categoria,
+            preco_atacado=Decimal('12'), preco_super_atacado=Decimal('9'),
+        )
+        self.assertContains(self.client.get(url), 'Cabo Lightning')
+
+    def test_equivalent_urls_share_a_cache_entry(self):
+        keys = set()
+        for query in ('?q=Cabo%20%20USB', '?q=cabo+usb&sort=name&page=1', '?q=cabo%20usb&category=all'):
+            request = self.client.get(reverse('catalog:home') + query).wsgi_request
+            keys.add(page_cache_key(request, 'products_grid'))
+        self.assertEqual(len(keys), 1)
+
+
+class CartTestData:
+    """
+    Small catalog shared by the cart, pricing and checkout tests
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        if not cloudinary.config().cloud_name:
+            cloudinary.config(cloud_name='pmcell-test')
+        categoria = Categoria.objects.create(nome='Acessórios', slug='acessorios')
+        cls.normais = ProdutoNormal.objects.bulk_create([
+            ProdutoNormal(
+                nome=f'Cabo {i}', slug=f'cabo-{i}', descricao='Cabo', categoria=categoria,
+                preco_atacado=Decimal('10.90'), preco_super_atacado=Decimal('8.45'), quantidade_super_atacado=10,
+            )
+            for i in range(10)
+        ])
+        cls.capa = ProdutoCapaPelicula.objects.create(
+            nome='Capa Silicone', slug='capa', descricao='Capa', categoria=categoria, quantidade_super_atacado=20,
+        )
+        marca = MarcaCelular.objects.create(nome='Apple', slug='apple')
+        cls.modelos = ModeloCelular.objects.bulk_create([
+            ModeloCelular(marca=marca, nome=f'iPhone {i}', slug=f'iphone-{i}') for i in range(10, 16)
+        ])
+        PrecoModelo.objects.bulk_create([
+            PrecoModelo(produto=cls.capa, modelo=modelo, preco_atacado=Decimal('15.33'),
+                        preco_super_atacado=Decimal('12.10'))
+            for modelo in cls.modelos[:5]
+        ])
+        ImagemProduto.objects.bulk_create([
+            ImagemProduto(produto_normal=produto, imagem=f'cabo-{produto.id}-{ordem}', ordem=ordem, principal=ordem == 0)
+            for produto in cls.normais
+            for ordem in range(2)
+        ])
+
+    def normal_item(self, produto, quantity):
+        return {'productId': produto.id, 'productType': 'normal', 'quantity': quantity}
+
+    def capa_item(self, modelo, quantity):
+        return {'productId': self.capa.id, 'productType': 'capa_pelicula', 'modelId': modelo.id, 'quantity': quantity}
+
+
+class CartHydrationTests(CartTestData, TestCase):
+    """
+    get_cart_items resolves a whole cart in a fixed number of queries and
+    drops lines that can no longer be sold
+    """
+
+    def get_cart_items(self, cart):
+        return self.client.post(
+            reverse('catalog:get_cart_items'), json.dumps({'cart': cart}), content_type='application/json'
+        ).json()
+
+    def test_query_count_independent_of_cart_size(self):
+        pequeno = [self.normal_item(self.normais[0], 1), self.capa_item(self.modelos[0], 1)]
+        grande = [self.normal_item(produto, 2) for produto in self.normais] + [
+            self.capa_item(modelo, 3) for modelo in self.modelos[:5]
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            self.get_cart_items(pequeno)
+        pequeno_queries = len(queries)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(len(self.get_cart_items(grande)['items']), 15)
+        self.assertEqual(len(queries), pequeno_queries)
+
+    def test_unsellable_lines_are_dropped(self):
+        ProdutoNormal.objects.filter(id=self.normais[1].id).update(em_estoque=False)
+        cart = [
+            self.normal_item(self.normais[0], 2),
+            self.normal_item(self.normais[1], 2),
+            {'productId': 999999, 'productType': 'normal', 'quantity': 1},
+            self.normal_item(self.normais[2], 0),
+            self.normal_item(self.normais[3], 'muitos'),
+            self.capa_item(self.modelos[5], 1),
+            {'productId': self.capa.id, 'productType': 'capa_pelicula', 'quantity': 1},
+            self.capa_item(self.modelos[1], 4),
+        ]
+        items = self.get_cart_items(cart)['items']
+        self.assertEqual(
+            [(item['productId'], item['modelId']) for item in items],
+            [(self.normais[0].id, None), (self.capa.id, self.modelos[1].id)],
+        )
+
+    def test_line_payload(self):
+        response = self.get_cart_items([{**self.capa_item(self.modelos[2], 3), 'key': 'linha-1'}])
+        item = response['items'][0]
+        self.assertEqual(item['key'], 'linha-1')
+        self.assertEqual(item['modelName'], 'Apple iPhone 12')
+        self.assertEqual(item['lineTotal'], 45.99)
+        self.assertEqual(response['total'], 45.99)
+
+        item = self.get_cart_items([self.normal_item(self.normais[4], 1)])['items'][0]
+        self.assertIn(f'cabo-{self.normais[4].id}-0', item['image'])
+
+
+class CartPricingTests(CartTestData, TestCase):
+    """
+    Server-side pricing: Decimal tiers from the product's minimum quantity,
+    exact totals, and the same rule for ItemPedido
+    """
+
+    def test_tier_boundary(self):
+        cart = price_cart([
+            self.normal_item(self.normais[0], 9),
+            self.normal_item(self.normais[1], 10),
+            self.capa_item(self.modelos[0], 19),
+            self.capa_item(self.modelos[1], 20),
+        ], with_images=False)
+        self.assertEqual(
+            [(line.preco_unitario, line.is_super_atacado) for line in cart.lines],
+            [(Decimal('10.90'), False), (Decimal('8.45'), True), (Decimal('15.33'), False), (Decimal('12.10'), True)],
+        )
+
+    def test_totals_are_exact_decimals(self):
+        cart = price_cart([self.normal_item(produto, 3) for produto in self.normais], with_images=False)
+        self.assertIsInstance(cart.total, Decimal)
+        self.assertEqual(cart.total, Decimal('327.00'))
+        self.assertEqual(cart.lines[0].preco_total, Decimal('32.70'))
+
+    def test_client_prices_are_ignored(self):
+        item = {**self.normal_item(self.normais[0], 1), 'unitPrice': 0.01, 'lineTotal': 0.01}
+        self.assertEqual(price_cart([item], with_images=False).total, Decimal('10.90'))
+
+    def test_item_pedido_uses_the_same_rule(self):
+        pedido = Pedido.objects.create(codigo='PM-TESTE', nome_cliente='Cliente', whatsapp='(11) 99999-9999')
+        for quantidade in (9, 10):
+            item = ItemPedido.objects.create(
+                pedido=pedido, tipo='normal', produto_normal=self.normais[0], quantidade=quantidade,
+                preco_unitario=Decimal('0'), preco_total=Decimal('0'),
+            )
+            linha = price_cart([self.normal_item(self.normais[0], quantidade)], with_images=False).lines[0]
+            self.assertEqual((item.preco_unitario, item.preco_total), (linha.preco_unitario, linha.preco_total))
+
+
+class PlaceOrderTests(CartTestData, TestCase):
+    """
+    Orders are written with all their items and the webhook in one
+    transaction, and an idempotency key never places an order twice
+    """
+
+    def setUp(self):
+        ConfiguracaoWebhook.objects.create(evento='pedido_finalizado', url='http://127.0.0.1:9/pedido', ativo=True)
+        self.cart = [self.normal_item(produto, 12) for produto in self.normais[:3]] + [self.capa_item(self.modelos[0], 2)]
+
+    def test_order_items_and_webhook(self):
+        pedido, created = place_order('Cliente', '(11) 99999-9999', self.cart)
+        self.assertTrue(created)
+        self.assertEqual(pedido.valor_total, Decimal('8.45') * 36 + Decimal('15.33') * 2)
+        self.assertEqual(pedido.itens.count(), 4)
+        self.assertEqual(EventoWebhook.objects.filter(evento='pedido_finalizado').count(), 1)
+
+    def test_constant_queries(self):
+        # Warms the webhook configuration cache
+        place_order('Cliente', '(11) 99999-9999', self.cart)
+        with CaptureQueriesContext(connection) as queries:
+            place_order('Cliente', '(11) 99999-9999', self.cart[2:])
+        poucos = len(queries)
+        with CaptureQueriesContext(connection) as queries:
+            place_order('Cliente', '(11) 99999-9999', self.cart + [self.capa_item(self.modelos[3], 5)])
+        self.assertEqual(len(queries), poucos)
+
+    def test_idempotency_key(self):
+        primeiro, created = place_order('Cliente', '(11) 99999-9999', self.cart, 'chave-1')
+        self.assertTrue(created)
+        repetido, created = place_order('Cliente', '(11) 99999-9999', self.cart[:1], 'chave-1')
+        self.assertFalse(created)
+        self.assertEqual(repetido.pk, primeiro.pk)
+        self.assertEqual(Pedido.objects.count(), 1)
+        self.assertEqual(ItemPedido.objects.count(), 4)
+        self.assertEqual(EventoWebhook.objects.count(), 1)
+
+    def test_checkout_idempotency_header(self):
+        def checkout():
+            return self.client.post(
+                reverse('catalog:checkout'),
+                json.dumps({'nome_cliente': 'Cliente', 'whatsapp': '(11) 99999-9999', 'cart_items': self.cart}),
+                content_type='application/json', HTTP_IDEMPOTENCY_KEY='pedido-abc',
+            ).json()
+        self.assertEqual(checkout()['order_code'], checkout()['order_code'])
+        self.assertEqual(Pedido.objects.count(), 1)
+
+    def test_empty_cart(self):
+        with self.assertRaises(CheckoutError):
+            place_order('Cliente', '(11) 99999-9999', [{'productId': 999999, 'productType': 'normal', 'quantity': 1}])
+        self.assertFalse(Pedido.objects.exists())
+
+    def test_failure_rolls_back_everything(self):
+        with mock.patch('catalog.order_utils.enqueue_order_completed_webhook', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                place_order('Cliente', '(11) 99999-9999', self.cart)
+        self.assertFalse(Pedido.objects.exists())
+        self.assertFalse(ItemPedido.objects.exists())
+
+
+class StubReceiver(BaseHTTPRequestHandler):
+    """
+    Keep-alive webhook receiver recording every body it gets (and the
+    client port it came from) and answering `status` after `delay` seconds
+    """
+    protocol_version = 'HTTP/1.1'
+    status = 200
+    delay = 0
+    bodies = []
+    peers = []
+    in_flight = defaultdict(int)
+    peak = defaultdict(int)
+    lock = threading.Lock()
+
+    @classmethod
+    def reset(cls):
+        cls.status, cls.delay = 200, 0
+        cls.bodies, cls.peers = [], []
+        cls.in_flight, cls.peak = defaultdict(int), defaultdict(int)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        with self.lock:
+            self.bodies.append(body)
+            self.peers.append(self.client_address[1])
+            self.in_flight[self.path] += 1
+            self.peak[self.path] = max(self.peak[self.path], self.in_flight[self.path])
+        time.sleep(self.delay)
+        with self.lock:
+            self.in_flight[self.path] -= 1
+        self.send_response(self.status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubReceiverMixin:
+    """
+    Runs a StubReceiver on a free local port for the test class
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubReceiver)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.executor = ThreadPoolExecutor(max_workers=8)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.executor.shutdown()
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        StubReceiver.reset()
+
+    def receiver_url(self, path='/webhook'):
+        return f'http://127.0.0.1:{self.server.server_port}{path}'
+
+
+class WebhookOutboxTests(StubReceiverMixin, TestCase):
+    """
+    Outbox worker against a local stub receiver: leases, retries with
+    backoff and jitter, dead letters and recovery after a worker crash
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.config = ConfiguracaoWebhook.objects.create(
+            evento='pedido_finalizado', url=self.receiver_url(), timeout=5,
+        )
+
+    def enqueue(self, count=1):
+        return [enqueue_webhook('pedido_finalizado', {'order': {'codigo': f'PM{i}'}}) for i in range(count)]
+
+    def test_delivery(self):
+        event, = self.enqueue()
+        self.assertEqual(process_webhook_batch(self.executor, 10), 1)
+
+        event.refresh_from_db()
+        self.assertEqual((event.status, event.tentativas), ('enviado', 1))
+        self.assertIsNotNone(event.enviado_em)
+        self.assertEqual(StubReceiver.bodies[0]['event_id'], event.pk)
+        self.assertEqual(StubReceiver.bodies[0]['order'], {'codigo': 'PM0'})
+        # Nothing left to do
+        self.assertEqual(process_webhook_batch(self.executor, 10), 0)
+
+    def test_configs_expire_without_tag_change(self):
+        now = time.monotonic()
+        with mock.patch('catalog.webhook_utils.time.monotonic', return_value=now):
+            self.assertIn('pedido_finalizado', get_webhook_configs())
+            # Disabled by another process: this process's tag does not move
+            ConfiguracaoWebhook.objects.filter(pk=self.config.pk).update(ativo=False)
+            self.assertIn('pedido_finalizado', get_webhook_configs())
+        with mock.patch('catalog.webhook_utils.time.monotonic', return_value=now + CONFIG_MAX_AGE):
+            self.assertNotIn('pedido_finalizado', get_webhook_configs())
+
+    def test_batched_delivery(self):
+        ConfiguracaoWebhook.objects.filter(pk=self.config.pk).update(envio_em_lote=True, tamanho_lote=2)
+        invalidate_tags(WEBHOOK_TAG)
+        self.enqueue(3)
+        self.assertEqual(process_webhook_batch(self.executor, 10), 3)
+        self.assertEqual(sorted(len(body) for body in StubReceiver.bodies), [1, 2])
+        self.assertEqual(EventoWebhook.objects.filter(status='enviado').count(), 3)
+
+    def test_claims_are_exclusive(self):
+        self.enqueue(5)
+        primeiro = claim_webhook_events(3)
+        segundo = claim_webhook_events(10)
+        self.assertEqual(len(primeiro), 3)
+        self.assertEqual(len(segundo), 2)
+        self.assertFalse({e.pk for e in primeiro} & {e.pk for e in segundo})
+        self.assertEqual(claim_webhook_events(10), [])
+        self.assertTrue(all(e.status == 'processando' and e.bloqueado_ate for e in primeiro + segundo))
+
+    def test_expired_lease_is_claimed_again(self):
+        self.enqueue()
+        event, = claim_webhook_events(10)
+        # Worker killed mid-delivery: nobody records the outcome
+        self.assertEqual(claim_webhook_events(10), [])
+
+        with mock.patch('catalog.webhook_utils.timezone.now',
+                        return_value=timezone.now() + timedelta(seconds=settings.WEBHOOK_LEASE_SECONDS + 1)):
+            recuperado, = claim_webhook_events(10)
+        self.assertEqual(recuperado.pk, event.pk)
+
+        record_delivery(recuperado, None, self.config)
+        self.assertEqual(EventoWebhook.objects.get(pk=event.pk).status, 'enviado')
+
+    @override_settings(WEBHOOK_BACKOFF_BASE=30, WEBHOOK_BACKOFF_MAX=600)
+    def test_backoff_schedule(self):
+        random.seed(7)
+        for tentativas, teto in ((1, 30), (2, 60), (3, 120), (5, 480), (6, 600), (12, 600)):
+            delays = [backoff_delay(tentativas) for _ in range(200)]
+            self.assertTrue(all(teto / 2 <= delay <= teto for delay in delays), tentativas)
+            # Jitter: retries of events that failed together spread out
+            self.assertGreater(len(set(delays)), 100)
+
+    def test_failure_is_rescheduled(self):
+        StubReceiver.status = 503
+        event, = self.enqueue()
+        antes = timezone.now()
+        process_webhook_batch(self.executor, 10)
+
+        event.refresh_from_db()
+        self.assertEqual((event.status, event.tentativas, event.ultimo_erro), ('pendente', 1, 'HTTP 503'))
+        self.assertIsNone(event.bloqueado_ate)
+        self.assertGreaterEqual(event.proxima_tentativa, antes + timedelta(seconds=settings.WEBHOOK_BACKOFF_BASE / 2))
+        # Not due yet
+        self.assertEqual(process_webhook_batch(self.executor, 10), 0)
+
+    @override_settings(WEBHOOK_MAX_ATTEMPTS=3)
+    def test_dead_letter_after_last_attempt(self):
+        StubReceiver.status = 500
+        event, = self.enqueue()
+        for tentativa in range(1, 4):
+            EventoWebhook.objects.filter(pk=event.pk, status='pendente').update(proxima_tentativa=timezone.now())
+            self.assertEqual(process_webhook_batch(self.executor, 10), 1)
+            event.refresh_from_db()
+            self.assertEqual(event.tentativas, tentativa)
+        self.assertEqual(event.status, 'descartado')
+        self.assertEqual(len(StubReceiver.bodies), 3)
+        self.assertEqual([body['retry_count'] for body in StubReceiver.bodies], [0, 1, 2])
+
+        EventoWebhook.objects.filter(pk=event.pk).update(proxima_tentativa=timezone.now())
+        self.assertEqual(process_webhook_batch(self.executor, 10), 0)
+
+    def test_coalescing(self):
+        primeiro = enqueue_webhook('pedido_finalizado', {'versao': 1}, chave_agrupamento='carrinho:1')
+        segundo = enqueue_webhook('pedido_finalizado', {'versao': 2}, chave_agrupamento='carrinho:1')
+        self.assertEqual(segundo.pk, primeiro.pk)
+        event = EventoWebhook.objects.get()
+        self.assertEqual(event.payload, {'versao': 2})
+        self.assertGreater(event.proxima_tentativa, timezone.now())
+
+    def test_coalescing_does_not_merge_into_claimed_event(self):
+        primeiro = enqueue_webhook('pedido_finalizado', {'versao': 1}, chave_agrupamento='carrinho:1')
+        first = QuerySet.first
+
+        def claimed_after_read(queryset):
+            # A worker leases the event between the read and the merge
+            waiting = first(queryset)
+            EventoWebhook.objects.filter(pk=primeiro.pk).update(
+                status='processando', bloqueado_ate=timezone.now() + timedelta(minutes=5)
+            )
+            return waiting
+
+        with mock.patch.object(QuerySet, 'first', claimed_after_read):
+            segundo = enqueue_webhook('pedido_finalizado', {'versao': 2}, chave_agrupamento='carrinho:1')
+
+        self.assertNotEqual(segundo.pk, primeiro.pk)
+        self.assertEqual(EventoWebhook.objects.get(pk=primeiro.pk).payload, {'versao': 1})
+        self.assertEqual(EventoWebhook.objects.get(pk=segundo.pk).payload, {'versao': 2})
+
+    def test_without_retry_fails_once(self):
+        ConfiguracaoWebhook.objects.filter(pk=self.config.pk).update(retry_ativo=False)
+        invalidate_tags(WEBHOOK_TAG)
+        StubReceiver.status = 500
+        event, = self.enqueue()
+        process_webhook_batch(self.executor, 10)
+        event.refresh_from_db()
+        self.assertEqual((event.status, event.tentativas), ('descartado', 1))
+
+
+class WebhookTransportTests(StubReceiverMixin, TestCase):
+    """
+    The shared transport reuses pooled keep-alive connections and bounds
+    in-flight deliveries per endpoint
+    """
+
+    def config(self, path='/webhook'):
+        return ConfiguracaoWebhook(evento='pedido_finalizado', url=self.receiver_url(path), timeout=5)
+
+    def test_connections_are_reused(self):
+        transport = WebhookTransport(pool_size=2, max_in_flight=2)
+        config = self.config()
+        for event_id in range(5):
+            self.assertIsNone(transport.deliver(config, config.evento, {'n': event_id}, event_id=event_id))
+        self.assertEqual([body['n'] for body in StubReceiver.bodies], list(range(5)))
+        self.assertEqual(len(set(StubReceiver.peers)), 1)
+
+    def test_in_flight_is_bounded_per_endpoint(self):
+        StubReceiver.delay = 0.05
+        transport = WebhookTransport(pool_size=8, max_in_flight=2)
+        jobs = [(self.config(path), 'pedido_finalizado', {}) for path in ('/a', '/b') for _ in range(6)]
+        errors = list(self.executor.map(lambda job: transport.deliver(*job), jobs))
+
+        self.assertEqual(errors, [None] * 12)
+        # Each endpoint has its own limit, so one does not starve the other
+        self.assertEqual(dict(StubReceiver.peak), {'/a': 2, '/b': 2})
+
+    def test_errors(self):
+        transport = WebhookTransport(pool_size=1, max_in_flight=1)
+        StubReceiver.status = 502
+        self.assertEqual(transport.deliver(self.config(), 'pedido_finalizado', {}), 'HTTP 502')
+
+        StubReceiver.status, StubReceiver.delay = 200, 2
+        config = self.config()
+        config.timeout = 0.2
+        self.assertEqual(transport.deliver(config, 'pedido_finalizado', {}), 'Timeout')
+
+
+class JourneyIngestionTests(TestCase):
+    """
+    track-journey parsing and the buffered bulk insert of its events
+    """
+
+    def test_parse_single_batch_and_list(self):
+        jornadas, sessao_id = parse_journey_events(
+            {'evento': 'pesquisa', 'dados': {'q': 'cabo'}, 'sessao_id': 's1'}, whatsapp_cookie='11999999999'
+        )
+        self.assertEqual(sessao_id, 's1')
+        self.assertEqual([(j.evento, j.sessao_id, j.whatsapp) for j in jornadas], [('pesquisa', 's1', '11999999999')])
+
+        jornadas, sessao_id = parse_journey_events({
+            'sessao_id': 's2', 'whatsapp': '11888888888',
+            'eventos': [{'evento': 'pesquisa'}, {'evento': 'inexistente'}, 'lixo', {'evento': 'saida'}],
+        })
+        self.assertEqual([(j.evento, j.sessao_id, j.whatsapp) for j in jornadas],
+                         [('pesquisa', 's2', '11888888888'), ('saida', 's2', '11888888888')])
+
+        # Every event main.js sends is kept
+        jornadas, _ = parse_journey_events({'eventos': [
+            {'evento': evento} for evento in ('item_adicionado', 'item_atualizado', 'item_removido', 'carrinho_limpo')
+        ]})
+        self.assertEqual(len(jornadas), 4)
+
+        jornadas, sessao_id = parse_journey_events([{'evento': 'pesquisa'}] * (MAX_EVENTS_PER_REQUEST + 5))
+        self.assertEqual(len(jornadas), MAX_EVENTS_PER_REQUEST)
+        # A session id is generated when the client has none
+        self.assertTrue(sessao_id)
+        self.assertEqual({j.sessao_id for j in jornadas}, {sessao_id})
+
+    def test_session_context_kept_only_on_exit(self):
+        dados = {'q': 'cabo', 'categories_visited': ['cabos'], 'products_viewed': [1, 2]}
+        (busca, saida), _ = parse_journey_events({'eventos': [
+            {'evento': 'pesquisa', 'dados': dados}, {'evento': 'saida', 'dados': dados},
+        ]})
+        self.assertEqual(busca.dados_evento, {'q': 'cabo'})
+        self.assertEqual(saida.dados_evento, dados)
+
+    def events(self, count):
+        return [JornadaCliente(sessao_id='s', evento='pesquisa', dados_evento={'n': i}) for i in range(count)]
+
+    def test_unbuffered_writes_through(self):
+        buffer = JourneyBuffer(0, 1)
+        buffer.add(self.events(3))
+        self.assertEqual(JornadaCliente.objects.count(), 3)
+        self.assertIsNone(buffer.thread)
+
+    def test_flush_is_one_bulk_insert(self):
+        buffer = JourneyBuffer(1000, 3600)
+        with mock.patch.object(threading.Thread, 'start'):
+            buffer.add(self.events(40))
+            buffer.add(self.events(40))
+        self.assertEqual(JornadaCliente.objects.count(), 0)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(buffer.flush(), 80)
+        self.assertEqual(JornadaCliente.objects.count(), 80)
+        self.assertEqual(buffer.flush(), 0)
+
+    def test_failed_flush_drops_the_batch(self):
+        buffer = JourneyBuffer(1000, 3600)
+        with mock.patch.object(threading.Thread, 'start'):
+            buffer.add(self.events(5))
+        with mock.patch.object(JornadaCliente.objects, 'bulk_create', side_effect=DatabaseError), \
+                self.assertLogs('catalog.journey_utils', 'ERROR'):
+            self.assertEqual(buffer.flush(), 0)
+        self.assertEqual(buffer.pending, [])
+
+    def test_endpoint_records_batch(self):
+        with mock.patch('catalog.journey_utils._buffer', JourneyBuffer(0, 1)):
+            response = self.client.post(
+                reverse('catalog:track_journey'),
+                json.dumps({'sessao_id': 'abc', 'eventos': [{'evento': 'pesquisa'}, {'evento': 'saida'}]}),
+                content_type='application/json',
+            )
+        self.assertEqual(response.json(), {'success': True, 'sessao_id': 'abc', 'eventos': 2})
+        self.assertEqual(JornadaCliente.objects.filter(sessao_id='abc').count(), 2)
+
+
+class ObservedJourneyBuffer(JourneyBuffer):
+    """
+    JourneyBuffer signalling when a flush wrote rows, so tests wait for the
+    background thread instead of polling the table it is writing to
+    """
+
+    def __init__(self, size, interval):
+        super().__init__(size, interval)
+        self.flushed = threading.Event()
+
+    def flush(self):
+        written = super().flush()
+        if written:
+            self.flushed.set()
+        return written
+
+
+class JourneyFlusherTests(TransactionTestCase):
+    """
+    The background thread writes the buffer when it fills up or when the
+    flush interval elapses (runs outside a test transaction so the
+    thread's own connection sees the tables)
+    """
+
+    def events(self, count):
+        return [JornadaCliente(sessao_id='s', evento='pesquisa') for _ in range(count)]
+
+    def test_flush_when_full(self):
+        buffer = ObservedJourneyBuffer(10, 3600)
+        buffer.add(self.events(4))
+        self.assertFalse(buffer.flushed.wait(0.1))
+
+        buffer.add(self.events(6))
+        self.assertTrue(buffer.flushed.wait(5))
+        self.assertEqual(JornadaCliente.objects.count(), 10)
+
+    def test_flush_on_interval(self):
+        buffer = ObservedJourneyBuffer(1000, 0.1)
+        buffer.add(self.events(3))
+        self.assertTrue(buffer.flushed.wait(5))
+        self.assertEqual(JornadaCliente.objects.count(), 3)
+
+
+class JourneyRetentionTests(TestCase):
+    """
+    Incremental rollups into JornadaDiaria/FunilDiario and the
+    prune_journey retention job with its gzip archive
+    """
+
+    def jornada(self, evento, sessao_id, dias_atras, whatsapp=''):
+        jornada = JornadaCliente.objects.create(evento=evento, sessao_id=sessao_id, whatsapp=whatsapp)
+        dia = timezone.localdate() - timedelta(days=dias_atras)
+        jornada.timestamp = timezone.make_aware(datetime.combine(dia, datetime_time(12)))
+        JornadaCliente.objects.filter(pk=jornada.pk).update(timestamp=jornada.timestamp)
+        return jornada
+
+    def test_rollup_is_incremental(self):
+        self.jornada('entrada', 's1', 1)
+        self.jornada('pesquisa', 's1', 1)
+        self.jornada('pesquisa', 's1', 1, whatsapp='11999999999')
+        self.jornada('entrada', 's2', 1)
+        dia = timezone.localdate() - timedelta(days=1)
+
+        self.assertEqual(refresh_journey_summaries(), (4, {dia}))
+        self.assertEqual(get_watermark(), JornadaCliente.objects.order_by('-id').first().id)
+        rollup = JornadaDiaria.objects.get(data=dia, evento='pesquisa', sessao_id='s1')
+        self.assertEqual((rollup.total, rollup.whatsapp), (2, '11999999999'))
+
+        # Nothing new: nothing folded twice
+        self.assertEqual(refresh_journey_summaries(), (0, set()))
+
+        self.jornada('pesquisa', 's1', 1)
+        self.jornada('entrada', 's3', 1)
+        self.assertEqual(refresh_journey_summaries(chunk_size=1), (2, {dia}))
+        self.assertEqual(JornadaDiaria.objects.get(data=dia, evento='pesquisa', sessao_id='s1').total, 3)
+        funil = FunilDiario.objects.get(data=dia)
+        self.assertEqual((funil.sessoes, funil.entradas), (3, 3))
+
+    def test_recent_events_wait_for_the_lag(self):
+        JornadaCliente.objects.create(evento='entrada', sessao_id='s1')
+        self.assertEqual(refresh_journey_summaries(), (0, set()))
+        self.assertEqual(get_watermark(), 0)
+
+    def test_days_to_prune(self):
+        self.assertEqual(days_to_prune(90), [])
+        self.jornada('entrada', 's1', 93)
+        self.jornada('entrada', 's1', 90)
+        hoje = timezone.localdate()
+        self.assertEqual(days_to_prune(90), [hoje - timedelta(days=93), hoje - timedelta(days=92), hoje - timedelta(days=91)])
+
+    def test_prune_archives_and_keeps_rollups(self):
+        antigo = self.jornada('entrada', 'antiga', 100)
+        self.jornada('pesquisa', 'antiga', 100)
+        recente = self.jornada('entrada', 'recente', 10)
+
+        with tempfile.TemporaryDirectory() as archive_dir:
+            out = StringIO()
+            call_command('prune_journey', days=30, archive_dir=archive_dir, stdout=out)
+            self.assertIn('2 eventos removidos', out.getvalue())
+
+            path = os.path.join(archive_dir, f'jornada-{antigo.timestamp.astimezone():%Y-%m}.jsonl.gz')
+            with gzip.open(path, 'rt', encoding='utf-8') as archive:
+                rows = [json.loads(line) for line in archive]
+        self.assertEqual({(row['sessao_id'], row['evento']) for row in rows}, {('antiga', 'entrada'), ('antiga', 'pesquisa')})
+
+        self.assertEqual(list(JornadaCliente.objects.values_list('id', flat=True)), [recente.id])
+        self.assertEqual(JornadaDiaria.objects.filter(sessao_id='antiga').count(), 2)
+        # The session path falls back to the rollups
+        self.assertEqual([step['evento'] for step in session_path('antiga')], ['entrada', 'pesquisa'])
+
+    def test_prune_keeps_unfolded_events(self):
+        self.jornada('entrada', 's1', 100)
+        refresh_journey_summaries()
+        tardio = self.jornada('entrada', 's2', 100)
+
+        self.assertEqual(prune_journey_day(timezone.localdate() - timedelta(days=100)), 1)
+        self.assertEqual(list(JornadaCliente.objects.values_list('id', flat=True)), [tardio.id])
+
+    def test_dry_run(self):
+        self.jornada('entrada', 's1', 100)
+        out = StringIO()
+        call_command('prune_journey', days=30, dry_run=True, stdout=out)
+        self.assertIn('1 eventos', out.getvalue())
+        self.assertEqual(JornadaCliente.objects.count(), 1)
+        self.assertFalse(JornadaDiaria.objects.exists())
+
+
+class FunnelSessionTests(CartTestData, TestCase):
+    """
+    Orders and price liberations reach the funnel as distinct sessions,
+    under the client's journey session when it sends one
+    """
+
+    def checkout(self, whatsapp, sessao_id=None):
+        data = {'nome_cliente': 'Cliente', 'whatsapp': whatsapp, 'cart_items': [self.normal_item(self.normais[0], 2)]}
+        if sessao_id:
+            data['sessao_id'] = sessao_id
+        response = self.client.post(reverse('catalog:checkout'), json.dumps(data), content_type='application/json')
+        self.assertTrue(response.json()['success'])
+
+    def test_orders_on_one_day(self):
+        for evento in ('entrada', 'item_adicionado', 'checkout_iniciado'):
+            JornadaCliente.objects.create(sessao_id='sess-a', evento=evento)
+        self.client.post(
+            reverse('catalog:liberate_prices'),
+            json.dumps({'whatsapp': '(11) 99999-9999', 'sessao_id': 'sess-a'}), content_type='application/json',
+        )
+        self.checkout('(11) 99999-9999', 'sess-a')
+        self.checkout('(11) 98888-8888')
+        self.checkout('(11) 97777-7777')
+
+        # Past the refresh lag
+        JornadaCliente.objects.update(timestamp=timezone.now() - timedelta(minutes=2))
+        refresh_journey_summaries()
+
+        funil = FunilDiario.objects.get(data=timezone.localdate(timezone.now() - timedelta(minutes=2)))
+        # The orders without a journey are sessions of their own, but did
+        # not go through the earlier steps
+        self.assertEqual((funil.sessoes, funil.entradas, funil.liberacoes, funil.pedidos), (3, 1, 1, 1))
+        self.assertEqual(
+            set(JornadaDiaria.objects.filter(sessao_id='sess-a').values_list('evento', flat=True)),
+            {'entrada', 'liberacao_preco', 'item_adicionado', 'checkout_iniciado', 'pedido_finalizado'},
+        )
+
+
+class FunnelCohortTests(TestCase):
+    """
+    Step-ordered funnels per session, grouped by the day each session was
+    first seen
+    """
+
+    def jornada(self, evento, sessao_id, dias_atras):
+        jornada = JornadaCliente.objects.create(evento=evento, sessao_id=sessao_id)
+        dia = timezone.localdate() - timedelta(days=dias_atras)
+        JornadaCliente.objects.filter(pk=jornada.pk).update(
+            timestamp=timezone.make_aware(datetime.combine(dia, datetime_time(12)))
+        )
+
+    def steps(self, dias):
+        hoje = timezone.localdate()
+        return [step['sessoes'] for step in funnel(hoje - timedelta(days=dias), hoje)]
+
+    def test_steps_require_the_earlier_ones(self):
+        for evento in ('entrada', 'liberacao_preco', 'item_adicionado'):
+            self.jornada(evento, 'completa', 1)
+        # Skipped the price liberation
+        for evento in ('entrada', 'item_adicionado', 'checkout_iniciado'):
+            self.jornada(evento, 'pulou', 1)
+        # Only reached the checkout
+        self.jornada('checkout_iniciado', 'direto', 1)
+        refresh_journey_summaries()
+
+        self.assertEqual(self.steps(7), [2, 1, 1, 0, 0])
+        coorte, = daily_cohorts(timezone.localdate() - timedelta(days=7), timezone.localdate())
+        self.assertEqual(coorte['sessoes'], 3)
+        self.assertEqual([etapa['taxa'] for etapa in coorte['etapas']], [66.7, 33.3, 33.3, 0.0, 0.0])
+
+    def test_session_spanning_days_counts_once_in_its_first_day(self):
+        self.jornada('entrada', 's1', 3)
+        self.jornada('entrada', 's1', 2)
+        self.jornada('liberacao_preco', 's1', 2)
+        self.jornada('entrada', 's2', 2)
+        refresh_journey_summaries()
+
+        self.assertEqual(self.steps(7), [2, 1, 0, 0, 0])
+        hoje = timezone.localdate()
+        coortes = daily_cohorts(hoje - timedelta(days=7), hoje)
+        self.assertEqual(
+            [(coorte['data'], coorte['sessoes'], coorte['etapas'][1]['sessoes']) for coorte in coortes],
+            [(hoje - timedelta(days=2), 1, 0), (hoje - timedelta(days=3), 1, 1)],
+        )
+
+        # A late event from an earlier day moves s2 to that day's cohort
+        self.jornada('entrada', 's2', 4)
+        refresh_journey_summaries()
+        self.assertEqual(self.steps(7), [2, 1, 0, 0, 0])
+        self.assertEqual(
+            list(FunilDiario.objects.order_by('data').values_list('data', 'sessoes')),
+            [(hoje - timedelta(days=4), 1), (hoje - timedelta(days=3), 1)],
+        )
+
+
+class RateLimiterTests(TestCase):
+    """
+    Sliding window counters on the cache and the Redis token bucket
+    """
+
+    def setUp(self):
+        cache.clear()
+
+    def test_sliding_window(self):
+        limiter = SlidingWindowLimiter(60)
+        results = [limiter.hit('ip:1', 3) for _ in range(4)]
+        self.assertEqual([r.allowed for r in results], [True, True, True, False])
+        self.assertEqual([r.remaining for r in results[:3]], [2, 1, 0])
+        self.assertGreaterEqual(results[3].retry_after, 1)
+        self.assertIn('Retry-After', results[3].headers())
+        # Other identities have their own counters
+        self.assertTrue(limiter.hit('ip:2', 3).allowed)
+
+    def test_rejected_hits_are_not_counted(self):
+        limiter = SlidingWindowLimiter(60)
+        for _ in range(10):
+            limiter.hit('ip:1', 2)
+        current = int(time.time() // 60)
+        self.assertEqual(cache.get(f'{RATE_LIMIT_PREFIX}:ip:1:{current}'), 2)
+
+    @override_settings(REDIS_URL='')
+    def test_token_bucket_needs_redis(self):
+        with self.assertLogs('catalog.ratelimit_utils', 'WARNING'):
+            self.assertIsInstance(get_limiter('token_bucket', 60), SlidingWindowLimiter)
+        with self.assertRaises(ValueError):
+            get_limiter('leaky_bucket', 60)
+
+    @override_settings(REDIS_URL='redis://127.0.0.1:1/0')
+    def test_token_bucket_uses_redis_url(self):
+        limiter = get_limiter('token_bucket', 60)
+        self.assertIsInstance(limiter, TokenBucketLimiter)
+        self.assertEqual(limiter.client.connection_pool.connection_kwargs['port'], 1)
+
+        limiter.script = mock.Mock(return_value=[1, b'4.5'])
+        result = limiter.hit('ip:1', 10)
+        self.assertEqual((result.allowed, result.remaining, result.reset, result.retry_after), (True, 4, 33, 0))
+
+        limiter.script = mock.Mock(return_value=[0, b'0.25'])
+        result = limiter.hit('ip:1', 10)
+        # 0.75 tokens short at 10 tokens per minute
+        self.assertEqual((result.allowed, result.remaining, result.retry_after), (False, 0, 5))
+
+    @skipUnless(os.environ.get('REDIS_URL'), 'needs a Redis server (REDIS_URL)')
+    def test_token_bucket_on_redis(self):
+        limiter = TokenBucketLimiter(60, os.environ['REDIS_URL'])
+        identity = f'test:{time.time()}'
+        results = [limiter.hit(identity, 3) for _ in range(4)]
+        self.assertEqual([r.allowed for r in results], [True, True, True, False])
+        self.assertEqual(results[3].retry_after, 20)
+
+
+class APIPolicyMiddlewareTests(TestCase):
+    """
+    Throttling and rate limiting per client and path prefix
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.middleware = APIPolicyMiddleware(lambda request: HttpResponse('ok'), {
+            '/api/liberar/': APIPolicy(rate_limit=3, throttle=5),
+            '/api/busca/': APIPolicy(rate_limit=2),
+        })
+        self.factory = RequestFactory()
+
+    def get(self, path, ip='10.0.0.1'):
+        return self.middleware(self.factory.get(path, REMOTE_ADDR=ip))
+
+    def test_rate_limit(self):
+        statuses = [self.get('/api/busca/').status_code for _ in range(3)]
+        self.assertEqual(statuses, [200, 200, 429])
+        response = self.get('/api/busca/')
+        self.assertEqual(response['X-RateLimit-Remaining'], '0')
+        self.assertIn('Retry-After', response)
+        # Per client and per prefix
+        self.assertEqual(self.get('/api/busca/', ip='10.0.0.2').status_code, 200)
+        self.assertEqual(self.get('/api/outra/').status_code, 200)
+
+    def test_throttle(self):
+        self.assertEqual(self.get('/api/liberar/').status_code, 200)
+        response = self.get('/api/liberar/')
+        self.assertEqual((response.status_code, response['Retry-After']), (429, '5'))
+
+    def test_throttled_requests_do_not_use_the_rate_limit(self):
+        throttle_key = 'api_throttle:10.0.0.1:/api/liberar/'
+        statuses = []
+        for _ in range(3):
+            statuses.append(self.get('/api/liberar/').status_code)
+            # Retried too fast: throttled, not counted
+            statuses.append(self.get('/api/liberar/').status_code)
+            cache.delete(throttle_key)
+        self.assertEqual(statuses, [200, 429] * 3)
+
+        response = self.get('/api/liberar/')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.content, b'Rate limit exceeded. Please try again later.')
+
+    def test_suggestions_allow_typing_behind_one_address(self):
+        middleware = APIPolicyMiddleware(lambda request: HttpResponse('ok'))
+        # Ten buyers behind one NAT each typing a 20-letter query
+        statuses = {
+            middleware(self.factory.get('/api/search-suggestions/', {'q': 'cabo'}, REMOTE_ADDR='10.0.0.1')).status_code
+            for _ in range(200)
+        }
+        self.assertEqual(statuses, {200})
+
+
+class SitemapTests(TestCase):
+    """
+    Pre-rendered sitemaps are served while they match the catalog; when
+    missing or stale they are rendered on request and rebuilt
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        categoria = Categoria.objects.create(nome='Cabos', slug='cabos')
+        cls.produto = ProdutoNormal.objects.create(
+            nome='Cabo USB-C', slug='cabo-usb-c', descricao='Cabo', categoria=categoria,
+            preco_atacado=Decimal('10'), preco_super_atacado=Decimal('8'),
+        )
+
+    def setUp(self):
+        cache.clear()
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        settings_override = override_settings(SITEMAP_ROOT=root.name, SITE_URL='https://pmcell.test')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        rebuild = mock.patch('catalog.views.rebuild_sitemaps_async')
+        self.rebuild = rebuild.start()
+        self.addCleanup(rebuild.stop)
+
+    def test_live_render_until_built(self):
+        response = self.client.get('/sitemap.xml')
+        self.assertNotIsInstance(response, FileResponse)
+        self.assertContains(response, 'sitemap-products-normal.xml')
+        self.rebuild.assert_called_once_with('http://testserver/')
+
+        build_sitemaps(settings.SITE_URL)
+        response = self.client.get('/sitemap.xml')
+        self.assertIsInstance(response, FileResponse)
+        self.assertIn(b'https://pmcell.test/sitemap-products-normal-1.xml.gz', b''.join(response.streaming_content))
+        self.assertEqual(self.rebuild.call_count, 1)
+
+    def test_catalog_change_makes_files_stale(self):
+        build_sitemaps(settings.SITE_URL)
+        self.assertIsInstance(self.client.get('/sitemap-products-normal-1.xml.gz'), FileResponse)
+
+        novo = ProdutoNormal.objects.create(
+            nome='Cabo Lightning', slug='cabo-lightning', descricao='Cabo', categoria=self.produto.categoria,
+            preco_atacado=Decimal('10'), preco_super_atacado=Decimal('8'),
+        )
+        response = self.client.get('/sitemap-products-normal-1.xml.gz')
+        self.assertNotIsInstance(response, FileResponse)
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        url = reverse('catalog:product_detail', kwargs={'product_id': novo.id, 'product_type': 'normal'})
+        self.assertIn(url.encode(), gzip.decompress(response.content))
+        self.rebuild.assert_called_once_with('http://testserver/')
+
+        build_sitemaps(settings.SITE_URL)
+        self.assertIsInstance(self.client.get('/sitemap.xml'), FileResponse)
+
+    def test_files_outlive_the_cache(self):
+        build_sitemaps(settings.SITE_URL)
+        # Another process (or the release build) has its own tag versions
+        cache.clear()
+        self.assertIsInstance(self.client.get('/sitemap.xml'), FileResponse)
+        # Edits that do not change the listed rows keep the files
+        invalidate_tags(CATALOG_TAG)
+        self.assertIsInstance(self.client.get('/sitemap-products-normal-1.xml.gz'), FileResponse)
+        self.rebuild.assert_not_called()
+
+    def test_unknown_section_or_page(self):
+        self.assertEqual(self.client.get('/sitemap-nada-1.xml.gz').status_code, 404)
+        self.assertEqual(self.client.get('/sitemap-products-normal-9.xml.gz').status_code, 404)
+
+    def test_rebuild_is_debounced(self):
+        self.rebuild.stop()
+        with mock.patch('catalog.sitemap_utils.threading.Thread') as thread:
+            self.assertTrue(rebuild_sitemaps_async('http://testserver/'))
+            self.assertFalse(rebuild_sitemaps_async('http://testserver/'))
+        thread.assert_called_once()
+        self.assertEqual(thread.call_args.kwargs['args'], ('https://pmcell.test',))
+        self.rebuild.start()
+
+
+def sequential_scans(queryset):
+    """
+    Tables the query plan reads in full (without an index)
+    """
+    plan = queryset.explain()
+    if connection.vendor == 'postgresql':
+        return re.findall(r'Seq Scan on (\w+)', plan)
+    # SQLite: "SCAN table" without "USING [COVERING] INDEX"
+    return re.findall(r'\bSCAN (\w+)$', plan, re.MULTILINE)
+
+
+class QueryPlanTests(TestCase):
+    """
+    Hot catalog queries must keep using an index on a large catalog
+    """
+    PRODUTOS = 3000
+
+    @classmethod
+    def setUpTestData(cls):
+        categorias = Categoria.objects.bulk_create([
+            Categoria(nome=f'Categoria {i}', slug=f'categoria-{i}') for i in range(10)
+        ])
+        cls.categoria = categorias[0]
+
+        ProdutoNormal.objects.bulk_create([
+            ProdutoNormal(
+                nome=f'Cabo {i:05d}', slug=f'cabo-{i}', descricao='Cabo', categoria=categorias[i % 10],
+                em_estoque=i % 10 != 0, preco_atacado=Decimal(i % 97 + 1), preco_super_atacado=Decimal(i % 97),
+            )
+            for i in range(cls.PRODUTOS)
+        ])
+        capas = ProdutoCapaPelicula.objects.bulk_create([
+            ProdutoCapaPelicula(
+                nome=f'Capa {i:05d}', slug=f'capa-{i}', descricao='Capa', categoria=categorias[i % 10],
+                em_estoque=i % 10 != 0,
+            )
+            for i in range(cls.PRODUTOS)
+        ])
+
+        marcas = MarcaCelular.objects.bulk_create([
+            MarcaCelular(nome=f'Marca {i}', slug=f'marca-{i}') for i in range(10)
+        ])
+        cls.marca = marcas[0]
+        modelos = ModeloCelular.objects.bulk_create([
+            ModeloCelular(marca=marcas[i % 10], nome=f'Modelo {i}', slug=f'modelo-{i}', ativo=i % 5 != 0)
+            for i in range(200)
+        ])
+        PrecoModelo.objects.bulk_create([
+            PrecoModelo(
+                produto=capa, modelo=modelos[(capa.id + offset) % 200],
+                preco_atacado=Decimal(10 + (capa.id + offset) % 90), preco_super_atacado=Decimal('8'),
+            )
+            # As in production, few capas are still waiting for prices
+            for capa in capas[:-200]
+            for offset in range(4)
+        ])
+        ProdutoCapaPelicula.objects.all().atualizar_range_precos()
+
+        ImagemProduto.objects.bulk_create([
+            ImagemProduto(produto_capa=capa, imagem='capa', ordem=ordem, principal=ordem == 0)
+            for capa in capas[:1000]
+            for ordem in range(3)
+        ])
+
+        agora = timezone.now()
+        Pedido.objects.bulk_create([
+            Pedido(codigo=f'PM{i:08d}', nome_cliente='Cliente', whatsapp='(11) 99999-9999')
+            for i in range(2000)
+        ])
+        CarrinhoAbandonado.objects.bulk_create([
+            CarrinhoAbandonado(
+                whatsapp=f'(11) 9{i:04d}-0000', dados_carrinho={}, tempo_abandono=agora, webhook_enviado=i % 2 == 0
+            )
+            for i in range(2000)
+        ])
+        JornadaCliente.objects.bulk_create([
+            JornadaCliente(sessao_id=f'sessao-{i % 500}', evento='produto_visualizado')
+            for i in range(5000)
+        ])
+        EventoWebhook.objects.bulk_create([
+            EventoWebhook(evento='pedido_finalizado', payload={}, status='enviado')
+            for i in range(2000)
+        ])
+
+        # Plans depend on table statistics, as in production
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def assertIndexed(self, queryset):
+        self.assertEqual(sequential_scans(queryset), [], queryset.explain())
+
+    def test_listing_by_name(self):
+        self.assertIndexed(ProdutoNormal.objects.filter(em_estoque=True).order_by('nome', 'id')[:20])
+        self.assertIndexed(ProdutoCapaPelicula.objects.filter(em_estoque=True).order_by('nome', 'id')[:20])
+
+    def test_listing_by_category(self):
+        self.assertIndexed(
+            ProdutoNormal.objects.filter(em_estoque=True, categoria=self.categoria).order_by('nome', 'id')[:20]
+        )
+        self.assertIndexed(
+            ProdutoCapaPelicula.objects.filter(em_estoque=True, categoria=self.categoria).order_by('nome', 'id')[:20]
+        )
+
+    def test_listing_by_price(self):
+        self.assertIndexed(ProdutoNormal.objects.filter(em_estoque=True).order_by('preco_atacado', 'id')[:20])
+
+    def test_listing_page_union(self):
+        # relevance needs a search query (see SearchBackendTests)
+        for sort_by in SORT_OPTIONS.keys() - {'relevance'}:
+            with self.subTest(sort_by=sort_by):
+                self.assertIndexed(ProductListing(sort_by=sort_by).queryset()[:21])
+
+    def test_active_prices_of_product(self):
+        self.assertIndexed(PrecoModelo.objects.filter(produto_id=1, ativo=True))
+
+    def test_active_models_of_brand(self):
+        self.assertIndexed(ModeloCelular.objects.filter(marca=self.marca, ativo=True).order_by('ordem', 'nome'))
+
+    def test_principal_images(self):
+        self.assertIndexed(ImagemProduto.objects.filter(produto_capa_id__in=[1, 2, 3], principal=True))
+
+    def test_admin_lists(self):
+        self.assertIndexed(Pedido.objects.order_by('-created_at')[:100])
+        self.assertIndexed(Pedido.objects.filter(status='aberto').order_by('-created_at')[:100])
+        self.assertIndexed(JornadaCliente.objects.order_by('-timestamp')[:100])
+        self.assertIndexed(JornadaCliente.objects.filter(evento='saida').order_by('-timestamp')[:100])
+
+    def test_open_abandoned_cart(self):
+        self.assertIndexed(CarrinhoAbandonado.objects.filter(whatsapp='(11) 90001-0000', webhook_enviado=False))
+
+    def test_webhook_queue(self):
+        self.assertIndexed(EventoWebhook.objects.filter(
+            status='pendente', proxima_tentativa__lte=timezone.now()
+        ).order_by('proxima_tentativa')[:20])
+
+
+class RenderQueryCountTests(TestCase):
+    """
+    Catalog pages render in a fixed number of queries, whatever the
+    catalog size (no per-card or per-image queries)
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        if not cloudinary.config().cloud_name:
+            cloudinary.config(cloud_name='pmcell-test')
+        cls.categoria = Categoria.objects.create(nome='Capas', slug='capas')
+        cls.marca = MarcaCelular.objects.create(nome='Samsung', slug='samsung')
+        cls.modelos = ModeloCelular.objects.bulk_create([
+            ModeloCelular(marca=cls.marca, nome=f'Galaxy {i}', slug=f'galaxy-{i}') for i in range(6)
+        ])
+        cls.add_products(2)
+        cls.normal = ProdutoNormal.objects.first()
+        cls.capa = ProdutoCapaPelicula.objects.first()
+
+    @classmethod
+    def add_products(cls, count, start=0):
+        # Names interleave both product types, so every listing page has both
+        normais = ProdutoNormal.objects.bulk_create([
+            ProdutoNormal(
+                nome=f'Produto {i:03d} cabo', slug=f'cabo-{i}', descricao='Cabo', categoria=cls.categoria,
+                preco_atacado=Decimal('10'), preco_super_atacado=Decimal('8'),
+            )
+            for i in range(start, start + count)
+        ])
+        capas = ProdutoCapaPelicula.objects.bulk_create([
+            ProdutoCapaPelicula(nome=f'Produto {i:03d} capa', slug=f'capa-{i}', descricao='Capa', categoria=cls.categoria)
+            for i in range(start, start + count)
+        ])
+        PrecoModelo.objects.bulk_create([
+            PrecoModelo(produto=capa, modelo=modelo, preco_atacado=Decimal('20'), preco_super_atacado=Decimal('15'))
+            for capa in capas
+            for modelo in cls.modelos[:2 + start % 4]
+        ])
+        ProdutoCapaPelicula.objects.filter(id__in=[capa.id for capa in capas]).atualizar_range_precos()
+        ImagemProduto.objects.bulk_create([
+            ImagemProduto(**{campo: produto}, imagem=f'produto-{produto.id}-{ordem}', ordem=ordem, principal=ordem == 0)
+            for campo, produtos in (('produto_normal', normais), ('produto_capa', capas))
+            for produto in produtos
+            for ordem in range(3)
+        ])
+
+    def render_queries(self, url, **headers):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, **headers)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def pages(self):
+        cursor = ProductListing().after()[1]
+        return {
+            'home': (reverse('catalog:home'), {}),
+            'home_htmx': (reverse('catalog:home'), {'HTTP_HX_REQUEST': 'true'}),
+            'load_more': (f"{reverse('catalog:load_more_products')}?cursor={cursor}", {}),
+            'detail_normal': (reverse('catalog:product_detail', args=[self.normal.id, 'normal']), {}),
+            'detail_capa': (reverse('catalog:product_detail', args=[self.capa.id, 'capa_pelicula']), {}),
+            'modelos': (reverse('catalog:get_modelos', args=[self.capa.id, self.marca.id]), {}),
+        }
+
+    def test_query_count_independent_of_catalog_size(self):
+        self.add_products(20, start=2)
+        small = {name: self.render_queries(url, **headers) for name, (url, headers) in self.pages().items()}
+
+        self.add_products(200, start=22)
+        for name, (url, headers) in self.pages().items():
+            with self.subTest(page=name):
+                self.assertEqual(self.render_queries(url, **headers), small[name])
+
+    def test_cards_show_principal_image_and_prices(self):
+        response = self.client.get(reverse('catalog:home'))
+        self.assertContains(response, f'produto-{self.normal.id}-0')
+        self.assertNotContains(response, f'produto-{self.normal.id}-1')
+        self.assertContains(response, 'R$ 20,00')
+
+    def test_detail_lists_every_image(self):
+        response = self.client.get(reverse('catalog:product_detail', args=[self.capa.id, 'capa_pelicula']))
+        for ordem in range(3):
+            self.assertContains(response, f'produto-{self.capa.id}-{ordem}')
+        self.assertContains(response, self.marca.nome)
+
+    def test_modelos_only_priced_and_active(self):
+        ModeloCelular.objects.filter(id=self.modelos[1].id).update(ativo=False)
+        response = self.client.get(reverse('catalog:get_modelos', args=[self.capa.id, self.marca.id]))
+        self.assertContains(response, self.modelos[0].nome)
+        self.assertNotContains(response, self.modelos[1].nome)
+        self.assertNotContains(response, self.modelos[2].nome)
+
+
+class EndpointBudgetTests(TestCase):
+    """
+    Query budgets and p50/p95 wall time of every catalog endpoint on a
+    synthetic catalog
+
+    PERF_PRODUTOS sets the catalog size (products of each type), PERF_RUNS
+    the timed requests per endpoint and PERF_REPORT a JSON report path.
+    Every request starts from an empty cache, so budgets and timings are
+    for the uncached path.
+    """
+    PRODUTOS = int(os.environ.get('PERF_PRODUTOS', 200))
+    RUNS = int(os.environ.get('PERF_RUNS', 5))
+    REPORT = os.environ.get('PERF_REPORT')
+
+    # Maximum queries per request; listing pages mixing both product types
+    # load products and images once per type
+    QUERY_BUDGETS = {
+        'home': 7,
+        'home_search': 7,
+        'home_htmx': 7,
+        'search_suggestions': 5,
+        'product_detail_normal': 2,
+        'product_detail_capa': 3,
+        'get_modelos_by_marca': 3,
+        'get_cart_items': 4,
+        'checkout': 8,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        if not cloudinary.config().cloud_name:
+            cloudinary.config(cloud_name='pmcell-test')
+        cls.catalogo = seed_catalog(produtos=cls.PRODUTOS)
+        cls.categoria = Categoria.objects.order_by('id').first()
+        cls.normal = ProdutoNormal.objects.order_by('id').first()
+        cls.capa = ProdutoCapaPelicula.objects.order_by('id').first()
+        cls.marca = MarcaCelular.objects.filter(modelocelular__precomodelo__produto=cls.capa).first()
+        cls.cart = [
+            {'productId': produto_id, 'productType': 'normal', 'quantity': 1 + index * 7}
+            for index, produto_id in enumerate(ProdutoNormal.objects.values_list('id', flat=True)[:20])
+        ] + [
+            {'productId': produto_id, 'productType': 'capa_pelicula', 'modelId': modelo_id, 'quantity': 12}
+            for produto_id, modelo_id in PrecoModelo.objects.values_list('produto_id', 'modelo_id')[:20]
+        ]
+
+    def endpoints(self):
+        """
+        (budget name, label, request kwargs) for every measured request
+        """
+        home = reverse('catalog:home')
+        requests = [('home', f'home?sort={sort}', {'path': f'{home}?sort={sort}'}) for sort in SORT_OPTIONS]
+        requests += [
+            ('home', 'home?category', {'path': f'{home}?category={self.categoria.slug}'}),
+            ('home', 'home?category&sort=price_desc', {
+                'path': f'{home}?category={self.categoria.slug}&sort=price_desc'
+            }),
+            ('home', 'home?page=2', {'path': f'{home}?page=2'}),
+            ('home_search', 'home?q', {'path': f'{home}?q=capa'}),
+            ('home_search', 'home?q&sort=relevance', {'path': f'{home}?q=pelicula&sort=relevance'}),
+            ('home_search', 'home?q&category&sort=price_asc', {
+                'path': f'{home}?q=perf&category={self.categoria.slug}&sort=price_asc'
+            }),
+            ('home_htmx', 'home [htmx]', {'path': home, 'HTTP_HX_REQUEST': 'true'}),
+            ('search_suggestions', 'search_suggestions', {
+                'path': f"{reverse('catalog:search_suggestions')}?q=cab"
+            }),
+            ('product_detail_normal', 'product_detail normal', {
+                'path': reverse('catalog:product_detail', args=[self.normal.id, 'normal'])
+            }),
+            ('product_detail_capa', 'product_detail capa_pelicula', {
+                'path': reverse('catalog:product_detail', args=[self.capa.id, 'capa_pelicula'])
+            }),
+            ('get_modelos_by_marca', 'get_modelos_by_marca', {
+                'path': reverse('catalog:get_modelos', args=[self.capa.id, self.marca.id])
+            }),
+            ('get_cart_items', 'get_cart_items', {
+                'method': 'post', 'path': reverse('catalog:get_cart_items'), 'data': {'cart': self.cart}
+            }),
+            ('checkout', 'checkout', {
+                'method': 'post', 'path': reverse('catalog:checkout'), 'data': {
+                    'nome_cliente': 'Cliente Teste', 'whatsapp': '(11) 99999-0000', 'cart_items': self.cart
+                }
+            }),
+        ]
+        return requests
+
+    def request(self, method='get', path='', data=None, **headers):
+        cache.clear()
+        if method == 'post':
+            return self.client.post(path, json.dumps(data), content_type='application/json', **headers)
+        return self.client.get(path, **headers)
+
+    def test_endpoint_budgets(self):
+        results = {}
+        for budget, label, kwargs in self.endpoints():
+            with self.subTest(endpoint=label):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.request(**kwargs)
+                # Read now: the next request resets the connection's query log
+                query_count = len(queries)
+                self.assertEqual(response.status_code, 200)
+                self.assertLessEqual(query_count, self.QUERY_BUDGETS[budget], '\n'.join(
+                    query['sql'] for query in queries.captured_queries
+                ))
+
+                timings = []
+                for _ in range(self.RUNS):
+                    start = time.perf_counter()
+                    self.request(**kwargs)
+                    timings.append((time.perf_counter() - start) * 1000)
+                results[label] = {
+                    'queries': query_count,
+                    'query_budget': self.QUERY_BUDGETS[budget],
+                    **timing_summary(timings),
+                }
+
+        if self.REPORT:
+            write_report(self.REPORT, results, catalog=self.catalogo)
+
+
+class RequestProfilingTests(TestCase):
+    """
+    Server-Timing of profiled requests
+    """
+
+    def setUp(self):
+        cache.clear()
+
+    @override_settings(PROFILING_ENABLED=True)
+    def test_webhook_enqueue_is_timed(self):
+        ConfiguracaoWebhook.objects.create(evento='liberacao_preco', url='http://127.0.0.1:9/liberacao')
+        response = self.client.post(
+            reverse('catalog:liberate_prices'), json.dumps({'whatsapp': '(11) 99999-9999'}),
+            content_type='application/json',
+        )
+        self.assertEqual(EventoWebhook.objects.count(), 1)
+        self.assertRegex(response['Server-Timing'], r'webhook;dur=[\d.]+;desc="1 queued"')
+
+        response = self.client.get(reverse('catalog:health_check'))
+        self.assertNotIn('webhook', response['Server-Timing'])
+
+
+class MetricsEndpointTests(TestCase):
+    """
+    /metrics needs the bearer token outside DEBUG
+    """
+
+    @override_settings(DEBUG=False, METRICS_TOKEN='')
+    def test_hidden_without_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+    @override_settings(DEBUG=True, METRICS_TOKEN='')
+    def test_open_in_debug(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'pmcell_http_requests_total')
+
+    @override_settings(DEBUG=False, METRICS_TOKEN='segredo')
+    def test_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer outro').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer segredo').status_code, 200)
+
+    @override_settings(METRICS_ENABLED=False, METRICS_TOKEN='segredo')
+    def test_disabled(self):
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer segredo').status_code, 404)
+
+    def test_disabled_records_nothing(self):
+        def samples():
+            return [
+                REGISTRY.get_sample_value('pmcell_cache_lookups_total', {'result': 'miss'}),
+                REGISTRY.get_sample_value('pmcell_journey_events_total', {'evento': 'pesquisa'}),
+                REGISTRY.get_sample_value(
+                    'pmcell_webhook_deliveries_total', {'evento': 'pedido_finalizado', 'status': 'enviado'}
+                ),
+            ]
+
+        def record():
+            cache.clear()
+            get_or_set_tagged('metricas', [CATALOG_TAG], lambda: 1, 60)
+            metrics_utils.count_journey_events([JornadaCliente(evento='pesquisa')])
+            metrics_utils.record_webhook_delivery('pedido_finalizado', 'enviado')
+
+        record()
+        before = samples()
+        with override_settings(METRICS_ENABLED=False):
+            record()
+        self.assertEqual(samples(), before)
+        record()
+        self.assertEqual(samples(), [value + 1 for value in before])
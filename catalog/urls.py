@@ -10,6 +10,7 @@ urlpatterns = [
     # Main pages
     path('', views.home, name='home'),
     path('search/', views.search, name='search'),
+    path('products/more/', views.load_more_products, name='load_more_products'),
     path('cart/', views.cart, name='cart'),
     path('checkout/', views.checkout, name='checkout'),
     path('checkout/success/', views.checkout_success, name='checkout_success'),
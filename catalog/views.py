@@ -1,22 +1,40 @@
 from django.shortcuts import render, get_object_or_404
-from django.http import JsonResponse, HttpResponse
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from django.http import JsonResponse, HttpResponse, QueryDict
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
-from django.db.models import Q, Min, Max
-from django.core.paginator import Paginator
 from django.contrib import messages
+from django.contrib.sitemaps import views as sitemap_views
+from django.http import Http404
+from django.conf import settings
+import gzip
+import hmac
 import json
 import re
 import uuid
 
 from .models import (
-    Categoria, ProdutoNormal, ProdutoCapaPelicula, 
-    MarcaCelular, ModeloCelular, PrecoModelo,
-    Pedido, ItemPedido, JornadaCliente, ConfiguracaoWebhook
+    ProdutoNormal, ProdutoCapaPelicula, MarcaCelular,
+    Pedido, JornadaCliente, ConfiguracaoWebhook
+)
+from .cache_utils import (
+    PAGE_CACHE_TAGS, catalog_page, catalog_version, get_cached_categories,
+    get_cached_search_suggestions, get_or_set_tagged, page_cache_key
+)
+from .listing_utils import ProductListing, InvalidCursor
+from .presentation_utils import load_modelo_options, load_product_detail
+from .cart_utils import price_cart, serialize_line
+from .order_utils import place_order, CheckoutError
+from .journey_utils import parse_journey_events, record_journey_events
+from .metrics_utils import render_metrics
+from .sitemaps import sitemaps
+from .sitemap_utils import (
+    SITEMAP_INDEX, rebuild_sitemaps_async, section_filename, sitemap_path, sitemap_file_response
 )
-from .cache_utils import get_cached_categories, get_cached_search_suggestions
 
 
+@catalog_page
 def home(request):
     """
     Homepage with product catalog
@@ -29,127 +47,67 @@ def home(request):
     category_filter = request.GET.get('category', 'all')
     sort_by = request.GET.get('sort', 'name')  # Default sort by name
     
-    # Base queryset for normal products (in stock only) - optimized
-    produtos_normais = ProdutoNormal.objects.filter(em_estoque=True).select_related(
-        'categoria'
-    ).prefetch_related('imagens')
-    
-    # Base queryset for capa/pelicula products (in stock only) - optimized  
-    produtos_capas = ProdutoCapaPelicula.objects.filter(em_estoque=True).select_related(
-        'categoria'
-    ).prefetch_related(
-        'imagens',
-        'precomodelo_set__modelo__marca'
+    # The product grid is the expensive part of the page and the same for
+    # every visitor, so it is rendered once per catalog version
+    grid = get_or_set_tagged(
+        page_cache_key(request, 'products_grid'),
+        PAGE_CACHE_TAGS,
+        lambda: _render_products_grid(request, search_query, category_filter, sort_by),
+        settings.CACHE_TIMEOUT_PAGES,
     )
     
-    # Apply search filter
-    if search_query:
-        # Search filter for normal products
-        search_filter_normal = (
-            Q(nome__icontains=search_query) |
-            Q(descricao__icontains=search_query) |
-            Q(categoria__nome__icontains=search_query) |
-            Q(fabricante__icontains=search_query)
-        )
-        produtos_normais = produtos_normais.filter(search_filter_normal)
-        
-        # Enhanced search filter for capa/película products (includes phone brands/models)
-        search_filter_capas = (
-            Q(nome__icontains=search_query) |
-            Q(descricao__icontains=search_query) |
-            Q(categoria__nome__icontains=search_query) |
-            Q(fabricante__icontains=search_query) |
-            Q(precomodelo__modelo__nome__icontains=search_query) |
-            Q(precomodelo__modelo__marca__nome__icontains=search_query)
-        )
-        produtos_capas = produtos_capas.filter(search_filter_capas).distinct()
-    
-    # Apply category filter
-    if category_filter != 'all':
-        produtos_normais = produtos_normais.filter(categoria__slug=category_filter)
-        produtos_capas = produtos_capas.filter(categoria__slug=category_filter)
-    
-    # Combine and order products
-    produtos = []
-    
-    # Add normal products
-    for produto in produtos_normais:
-        produtos.append({
-            'type': 'normal',
-            'object': produto,
-            'price_range': None,
-        })
-    
-    # Add capa/película products with price ranges (optimized)
-    for produto in produtos_capas:
-        # Use prefetched data instead of additional query
-        precos_models = produto.precomodelo_set.all()
-        if precos_models:
-            precos_atacado = [p.preco_atacado for p in precos_models]
-            precos_super = [p.preco_super_atacado for p in precos_models]
-            precos = {
-                'min_atacado': min(precos_atacado) if precos_atacado else 0,
-                'max_atacado': max(precos_atacado) if precos_atacado else 0,
-                'min_super': min(precos_super) if precos_super else 0,
-                'max_super': max(precos_super) if precos_super else 0,
-            }
-        else:
-            precos = {'min_atacado': 0, 'max_atacado': 0, 'min_super': 0, 'max_super': 0}
-        
-        price_range = {
-            'min_atacado': precos['min_atacado'] or 0,
-            'max_atacado': precos['max_atacado'] or 0,
-            'min_super': precos['min_super'] or 0,
-            'max_super': precos['max_super'] or 0,
-        }
-        
-        produtos.append({
-            'type': 'capa_pelicula',
-            'object': produto,
-            'price_range': price_range,
-        })
+    # Return partial template for HTMX requests
+    if request.headers.get('HX-Request'):
+        return HttpResponse(grid['html'])
     
-    # Apply sorting
-    if sort_by == 'name':
-        produtos.sort(key=lambda x: x['object'].nome)
-    elif sort_by == 'name_desc':
-        produtos.sort(key=lambda x: x['object'].nome, reverse=True)
-    elif sort_by == 'price_asc':
-        def get_min_price(item):
-            if item['type'] == 'normal':
-                return item['object'].preco_atacado
-            else:
-                return item['price_range']['min_atacado'] or 9999
-        produtos.sort(key=get_min_price)
-    elif sort_by == 'price_desc':
-        def get_min_price(item):
-            if item['type'] == 'normal':
-                return item['object'].preco_atacado
-            else:
-                return item['price_range']['min_atacado'] or 0
-        produtos.sort(key=get_min_price, reverse=True)
-    elif sort_by == 'category':
-        produtos.sort(key=lambda x: x['object'].categoria.nome)
+    context = {
+        'categories': categories,
+        'search_query': search_query,
+        'category_filter': category_filter,
+        'sort_by': sort_by,
+        'total_products': grid['total_products'],
+        'products_grid_html': mark_safe(grid['html']),
+    }
     
-    # Pagination
-    paginator = Paginator(produtos, 20)  # 20 products per page
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    return render(request, 'catalog/home.html', context)
+
+
+def _render_products_grid(request, search_query, category_filter, sort_by):
+    """
+    Rendered products grid and product count for the home page
+    """
+    # Filtering, sorting and pagination run in the database; only the
+    # products of the requested page are loaded
+    listing = ProductListing(search_query, category_filter, sort_by)
     
     context = {
-        'categories': categories,
-        'page_obj': page_obj,
         'search_query': search_query,
         'category_filter': category_filter,
         'sort_by': sort_by,
-        'total_products': paginator.count,
     }
     
-    # Return partial template for HTMX requests
-    if request.headers.get('HX-Request'):
-        return render(request, 'catalog/products_grid.html', context)
+    if settings.CATALOG_PAGINATION_MODE == 'cursor':
+        # Keyset pagination: first batch here, the rest via load_more_products
+        produtos, next_cursor = listing.after()
+        context.update({
+            'page_obj': produtos,
+            'next_cursor': next_cursor,
+            'load_more_query': _load_more_query(listing, next_cursor),
+            'total_products': listing.count(),
+        })
+    else:
+        paginator = listing.paginator()
+        page_number = request.GET.get('page')
+        page_obj = paginator.get_page(page_number)
+        context.update({
+            'page_obj': page_obj,
+            'total_products': paginator.count,
+        })
     
-    return render(request, 'catalog/home.html', context)
+    return {
+        'html': render_to_string('catalog/products_grid.html', context, request),
+        'total_products': context['total_products'],
+    }
 
 
 def search(request):
@@ -159,24 +117,76 @@ def search(request):
     return home(request)  # Reuse home logic
 
 
+@catalog_page
+def load_more_products(request):
+    """
+    HTMX infinite scroll endpoint: next batch of cards after a cursor
+    """
+    listing = ProductListing(
+        request.GET.get('q', '').strip(),
+        request.GET.get('category', 'all'),
+        request.GET.get('sort', 'name'),
+    )
+    
+    def render_cards():
+        produtos, next_cursor = listing.after(request.GET.get('cursor'))
+        context = {
+            'products': produtos,
+            'next_cursor': next_cursor,
+            'load_more_query': _load_more_query(listing, next_cursor),
+        }
+        return render_to_string('catalog/product_cards.html', context, request)
+    
+    try:
+        html = get_or_set_tagged(
+            page_cache_key(request, 'product_cards'),
+            PAGE_CACHE_TAGS,
+            render_cards,
+            settings.CACHE_TIMEOUT_PAGES,
+        )
+    except InvalidCursor:
+        return HttpResponse('Invalid cursor', status=400)
+    
+    return HttpResponse(html)
+
+
+def _load_more_query(listing, cursor):
+    """
+    Query string for the load-more request following the given cursor
+    """
+    if not cursor:
+        return ''
+    
+    query = QueryDict(mutable=True)
+    if listing.search_query:
+        query['q'] = listing.search_query
+    if listing.category_filter != 'all':
+        query['category'] = listing.category_filter
+    query['sort'] = listing.sort_by
+    query['cursor'] = cursor
+    return query.urlencode()
+
+
+@catalog_page
 def product_detail(request, product_id, product_type):
     """
     Product detail view for normal products
     """
     if product_type == 'normal':
-        product = get_object_or_404(ProdutoNormal, id=product_id, em_estoque=True)
+        product = load_product_detail(ProdutoNormal, product_id, product_type)
         template = 'catalog/product_detail_normal.html'
         context = {'product': product}
         
     elif product_type == 'capa_pelicula':
-        product = get_object_or_404(ProdutoCapaPelicula, id=product_id, em_estoque=True)
+        product = load_product_detail(ProdutoCapaPelicula, product_id, product_type)
         
-        # Get marcas and modelos for this product (optimized)
+        # Brands with an active price for this product; evaluated only when
+        # the cached block is rendered
         marcas = MarcaCelular.objects.filter(
-            modelocelular__precomodelo__produto=product
-        ).distinct().order_by('nome').prefetch_related(
-            'modelocelular_set__precomodelo_set'
-        )
+            modelocelular__precomodelo__produto_id=product_id,
+            modelocelular__precomodelo__ativo=True,
+            modelocelular__ativo=True,
+        ).distinct().order_by('nome')
         
         context = {
             'product': product,
@@ -186,6 +196,13 @@ def product_detail(request, product_id, product_type):
     else:
         return HttpResponse('Invalid product type', status=400)
     
+    if product is None:
+        raise Http404('Produto não encontrado')
+    
+    # The product content block is cached per catalog version
+    context['catalog_version'] = catalog_version(request)
+    context['page_cache_timeout'] = settings.CACHE_TIMEOUT_PAGES
+    
     return render(request, template, context)
 
 
@@ -193,21 +210,15 @@ def get_modelos_by_marca(request, product_id, marca_id):
     """
     HTMX endpoint to get models for a specific brand
     """
-    product = get_object_or_404(ProdutoCapaPelicula, id=product_id, em_estoque=True)
+    product = get_object_or_404(
+        ProdutoCapaPelicula.objects.only('id', 'quantidade_super_atacado'), id=product_id, em_estoque=True
+    )
     marca = get_object_or_404(MarcaCelular, id=marca_id)
     
-    # Get models for this brand that have prices for this product (optimized)
-    modelos = ModeloCelular.objects.filter(
-        marca=marca,
-        precomodelo__produto=product
-    ).select_related('marca').prefetch_related(
-        'precomodelo_set'
-    ).order_by('nome')
-    
     context = {
-        'product': product,
         'marca': marca,
-        'modelos': modelos,
+        'modelos': load_modelo_options(product.id, marca.id),
+        'quantidade_super_atacado': product.quantidade_super_atacado,
     }
     
     return render(request, 'catalog/modelos_list.html', context)
@@ -228,14 +239,11 @@ def checkout(request):
         try:
             # Handle JSON request from AJAX
             if request.content_type == 'application/json':
-                import uuid
-                from datetime import datetime
-                
                 data = json.loads(request.body)
                 nome_cliente = data.get('nome_cliente', '').strip()
                 whatsapp = data.get('whatsapp', '').strip()
                 cart_items = data.get('cart_items', [])
-                total = data.get('total', 0)
+                idempotency_key = request.headers.get('Idempotency-Key') or data.get('idempotency_key')
                 
                 # Validate required fields
                 if not whatsapp or not validate_whatsapp(whatsapp):
@@ -244,73 +252,33 @@ def checkout(request):
                 if not cart_items:
                     return JsonResponse({'success': False, 'error': 'Carrinho vazio'}, status=400)
                 
-                # Generate unique order code
-                order_code = f"PM{datetime.now().strftime('%Y%m%d')}{uuid.uuid4().hex[:6].upper()}"
-                
-                # Create order
-                pedido = Pedido.objects.create(
-                    codigo=order_code,
-                    nome_cliente=nome_cliente or 'Cliente não informado',
-                    whatsapp=whatsapp,
-                    valor_total=total,
-                    status='pendente'
-                )
-                
-                # Create order items
-                for item_data in cart_items:
-                    # Determine product based on type
-                    if item_data['productType'] == 'normal':
-                        try:
-                            produto = ProdutoNormal.objects.get(id=item_data['productId'])
-                            ItemPedido.objects.create(
-                                pedido=pedido,
-                                produto_normal=produto,
-                                quantidade=item_data['quantity'],
-                                preco_unitario=item_data['unitPrice'],
-                                preco_total=item_data['unitPrice'] * item_data['quantity']
-                            )
-                        except ProdutoNormal.DoesNotExist:
-                            continue
-                            
-                    elif item_data['productType'] == 'capa_pelicula' and item_data.get('modelId'):
-                        try:
-                            produto = ProdutoCapaPelicula.objects.get(id=item_data['productId'])
-                            modelo = ModeloCelular.objects.get(id=item_data['modelId'])
-                            ItemPedido.objects.create(
-                                pedido=pedido,
-                                produto_capa_pelicula=produto,
-                                modelo_celular=modelo,
-                                quantidade=item_data['quantity'],
-                                preco_unitario=item_data['unitPrice'],
-                                preco_total=item_data['unitPrice'] * item_data['quantity']
-                            )
-                        except (ProdutoCapaPelicula.DoesNotExist, ModeloCelular.DoesNotExist):
-                            continue
-                
-                # Create journey tracking
-                JornadaCliente.objects.create(
-                    whatsapp=whatsapp,
-                    evento='pedido_finalizado',
-                    dados_evento={
-                        'codigo_pedido': order_code,
-                        'valor_total': total,
-                        'items_count': len(cart_items),
-                        'nome_cliente': nome_cliente
-                    }
-                )
-                
-                # Send webhook
+                # Prices and total come from the catalog, never from the client
                 try:
-                    from .webhook_utils import send_order_completed_webhook
-                    send_order_completed_webhook(pedido)
-                except Exception as e:
-                    # Log webhook error but don't fail the request
-                    print(f"Webhook error: {e}")
+                    pedido, created = place_order(nome_cliente, whatsapp, cart_items, idempotency_key)
+                except CheckoutError as e:
+                    return JsonResponse({'success': False, 'error': str(e)}, status=400)
+                
+                # The order webhook is queued by place_order with the order itself
+                if created:
+                    # Create journey tracking
+                    # Without the client's session, each order still counts
+                    # as its own session in the funnel
+                    JornadaCliente.objects.create(
+                        whatsapp=whatsapp,
+                        sessao_id=str(data.get('sessao_id') or '')[:100] or f'pedido:{pedido.codigo}',
+                        evento='pedido_finalizado',
+                        dados_evento={
+                            'codigo_pedido': pedido.codigo,
+                            'valor_total': float(pedido.valor_total),
+                            'items_count': len(cart_items),
+                            'nome_cliente': nome_cliente
+                        }
+                    )
                 
                 return JsonResponse({
                     'success': True,
-                    'order_code': order_code,
-                    'redirect_url': f'/checkout/success/?order={order_code}'
+                    'order_code': pedido.codigo,
+                    'redirect_url': f'/checkout/success/?order={pedido.codigo}'
                 })
             
             # Handle traditional form submission (fallback)
@@ -372,15 +340,15 @@ def liberate_prices(request):
         # Create or update journey tracking
         JornadaCliente.objects.create(
             whatsapp=whatsapp,
-            sessao_id=request.session.session_key or str(uuid.uuid4()),
+            sessao_id=str(data.get('sessao_id') or '')[:100] or request.session.session_key or str(uuid.uuid4()),
             evento='liberacao_preco',
             dados_evento={'timestamp': data.get('timestamp')}
         )
         
-        # Send webhook
+        # Queue webhook (delivered by the process_webhooks worker)
         try:
-            from .webhook_utils import send_price_liberation_webhook
-            send_price_liberation_webhook(whatsapp, data.get('timestamp'))
+            from .webhook_utils import enqueue_price_liberation_webhook
+            enqueue_price_liberation_webhook(whatsapp, data.get('timestamp'))
         except Exception as e:
             # Log webhook error but don't fail the request
             print(f"Webhook error: {e}")
@@ -425,75 +393,13 @@ def get_cart_items(request):
         data = json.loads(request.body)
         cart_items = data.get('cart', [])
         
-        response_items = []
+        # Whole cart priced in bulk (constant number of queries)
+        priced_cart = price_cart(cart_items)
         
-        for item in cart_items:
-            product_id = item.get('productId')
-            product_type = item.get('productType')
-            model_id = item.get('modelId')
-            quantity = item.get('quantity', 1)
-            
-            if product_type == 'normal':
-                try:
-                    product = ProdutoNormal.objects.select_related('categoria').prefetch_related('imagens').get(id=product_id, em_estoque=True)
-                    
-                    # Calculate pricing based on quantity
-                    price_atacado = float(product.preco_atacado)
-                    price_super = float(product.preco_super_atacado)
-                    is_super_atacado = quantity >= product.quantidade_super_atacado
-                    unit_price = price_super if is_super_atacado else price_atacado
-                    
-                    response_items.append({
-                        'key': item.get('key'),
-                        'productId': product_id,
-                        'productType': product_type,
-                        'name': product.nome,
-                        'category': product.categoria.nome,
-                        'image': product.imagens.filter(principal=True).first().imagem.url if product.imagens.filter(principal=True).exists() else None,
-                        'quantity': quantity,
-                        'unitPrice': unit_price,
-                        'priceAtacado': price_atacado,
-                        'priceSuperAtacado': price_super,
-                        'isSuperAtacado': is_super_atacado,
-                        'minQuantitySuper': product.quantidade_super_atacado,
-                        'modelId': None,
-                        'modelName': None,
-                    })
-                except ProdutoNormal.DoesNotExist:
-                    continue
-                    
-            elif product_type == 'capa_pelicula' and model_id:
-                try:
-                    product = ProdutoCapaPelicula.objects.select_related('categoria').prefetch_related('imagens').get(id=product_id, em_estoque=True)
-                    modelo = ModeloCelular.objects.select_related('marca').get(id=model_id)
-                    preco_modelo = PrecoModelo.objects.select_related('produto', 'modelo__marca').get(produto=product, modelo=modelo)
-                    
-                    # Calculate pricing based on quantity
-                    price_atacado = float(preco_modelo.preco_atacado)
-                    price_super = float(preco_modelo.preco_super_atacado)
-                    is_super_atacado = quantity >= product.quantidade_super_atacado
-                    unit_price = price_super if is_super_atacado else price_atacado
-                    
-                    response_items.append({
-                        'key': item.get('key'),
-                        'productId': product_id,
-                        'productType': product_type,
-                        'name': product.nome,
-                        'category': product.categoria.nome,
-                        'image': product.imagens.filter(principal=True).first().imagem.url if product.imagens.filter(principal=True).exists() else None,
-                        'quantity': quantity,
-                        'unitPrice': unit_price,
-                        'priceAtacado': price_atacado,
-                        'priceSuperAtacado': price_super,
-                        'isSuperAtacado': is_super_atacado,
-                        'minQuantitySuper': product.quantidade_super_atacado,
-                        'modelId': model_id,
-                        'modelName': f"{modelo.marca.nome} {modelo.nome}",
-                    })
-                except (ProdutoCapaPelicula.DoesNotExist, ModeloCelular.DoesNotExist, PrecoModelo.DoesNotExist):
-                    continue
-        
-        return JsonResponse({'items': response_items})
+        return JsonResponse({
+            'items': [serialize_line(line) for line in priced_cart.lines],
+            'total': float(priced_cart.total),
+        })
         
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
@@ -503,33 +409,19 @@ def get_cart_items(request):
 @require_http_methods(["POST"])
 def track_journey(request):
     """
-    API endpoint to track customer journey events
+    API endpoint to track customer journey events; accepts one event or a
+    batch ({sessao_id, eventos: [...]}), also as a navigator.sendBeacon body
     """
     try:
         data = json.loads(request.body)
-        evento = data.get('evento')
-        dados_evento = data.get('dados', {})
-        sessao_id = data.get('sessao_id', '')
-        whatsapp = data.get('whatsapp', '')
         
-        # Get WhatsApp from cookie if not provided
-        if not whatsapp:
-            whatsapp = request.COOKIES.get('user_whatsapp', '')
-        
-        # Generate session ID if not provided
-        if not sessao_id:
-            import uuid
-            sessao_id = str(uuid.uuid4())
+        # WhatsApp falls back to the cookie, session ID is generated if missing
+        jornadas, sessao_id = parse_journey_events(data, request.COOKIES.get('user_whatsapp', ''))
         
-        # Create journey entry
-        JornadaCliente.objects.create(
-            whatsapp=whatsapp,
-            sessao_id=sessao_id,
-            evento=evento,
-            dados_evento=dados_evento
-        )
+        # Buffered and bulk inserted in the background
+        record_journey_events(jornadas)
         
-        return JsonResponse({'success': True, 'sessao_id': sessao_id})
+        return JsonResponse({'success': True, 'sessao_id': sessao_id, 'eventos': len(jornadas)})
         
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
@@ -587,10 +479,10 @@ def track_abandoned_cart(request):
             }
         )
         
-        # Send webhook
+        # Queue webhook (delivered by the process_webhooks worker)
         try:
-            from .webhook_utils import send_abandoned_cart_webhook
-            send_abandoned_cart_webhook(
+            from .webhook_utils import enqueue_abandoned_cart_webhook
+            enqueue_abandoned_cart_webhook(
                 whatsapp, 
                 cart_data, 
                 estimated_value, 
@@ -605,49 +497,11 @@ def track_abandoned_cart(request):
         return JsonResponse({'error': str(e)}, status=500)
 
 
-def _get_search_suggestions(query):
-    """
-    Internal function to get search suggestions (used by cache)
-    """
-    suggestions = []
-    
-    # Add category suggestions
-    categories = Categoria.objects.filter(
-        nome__icontains=query, 
-        ativo=True
-    ).values_list('nome', flat=True)[:3]
-    for cat in categories:
-        suggestions.append({'text': cat, 'type': 'categoria'})
-    
-    # Add phone brand suggestions for capas/películas
-    marcas = MarcaCelular.objects.filter(
-        nome__icontains=query
-    ).distinct().values_list('nome', flat=True)[:3]
-    for marca in marcas:
-        suggestions.append({'text': marca, 'type': 'marca'})
-    
-    # Add product name suggestions
-    produtos = list(ProdutoNormal.objects.filter(
-        nome__icontains=query,
-        em_estoque=True
-    ).values_list('nome', flat=True)[:2])
-    
-    produtos += list(ProdutoCapaPelicula.objects.filter(
-        nome__icontains=query,
-        em_estoque=True
-    ).values_list('nome', flat=True)[:2])
-    
-    for produto in produtos[:4]:
-        suggestions.append({'text': produto, 'type': 'produto'})
-    
-    return suggestions[:8]
-
-
 @csrf_exempt
 @require_http_methods(["GET"])
 def search_suggestions(request):
     """
-    API endpoint for search suggestions (cached)
+    API endpoint for search suggestions (in-memory index)
     """
     query = request.GET.get('q', '').strip()
     
@@ -690,3 +544,58 @@ def health_check(request):
         'timestamp': request.headers.get('x-request-timestamp', ''),
         'service': 'pmcell-catalog'
     })
+
+
+def sitemap_index(request):
+    """
+    Sitemap index: the pre-rendered file when it matches the current
+    catalog, otherwise rendered on request while the files are rebuilt
+    """
+    path = sitemap_path(SITEMAP_INDEX)
+    if path:
+        return sitemap_file_response(request, path, 'application/xml')
+    rebuild_sitemaps_async(request.build_absolute_uri('/'))
+    return sitemap_views.index(request, sitemaps, sitemap_url_name='sitemap_section')
+
+
+def sitemap_section(request, section):
+    """
+    One paged section (?p=N), rendered on request
+    """
+    return sitemap_views.sitemap(request, sitemaps, section=section)
+
+
+def sitemap_file(request, section, page):
+    """
+    Pre-rendered, gzipped child sitemap; rendered on request (and gzipped)
+    when the file is missing or older than the catalog
+    """
+    path = sitemap_path(section_filename(section, page))
+    if path:
+        return sitemap_file_response(request, path, 'application/gzip')
+    if section not in sitemaps:
+        raise Http404("Sitemap não encontrado")
+    
+    rebuild_sitemaps_async(request.build_absolute_uri('/'))
+    request.GET = request.GET.copy()
+    request.GET['p'] = str(page)
+    response = sitemap_views.sitemap(request, sitemaps, section=section)
+    response.render()
+    return HttpResponse(gzip.compress(response.content), content_type='application/gzip')
+
+
+@require_http_methods(["GET"])
+def metrics(request):
+    """
+    Prometheus scrape endpoint; the scraper sends METRICS_TOKEN as a
+    bearer token. Without a token it is only served in DEBUG, so a
+    deployment never exposes its metrics by accident.
+    """
+    if not settings.METRICS_ENABLED or not (settings.METRICS_TOKEN or settings.DEBUG):
+        raise Http404
+    if settings.METRICS_TOKEN:
+        supplied = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(supplied.encode(), f'Bearer {settings.METRICS_TOKEN}'.encode()):
+            return HttpResponse('Unauthorized', status=401)
+    body, content_type = render_metrics()
+    return HttpResponse(body, content_type=content_type)
@@ -1,137 +1,360 @@
-import json
+"""
+Webhook delivery
+
+Request handlers only enqueue events in the EventoWebhook outbox (in the
+same transaction as the data they describe, where there is one). The
+process_webhooks worker claims due events, delivers them concurrently
+(optionally batched per receiver) and reschedules failures with
+exponential backoff and jitter until they are sent or parked as dead
+letters ('descartado'). Chatty events can be coalesced per key before
+they are sent.
+"""
+
 import logging
+import random
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+
 import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
 from django.utils import timezone
-from datetime import timedelta
-from .models import ConfiguracaoWebhook
+
+from .cache_utils import WEBHOOK_TAG, get_tag_versions
+from .metrics_utils import record_webhook_delivery, time_webhook_delivery
+from .models import ConfiguracaoWebhook, EventoWebhook
+from .profiling_utils import timed_webhook
 
 logger = logging.getLogger(__name__)
 
 
-class WebhookSender:
+# Seconds a process keeps its copy of the configurations even when the tag
+# did not change: without a shared cache, an admin edit made in the web
+# process never bumps the worker's tag
+CONFIG_MAX_AGE = 60
+
+_configs = None
+_configs_version = None
+_configs_loaded_at = 0
+_configs_lock = threading.Lock()
+
+
+def _configs_are_current(version):
+    return (_configs is not None and _configs_version == version
+            and time.monotonic() - _configs_loaded_at < CONFIG_MAX_AGE)
+
+
+def get_webhook_configs():
+    """
+    Active webhook configurations by event, kept in process memory and
+    reloaded when the webhook cache tag is invalidated (see signals) or
+    after CONFIG_MAX_AGE seconds
+    """
+    global _configs, _configs_version, _configs_loaded_at
+    
+    version = get_tag_versions(WEBHOOK_TAG)[WEBHOOK_TAG]
+    
+    if not _configs_are_current(version):
+        with _configs_lock:
+            if not _configs_are_current(version):
+                _configs = {
+                    config.evento: config
+                    for config in ConfiguracaoWebhook.objects.filter(ativo=True).exclude(url='')
+                }
+                _configs_version = version
+                _configs_loaded_at = time.monotonic()
+    
+    return _configs
+
+
+def get_webhook_config(evento):
+    return get_webhook_configs().get(evento)
+
+
+class WebhookTransport:
     """
-    Utility class for sending webhooks with retry mechanism
+    Shared HTTP client for webhook deliveries.
+    
+    One requests.Session keeps keep-alive connections pooled per receiver
+    host, and a per-endpoint semaphore bounds how many deliveries to the
+    same URL are in flight at once, whatever the number of sender threads.
     """
     
+    def __init__(self, pool_size, max_in_flight):
+        self.max_in_flight = max_in_flight
+        self.session = requests.Session()
+        self.session.headers.update({
+            'Content-Type': 'application/json',
+            'User-Agent': 'PMCELL-Webhook/1.0'
+        })
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._semaphores = defaultdict(lambda: threading.BoundedSemaphore(self.max_in_flight))
+        self._lock = threading.Lock()
+    
+    def _semaphore(self, url):
+        with self._lock:
+            return self._semaphores[url]
+    
     @staticmethod
-    def send_webhook(evento, data, retry_count=0):
+    def build_payload(evento, data, retry_count=0, event_id=None):
+        payload = {
+            'evento': evento,
+            'timestamp': timezone.now().isoformat(),
+            'retry_count': retry_count,
+            **data
+        }
+        if event_id is not None:
+            # Lets receivers drop duplicates of a retried delivery
+            payload['event_id'] = event_id
+        return payload
+    
+    def post(self, webhook_config, body):
         """
-        Send webhook for a specific event
-        
-        Args:
-            evento (str): Event type (liberacao_preco, carrinho_abandonado, pedido_finalizado)
-            data (dict): Data to send in webhook
-            retry_count (int): Current retry attempt (0 = first attempt)
+        POST a JSON body to the configured URL
         
         Returns:
-            bool: True if successful, False if failed
+            str or None: error description, None when the receiver accepted it
         """
         try:
-            # Get webhook configuration for this event
-            webhook_config = ConfiguracaoWebhook.objects.filter(
-                evento=evento,
-                ativo=True
-            ).first()
-            
-            if not webhook_config or not webhook_config.url:
-                logger.info(f"No webhook configured for event: {evento}")
-                return True  # Not an error if no webhook is configured
-            
-            # Prepare webhook payload
-            payload = {
-                'evento': evento,
-                'timestamp': timezone.now().isoformat(),
-                'retry_count': retry_count,
-                **data
-            }
-            
-            # Send webhook request
-            response = requests.post(
-                webhook_config.url,
-                json=payload,
-                timeout=webhook_config.timeout,
-                headers={
-                    'Content-Type': 'application/json',
-                    'User-Agent': 'PMCELL-Webhook/1.0'
-                }
-            )
-            
-            # Check if request was successful
-            if response.status_code >= 200 and response.status_code < 300:
-                logger.info(f"Webhook sent successfully for event: {evento}")
-                return True
-            else:
-                logger.error(f"Webhook failed with status {response.status_code} for event: {evento}")
-                return False
-                
+            with self._semaphore(webhook_config.url), time_webhook_delivery(webhook_config.evento):
+                response = self.session.post(webhook_config.url, json=body, timeout=webhook_config.timeout)
+                # Read the body so the connection goes back to the pool
+                response.content
         except requests.exceptions.Timeout:
-            logger.error(f"Webhook timeout for event: {evento}")
-            return False
+            return 'Timeout'
         except requests.exceptions.RequestException as e:
-            logger.error(f"Webhook request error for event {evento}: {str(e)}")
-            return False
-        except Exception as e:
-            logger.error(f"Unexpected error sending webhook for event {evento}: {str(e)}")
-            return False
+            return f'Request error: {e}'
+        
+        if 200 <= response.status_code < 300:
+            return None
+        return f'HTTP {response.status_code}'
     
-    @staticmethod
-    def send_webhook_with_retry(evento, data):
+    def deliver(self, webhook_config, evento, data, retry_count=0, event_id=None):
         """
-        Send webhook with automatic retry mechanism
-        
-        Args:
-            evento (str): Event type
-            data (dict): Data to send
+        POST one webhook to the configured URL
         
         Returns:
-            bool: True if successful (either on first try or retry), False if all attempts failed
+            str or None: error description, None when the receiver accepted it
         """
-        # First attempt
-        success = WebhookSender.send_webhook(evento, data, retry_count=0)
-        
-        if success:
-            return True
-        
-        # Check if retry is enabled for this event
-        webhook_config = ConfiguracaoWebhook.objects.filter(
-            evento=evento,
-            ativo=True
+        return self.post(webhook_config, self.build_payload(evento, data, retry_count, event_id))
+    
+    def deliver_batch(self, webhook_config, events):
+        """
+        POST several EventoWebhook rows as one JSON array of payloads
+        """
+        return self.post(webhook_config, [
+            self.build_payload(event.evento, event.payload, event.tentativas, event.pk)
+            for event in events
+        ])
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def get_webhook_transport():
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = WebhookTransport(
+                    settings.WEBHOOK_POOL_SIZE, settings.WEBHOOK_MAX_IN_FLIGHT
+                )
+    return _transport
+
+
+@timed_webhook()
+def enqueue_webhook(evento, data, chave_agrupamento=None):
+    """
+    Store an event in the outbox for the worker to deliver (the time it
+    takes is what request profiling reports as webhook time).
+    
+    Events with a chave_agrupamento are debounced: while one with the same
+    key is still waiting, its payload is replaced by the latest data and
+    its delivery pushed back by WEBHOOK_COALESCE_WINDOW, up to
+    WEBHOOK_COALESCE_MAX_WAIT after it was first queued.
+    
+    Returns:
+        EventoWebhook or None: None when no active webhook is configured
+    """
+    if get_webhook_config(evento) is None:
+        logger.info(f"No webhook configured for event: {evento}")
+        return None
+    
+    if chave_agrupamento is None:
+        return EventoWebhook.objects.create(evento=evento, payload=data)
+    
+    now = timezone.now()
+    window = timedelta(seconds=settings.WEBHOOK_COALESCE_WINDOW)
+    max_wait = timedelta(seconds=settings.WEBHOOK_COALESCE_MAX_WAIT)
+    
+    for _ in range(2):
+        waiting = EventoWebhook.objects.filter(
+            chave_agrupamento=chave_agrupamento,
+            status='pendente',
+            tentativas=0
         ).first()
         
-        if not webhook_config or not webhook_config.retry_ativo:
-            logger.info(f"Retry disabled for event: {evento}")
-            return False
-        
-        # Wait a bit and retry
-        import time
-        time.sleep(5)  # Wait 5 seconds before retry
+        if waiting is not None:
+            proxima_tentativa = min(now + window, waiting.created_at + max_wait)
+            # Only merge while no worker has claimed it since the read;
+            # otherwise the new data would be lost with the old delivery
+            merged = EventoWebhook.objects.filter(
+                pk=waiting.pk,
+                status='pendente',
+                tentativas=0,
+                bloqueado_ate__isnull=True
+            ).update(payload=data, proxima_tentativa=proxima_tentativa)
+            if merged:
+                waiting.payload = data
+                waiting.proxima_tentativa = proxima_tentativa
+                return waiting
         
-        logger.info(f"Retrying webhook for event: {evento}")
-        success = WebhookSender.send_webhook(evento, data, retry_count=1)
+        try:
+            with transaction.atomic():
+                return EventoWebhook.objects.create(
+                    evento=evento,
+                    payload=data,
+                    chave_agrupamento=chave_agrupamento,
+                    proxima_tentativa=now + window
+                )
+        except IntegrityError:
+            # Another request queued the same key meanwhile; merge into it
+            continue
+    
+    return None
+
+
+def backoff_delay(tentativas):
+    """
+    Seconds until the next attempt: exponential in the number of attempts,
+    capped, with jitter so failed events don't retry in lockstep
+    """
+    delay = min(settings.WEBHOOK_BACKOFF_MAX, settings.WEBHOOK_BACKOFF_BASE * 2 ** (tentativas - 1))
+    return random.uniform(delay / 2, delay)
+
+
+def claim_webhook_events(limit):
+    """
+    Lease up to limit due events to this worker. Events whose lease expired
+    (worker killed mid-delivery) are claimed again.
+    """
+    now = timezone.now()
+    
+    with transaction.atomic():
+        # skip_locked lets several workers claim disjoint batches on PostgreSQL
+        ids = list(EventoWebhook.objects.select_for_update(skip_locked=True).filter(
+            Q(status='pendente', proxima_tentativa__lte=now) |
+            Q(status='processando', bloqueado_ate__lt=now)
+        ).order_by('proxima_tentativa').values_list('id', flat=True)[:limit])
         
-        if success:
-            logger.info(f"Webhook retry successful for event: {evento}")
+        EventoWebhook.objects.filter(id__in=ids).update(
+            status='processando',
+            bloqueado_ate=now + timedelta(seconds=settings.WEBHOOK_LEASE_SECONDS),
+        )
+    
+    return list(EventoWebhook.objects.filter(id__in=ids).order_by('proxima_tentativa'))
+
+
+def record_delivery(event, error, webhook_config):
+    """
+    Store the outcome of one delivery attempt
+    """
+    now = timezone.now()
+    event.tentativas += 1
+    event.bloqueado_ate = None
+    
+    if error is None:
+        event.status = 'enviado'
+        event.enviado_em = now
+        event.ultimo_erro = ''
+    elif (webhook_config is None or not webhook_config.retry_ativo or
+          event.tentativas >= settings.WEBHOOK_MAX_ATTEMPTS):
+        event.status = 'descartado'
+        event.ultimo_erro = error
+        logger.error(f"Webhook {event.evento} #{event.pk} discarded after {event.tentativas} attempts: {error}")
+    else:
+        event.status = 'pendente'
+        event.ultimo_erro = error
+        event.proxima_tentativa = now + timedelta(seconds=backoff_delay(event.tentativas))
+        logger.warning(f"Webhook {event.evento} #{event.pk} failed ({error}), retrying at {event.proxima_tentativa}")
+    
+    event.save(update_fields=['status', 'tentativas', 'bloqueado_ate', 'ultimo_erro', 'proxima_tentativa', 'enviado_em'])
+    record_webhook_delivery(event.evento, event.status)
+
+
+def process_webhook_batch(executor, limit):
+    """
+    Claim a batch of due events and deliver them concurrently on executor,
+    as JSON arrays for receivers configured with envio_em_lote. HTTP runs
+    on the executor threads; database writes stay on the caller's.
+    
+    Returns:
+        int: number of events processed
+    """
+    events = claim_webhook_events(limit)
+    if not events:
+        return 0
+    
+    configs = get_webhook_configs()
+    
+    # Delivery units: one event, or a chunk of events for receivers that
+    # take batches
+    units = []
+    by_evento = defaultdict(list)
+    for event in events:
+        by_evento[event.evento].append(event)
+    
+    transport = get_webhook_transport()
+    for evento, group in by_evento.items():
+        webhook_config = configs.get(evento)
+        if webhook_config is None:
+            for event in group:
+                record_delivery(event, 'No active webhook configured', None)
+        elif webhook_config.envio_em_lote:
+            size = max(1, webhook_config.tamanho_lote)
+            for start in range(0, len(group), size):
+                chunk = group[start:start + size]
+                units.append((chunk, transport.deliver_batch, (webhook_config, chunk)))
         else:
-            logger.error(f"Webhook retry failed for event: {evento}")
-        
-        return success
+            for event in group:
+                units.append(([event], transport.deliver, (
+                    webhook_config, event.evento, event.payload, event.tentativas, event.pk
+                )))
+    
+    futures = [(unit_events, executor.submit(func, *args)) for unit_events, func, args in units]
+    for unit_events, future in futures:
+        try:
+            error = future.result()
+        except Exception as e:
+            error = f'Unexpected error: {e}'
+        for event in unit_events:
+            record_delivery(event, error, configs[event.evento])
+    
+    return len(events)
 
 
-def send_price_liberation_webhook(whatsapp, timestamp=None):
+def enqueue_price_liberation_webhook(whatsapp, timestamp=None):
     """
-    Send webhook for price liberation event
+    Queue webhook for price liberation event
     """
     data = {
         'whatsapp': whatsapp,
         'liberation_timestamp': timestamp or timezone.now().isoformat(),
     }
     
-    return WebhookSender.send_webhook_with_retry('liberacao_preco', data)
+    return enqueue_webhook('liberacao_preco', data)
 
 
-def send_abandoned_cart_webhook(whatsapp, cart_data, estimated_value, abandonment_time=None):
+def enqueue_abandoned_cart_webhook(whatsapp, cart_data, estimated_value, abandonment_time=None):
     """
-    Send webhook for abandoned cart event
+    Queue webhook for abandoned cart event
     """
     data = {
         'whatsapp': whatsapp,
@@ -141,16 +364,23 @@ def send_abandoned_cart_webhook(whatsapp, cart_data, estimated_value, abandonmen
         'items_count': len(cart_data) if cart_data else 0,
     }
     
-    return WebhookSender.send_webhook_with_retry('carrinho_abandonado', data)
+    # Repeated reports for the same WhatsApp collapse into one delivery
+    # carrying the latest cart
+    return enqueue_webhook('carrinho_abandonado', data, chave_agrupamento=f'carrinho_abandonado:{whatsapp}')
 
 
-def send_order_completed_webhook(pedido):
+def enqueue_order_completed_webhook(pedido):
     """
-    Send webhook for completed order event
+    Queue webhook for completed order event
     """
+    if get_webhook_config('pedido_finalizado') is None:
+        return None
+    
     # Get order items
     items = []
-    for item in pedido.itens.all():
+    for item in pedido.itens.select_related(
+        'produto_normal', 'preco_modelo__produto', 'preco_modelo__modelo__marca'
+    ):
         if item.tipo == 'normal':
             items.append({
                 'type': 'normal',
@@ -185,4 +415,4 @@ def send_order_completed_webhook(pedido):
         }
     }
     
-    return WebhookSender.send_webhook_with_retry('pedido_finalizado', data)
\ No newline at end of file
+    return enqueue_webhook('pedido_finalizado', data)
\ No newline at end of file
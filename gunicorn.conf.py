@@ -0,0 +1,31 @@
+"""
+Gunicorn settings, loaded automatically from the working directory
+
+Prometheus metrics run in multiprocess mode: every worker writes its
+samples under PROMETHEUS_MULTIPROC_DIR and /metrics merges them. The
+directory is emptied when the master starts, so counters from a previous
+deploy are not carried over. With METRICS_ENABLED off nothing is
+recorded and no directory is set up.
+"""
+
+import os
+import shutil
+
+from decouple import config
+
+if config('METRICS_ENABLED', default=True, cast=bool):
+    os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/pmcell-prometheus')
+
+
+def on_starting(server):
+    path = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if path:
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    # Drop the dead worker's live gauges; its counters and histograms stay
+    multiprocess.mark_process_dead(worker.pid)
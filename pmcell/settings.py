@@ -51,8 +51,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'catalog.middleware.RequestMetricsMiddleware',
+    'catalog.middleware.RequestProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'catalog.middleware.APIPolicyMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -93,6 +96,8 @@ if DATABASE_URL:
     DATABASES = {
         'default': dj_database_url.config(default=DATABASE_URL)
     }
+    # Full-text search and trigram lookups used by catalog.search_utils
+    INSTALLED_APPS += ['django.contrib.postgres']
 else:
     # Development - SQLite
     DATABASES = {
@@ -214,21 +219,101 @@ REST_FRAMEWORK = {
 }
 
 # Cache configuration
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'pmcell-cache',
-        'TIMEOUT': 300,  # 5 minutes default timeout
-        'OPTIONS': {
-            'MAX_ENTRIES': 1000,
+# Redis is shared by every gunicorn worker; without REDIS_URL (local
+# development and tests) a per-process LocMemCache stands in for it
+REDIS_URL = config('REDIS_URL', default='')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'TIMEOUT': 300,  # 5 minutes default timeout
+            'KEY_PREFIX': 'pmcell',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'pmcell-cache',
+            'TIMEOUT': 300,  # 5 minutes default timeout
+            'OPTIONS': {
+                'MAX_ENTRIES': 1000,
+            }
         }
     }
-}
 
 # Cache timeouts (in seconds)
 CACHE_TIMEOUT_CATEGORIES = 3600  # 1 hour
 CACHE_TIMEOUT_PRODUCTS = 1800    # 30 minutes  
 CACHE_TIMEOUT_SEARCH = 300       # 5 minutes
+CACHE_TIMEOUT_PAGES = 600        # 10 minutes (rendered grids and product pages)
+
+# API rate limiting (catalog.middleware.APIPolicyMiddleware): 'sliding_window'
+# works with any cache; 'token_bucket' needs Redis. Limits are shared across
+# workers only with a shared cache (Redis); LocMem limits each worker apart
+RATE_LIMIT_ALGORITHM = config('RATE_LIMIT_ALGORITHM', default='sliding_window')
+RATE_LIMIT_WINDOW = config('RATE_LIMIT_WINDOW', default=60, cast=int)  # seconds
+# Reverse proxies in front of the app that append to X-Forwarded-For (1 on
+# Railway); 0 trusts only REMOTE_ADDR
+TRUSTED_PROXY_DEPTH = config('TRUSTED_PROXY_DEPTH', default=1, cast=int)
+
+# Request profiling (catalog.middleware.RequestProfilingMiddleware): adds
+# Server-Timing headers, logs one JSON line per request to catalog.profiling
+# and keeps the slowest requests of each worker for /admin/requisicoes-lentas/
+PROFILING_ENABLED = config('PROFILING_ENABLED', default=False, cast=bool)
+PROFILING_SLOW_REQUESTS = config('PROFILING_SLOW_REQUESTS', default=50, cast=int)
+if PROFILING_ENABLED:
+    LOGGING = {
+        'version': 1,
+        'disable_existing_loggers': False,
+        'handlers': {'console': {'class': 'logging.StreamHandler'}},
+        'loggers': {
+            'catalog.profiling': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+        },
+    }
+
+# Prometheus metrics scraped from /metrics (catalog.metrics_utils). Under
+# gunicorn, gunicorn.conf.py points PROMETHEUS_MULTIPROC_DIR at a shared
+# directory so every worker's samples are merged; METRICS_TOKEN is required
+# as "Authorization: Bearer <token>", and without one /metrics is only
+# served with DEBUG on. METRICS_ENABLED=False turns off every metric, not
+# only the HTTP ones
+METRICS_ENABLED = config('METRICS_ENABLED', default=True, cast=bool)
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+# Pre-rendered sitemaps (manage.py build_sitemaps, rebuilt by the web
+# process when the catalog changes); SITE_URL is the public origin written
+# into them (e.g. https://<app>.up.railway.app), the request's when unset
+SITEMAP_ROOT = config('SITEMAP_ROOT', default=str(BASE_DIR / 'sitemaps'))
+SITEMAP_CACHE_MAX_AGE = 3600  # 1 hour
+SITE_URL = config('SITE_URL', default='')
+
+# Journey tracking ingestion: events are bulk inserted once this many are
+# buffered or after the interval (0 writes every request through)
+JOURNEY_BUFFER_SIZE = config('JOURNEY_BUFFER_SIZE', default=200, cast=int)
+JOURNEY_FLUSH_INTERVAL = config('JOURNEY_FLUSH_INTERVAL', default=2.0, cast=float)  # seconds
+# Raw events older than this are rolled up into JornadaDiaria by prune_journey
+JOURNEY_RETENTION_DAYS = config('JOURNEY_RETENTION_DAYS', default=90, cast=int)
+
+# Webhook outbox worker (manage.py process_webhooks)
+WEBHOOK_MAX_ATTEMPTS = config('WEBHOOK_MAX_ATTEMPTS', default=8, cast=int)
+WEBHOOK_BACKOFF_BASE = config('WEBHOOK_BACKOFF_BASE', default=30, cast=int)    # seconds
+WEBHOOK_BACKOFF_MAX = config('WEBHOOK_BACKOFF_MAX', default=3600, cast=int)    # seconds
+WEBHOOK_LEASE_SECONDS = 300  # claimed events are retried after this if the worker dies
+WEBHOOK_POOL_SIZE = config('WEBHOOK_POOL_SIZE', default=10, cast=int)         # keep-alive connections per host
+WEBHOOK_MAX_IN_FLIGHT = config('WEBHOOK_MAX_IN_FLIGHT', default=8, cast=int)  # concurrent deliveries per endpoint
+# Debounce of coalesced events (abandoned carts): delivery waits for a quiet
+# window, but never longer than the max wait since the first report
+WEBHOOK_COALESCE_WINDOW = config('WEBHOOK_COALESCE_WINDOW', default=300, cast=int)      # seconds
+WEBHOOK_COALESCE_MAX_WAIT = config('WEBHOOK_COALESCE_MAX_WAIT', default=1800, cast=int)  # seconds
+
+# Catalog search backend (dotted path); empty picks one for the database vendor
+CATALOG_SEARCH_BACKEND = config('CATALOG_SEARCH_BACKEND', default='')
+
+# Catalog grid pagination: 'page' (numbered ?page=N) or 'cursor' (keyset + infinite scroll)
+CATALOG_PAGINATION_MODE = config('CATALOG_PAGINATION_MODE', default='page')
 
 # Security settings for production
 if not DEBUG:
@@ -18,9 +18,9 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
-from django.contrib.sitemaps.views import sitemap
 from django.http import HttpResponse
-from catalog.sitemaps import sitemaps
+from catalog import views as catalog_views
+from catalog.admin import slow_requests_view
 
 def robots_txt(request):
     content = """User-agent: *
@@ -30,9 +30,13 @@ Sitemap: {}/sitemap.xml""".format(request.build_absolute_uri('/'))
     return HttpResponse(content, content_type="text/plain")
 
 urlpatterns = [
+    path('admin/requisicoes-lentas/', admin.site.admin_view(slow_requests_view), name='slow_requests'),
     path('admin/', admin.site.urls),
-    path('sitemap.xml', sitemap, {'sitemaps': sitemaps}, name='django.contrib.sitemaps.views.sitemap'),
+    path('sitemap.xml', catalog_views.sitemap_index, name='sitemap'),
+    path('sitemap-<slug:section>.xml', catalog_views.sitemap_section, name='sitemap_section'),
+    path('sitemap-<slug:section>-<int:page>.xml.gz', catalog_views.sitemap_file, name='sitemap_file'),
     path('robots.txt', robots_txt, name='robots_txt'),
+    path('metrics', catalog_views.metrics, name='metrics'),
     path('', include('catalog.urls')),
 ]
 
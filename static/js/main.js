@@ -24,6 +24,8 @@ document.addEventListener('alpine:init', () => {
         searchesPerformed: [],
         productsViewed: [],
         abandonedCartTimer: null,
+        journeyQueue: [],
+        journeyFlushTimer: null,
 
         // Initialize app
         init() {
@@ -41,14 +43,15 @@ document.addEventListener('alpine:init', () => {
             document.addEventListener('visibilitychange', () => {
                 if (document.hidden) {
                     this.trackSiteExit();
+                    this.flushJourney(true);
                 } else {
                     this.updateTimeOnSite();
                 }
             });
 
-            // Track before unload
-            window.addEventListener('beforeunload', () => {
-                this.trackSiteExit();
+            // Send whatever is still queued when the page goes away
+            window.addEventListener('pagehide', () => {
+                this.flushJourney(true);
             });
 
             // Update time every 30 seconds
@@ -59,7 +62,10 @@ document.addEventListener('alpine:init', () => {
 
         // Initialize journey tracking
         initializeTracking() {
-            this.sessaoId = this.generateSessionId();
+            // Kept for the whole tab session, so checkout and price
+            // liberation are counted in the same funnel session
+            this.sessaoId = sessionStorage.getItem('pmcell_sessao_id') || this.generateSessionId();
+            sessionStorage.setItem('pmcell_sessao_id', this.sessaoId);
             this.trackEvent('entrada', {
                 url: window.location.href,
                 timestamp: new Date().toISOString()
@@ -190,6 +196,7 @@ document.addEventListener('alpine:init', () => {
                 body: JSON.stringify({
                     whatsapp: whatsappNumber,
                     timestamp: new Date().toISOString(),
+                    sessao_id: this.sessaoId,
                 })
             });
 
@@ -223,31 +230,56 @@ document.addEventListener('alpine:init', () => {
             this.timeOnSite = Math.floor((Date.now() - this.startTime) / 1000);
         },
 
-        async trackEvent(evento, dados = {}) {
-            try {
-                await fetch('/api/track-journey/', {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json',
-                        'X-CSRFToken': this.getCSRFToken(),
-                    },
-                    body: JSON.stringify({
-                        evento,
-                        dados: {
-                            ...dados,
-                            time_on_site: this.timeOnSite,
-                            categories_visited: Array.from(this.categoriesVisited),
-                            searches_performed: this.searchesPerformed.slice(-5), // Last 5 searches
-                            products_viewed: this.productsViewed.slice(-10) // Last 10 products
-                        },
-                        sessao_id: this.sessaoId,
-                    })
-                });
-            } catch (error) {
-                console.error('Error tracking event:', error);
+        // Journey events are queued and sent in batches
+        trackEvent(evento, dados = {}) {
+            this.journeyQueue.push({
+                evento,
+                dados: {
+                    ...dados,
+                    time_on_site: this.timeOnSite,
+                    categories_visited: Array.from(this.categoriesVisited),
+                    searches_performed: this.searchesPerformed.slice(-5), // Last 5 searches
+                    products_viewed: this.productsViewed.slice(-10), // Last 10 products
+                    client_timestamp: new Date().toISOString()
+                }
+            });
+
+            if (this.journeyQueue.length >= 10) {
+                this.flushJourney();
+            } else if (!this.journeyFlushTimer) {
+                this.journeyFlushTimer = setTimeout(() => this.flushJourney(), 3000);
             }
         },
 
+        flushJourney(pageHidden = false) {
+            clearTimeout(this.journeyFlushTimer);
+            this.journeyFlushTimer = null;
+            if (this.journeyQueue.length === 0) return;
+
+            const body = JSON.stringify({
+                sessao_id: this.sessaoId,
+                eventos: this.journeyQueue.splice(0)
+            });
+
+            // sendBeacon survives page unload and never blocks navigation
+            if (pageHidden && navigator.sendBeacon &&
+                navigator.sendBeacon('/api/track-journey/', new Blob([body], { type: 'application/json' }))) {
+                return;
+            }
+
+            fetch('/api/track-journey/', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    'X-CSRFToken': this.getCSRFToken(),
+                },
+                body,
+                keepalive: pageHidden
+            }).catch((error) => {
+                console.error('Error tracking event:', error);
+            });
+        },
+
         trackCategoryVisit(categorySlug, categoryName) {
             this.categoriesVisited.add(categorySlug);
             this.trackEvent('categoria_visitada', {